@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+"""Benchmark Crawler.run end to end against a fake ILIAS server.
+
+Every run crawls a generated course tree into a temporary folder with
+FileSaver, the first run cold and the following runs warm. Every run
+is executed in its own process, such that its peak RSS can be measured.
+"""
+
+from contextlib import redirect_stdout
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import types
+
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'slider'))
+from crawler import Crawler  # noqa: E402
+from fake_ilias import CourseTree, FakeIlias  # noqa: E402
+
+
+def make_secrets(server, path):
+    """Return a configuration for crawling all courses of server into path."""
+    return types.SimpleNamespace(
+        USER='student', PASSWORD=server.password,
+        COURSES=[course.title for course in server.tree.courses],
+        PATH=path, DROPBOX_TOKEN='', PATH_IN_DB='',
+        ILIAS_BASE=server.url, ILIAS_URL=server.login_url, SESSION_PATH=None)
+
+
+def crawl(secrets, options, verbose, results):
+    """Run the crawler and put its wall time, peak RSS and number of downloads into results."""
+    with open(os.devnull, 'w') as devnull, redirect_stdout(sys.stdout if verbose else devnull):
+        start = time.perf_counter()
+        crawler = Crawler(False, False, False, secrets=secrets, **options)
+        crawler.run()
+        wall = time.perf_counter() - start
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    results.put({'wall': wall, 'rss': rss, 'downloads': len(crawler.downloads)})
+
+
+def run_once(server, secrets, options, verbose=False):
+    """Crawl the server in a child process and return the measures of the run."""
+    results = multiprocessing.Queue()
+    requests, size = server.stats()
+    process = multiprocessing.Process(target=crawl, args=(secrets, options, verbose, results))
+    process.start()
+    result = results.get()
+    process.join()
+    after_requests, after_size = server.stats()
+    result['requests'] = after_requests - requests
+    result['bytes'] = after_size - size
+    return result
+
+
+def report(name, result):
+    """Print the measures of a run as a row."""
+    wall = result['wall']
+    print('{:<8} {:>8.2f} {:>9d} {:>8.1f} {:>9.2f} {:>8.2f} {:>9.1f} {:>9d}'.format(
+        name, wall, result['requests'], result['requests'] / wall, result['bytes'] / 1E6,
+        result['bytes'] / 1E6 / wall, result['rss'] / 1E6, result['downloads']))
+
+
+@click.command()
+@click.option('--courses', default=2, help='Number of courses.')
+@click.option('--depth', default=2, help='Depth of the folder tree of every course.')
+@click.option('--fanout', default=3, help='Number of subfolders of every folder.')
+@click.option('--files', default=4, help='Number of files in every folder.')
+@click.option('--size', default=256, help='Size of every file in KB.')
+@click.option('--warm', default=2, help='Number of warm runs after the cold run.')
+@click.option('--touch', default=0, help='Number of files changing before every warm run.')
+@click.option('-x', '--maxsize', default=5E7, help='Maximum size of a file to be downloaded.')
+@click.option('-w', '--workers', default=1, help='Number of workers fetching folder pages concurrently.')
+@click.option('-s', '--storage', default='tinydb', help='Storage backend of the download database.')
+@click.option('-i', '--incremental', is_flag=True, help='Skip folders whose listing did not change.')
+@click.option('--probers', default=0, help='Number of workers sending HEAD requests ahead.')
+@click.option('--fetchers', default=0, help='Number of workers downloading files ahead.')
+@click.option('--delay', default=0.0, help='Seconds before the fake server serves a file.')
+@click.option('-v', '--verbose', is_flag=True, help='Show the output of the crawler.')
+def bench(courses, depth, fanout, files, size, warm, touch, delay, verbose, **options):
+    """Print wall time, requests, bytes and peak RSS of a cold and warm runs."""
+    tree = CourseTree(courses, depth, fanout, files, size * 1024)
+    print('{} courses, {} folders, {} files of {} KB'.format(
+        courses, len(tree.items) - len(tree.files()), len(tree.files()), size))
+    print('{:<8} {:>8} {:>9} {:>8} {:>9} {:>8} {:>9} {:>9}'.format(
+        'run', 'wall s', 'requests', 'req/s', 'MB', 'MB/s', 'RSS MB', 'downloads'))
+
+    with tempfile.TemporaryDirectory() as path, FakeIlias(tree) as server:
+        server.delay = delay
+        secrets = make_secrets(server, path)
+        report('cold', run_once(server, secrets, options, verbose))
+        for run in range(warm):
+            tree.touch(touch)
+            report('warm {}'.format(run + 1), run_once(server, secrets, options, verbose))
+
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+"""Benchmark the startup time of the crawler against a budget.
+
+Measures the wall time of `crawler.py --help` and of a cold start in local
+mode, i.e. importing the crawler and creating a Crawler with FileSaver,
+each in a fresh interpreter, and lists the heavy modules a cold start
+imported. Exits with status 1 if the best run exceeds its budget, such
+that it can guard against import time regressions.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SLIDER = os.path.join(ROOT, 'slider')
+
+# modules a local cold start must not import, and those of the storage backends unless selected
+HEAVY = ('dropbox', 'bs4')
+STORAGE_MODULES = {'tinydb': 'tinydb.table', 'sqlite': '_sqlite3'}
+
+COLD_START = '''
+import sys, types
+from crawler import Crawler
+secrets = types.SimpleNamespace(USER='student', PASSWORD='secret', COURSES=[], PATH=sys.argv[1],
+                                DROPBOX_TOKEN='', PATH_IN_DB='', SESSION_PATH=None)
+Crawler(False, False, False, 5E7, storage=sys.argv[2], secrets=secrets)
+print(' '.join(name for name in sys.argv[3:] if name in sys.modules))
+'''
+
+
+def measure(args, runs):
+    """Run the command args in slider/ runs times, returns the best wall time and the last output."""
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run(args, cwd=SLIDER, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        wall = time.perf_counter() - start
+        best = wall if best is None else min(best, wall)
+    return best, output
+
+
+@click.command()
+@click.option('--runs', default=5, help='Number of runs, the best of which counts.')
+@click.option('--help-budget', default=0.3, help='Maximum seconds of crawler.py --help.')
+@click.option('--start-budget', default=0.4, help='Maximum seconds of a local cold start.')
+@click.option('-s', '--storage', default='sqlite', help='Storage backend of the cold start.')
+def bench(runs, help_budget, start_budget, storage):
+    """Print the startup times and whether they are within their budgets."""
+    exceeded = False
+    heavy = list(HEAVY) + [module for name, module in STORAGE_MODULES.items() if name != storage]
+    with tempfile.TemporaryDirectory() as path:
+        for name, args, budget in [
+                ('--help', [sys.executable, 'crawler.py', '--help'], help_budget),
+                ('cold start', [sys.executable, '-c', COLD_START, path, storage] + heavy, start_budget)]:
+            wall, output = measure(args, runs)
+            within = wall <= budget
+            exceeded |= not within
+            print('{:<12} {:>8.3f} s  budget {:>6.3f} s  {}'.format(name, wall, budget, 'ok' if within else 'EXCEEDED'))
+    imported = output.split()
+    if imported:
+        print('A local cold start imported ' + ', '.join(imported) + '.')
+    sys.exit(1 if exceeded or imported else 0)
+
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+"""Benchmark the parse throughput of the listing module against
+   the full BeautifulSoup tree the crawler built before."""
+
+from datetime import datetime
+import os
+import sys
+import timeit
+
+from bs4 import BeautifulSoup
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'slider'))
+import listing  # noqa: E402
+
+FOLDER_PAGE = os.path.join(ROOT, 'tests', 'fixtures', 'folder.html')
+
+
+def legacy_parse_listing(html_text):
+    """The extraction of crawl_course before the listing module was introduced,
+       tolerating relative dates such as Today, 10:30."""
+    soup_course = BeautifulSoup(html_text, 'html.parser')
+    containers = soup_course.find_all('div', {'class': 'il_ContainerListItem'})
+    if not containers:
+        return None
+
+    items = []
+    for container in containers:
+        file_ending = ''
+        last_update = ''
+        soup_line = container.find('a', {'class': 'il_ContainerItemTitle'})
+        if not soup_line:
+            continue
+        item_properties = container.find('div', {'class': 'ilListItemSection il_ItemProperties'})
+        if item_properties is not None:
+            item_prop = item_properties.find_all('span', {'class', 'il_ItemProperty'})
+            properties = [str(prop.string.strip()) for prop in item_prop if prop.string is not None]
+            if properties:
+                file_ending = properties[0]
+                last_update = properties[2]
+                try:
+                    last_update = datetime.strptime(last_update, '%d. %b %Y, %H:%M').strftime('%Y%m%d%H%M')
+                except ValueError:
+                    pass
+        items.append((soup_line.string, soup_line.get('href'), file_ending, last_update))
+    return items
+
+
+@click.command()
+@click.option('-n', '--number', default=200, help='Number of parsed pages per parser.')
+def bench(number):
+    """Print pages per second of the legacy and the listing parsers on the saved folder page."""
+    with open(FOLDER_PAGE, encoding='utf-8') as f:
+        html_text = f.read()
+
+    # both parsers have to agree on the items the crawler uses
+    expected = legacy_parse_listing(html_text)
+    actual = [(i.title, i.href, i.file_ending, i.last_update) for i in listing.parse_listing(html_text)]
+    assert actual == expected, 'listing parser does not conform to the legacy parser'
+
+    candidates = [('legacy BeautifulSoup tree', legacy_parse_listing),
+                  ('listing module', listing.parse_listing)]
+    baseline = None
+    for name, parse in candidates:
+        seconds = timeit.timeit(lambda: parse(html_text), number=number)
+        rate = number / seconds
+        baseline = baseline or rate
+        print('{:<26} {:>8.1f} pages/s {:>6.2f}x'.format(name, rate, rate / baseline))
+
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,313 @@
+"""A fake ILIAS and CAS server serving generated course trees."""
+
+from datetime import datetime, timedelta
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+LOGIN_TOKEN = 'LT-4711-fakeilias'
+FIRST_UPDATE = datetime(2019, 5, 22, 14, 15)
+AUTH_FAILED_MSG = 'Anmeldedaten wurden nicht akzeptiert'
+
+
+class Item:
+    """A folder or a file of a generated course tree. Files have a size,
+       a version which determines their content and a listed last update."""
+    def __init__(self, ref_id, title, size=0):
+        self.ref_id = ref_id
+        self.title = title
+        self.size = size
+        self.version = 0
+        self.listed = 0
+        self.children = []
+
+    @property
+    def is_file(self):
+        """Whether the item is a file."""
+        return self.size > 0
+
+    def content(self):
+        """Return the deterministic content of the current version."""
+        seed = hashlib.sha1('{}-{}'.format(self.ref_id, self.version).encode()).digest()
+        return (seed * (self.size // len(seed) + 1))[:self.size]
+
+    def etag(self):
+        """Return the entity tag of the current version."""
+        return '"{}-{}"'.format(self.ref_id, self.version)
+
+    def last_update(self):
+        """Return the listed last update."""
+        return FIRST_UPDATE + timedelta(days=self.listed)
+
+
+class CourseTree:
+    """Generate courses of nested folders with the given depth and fan-out,
+       every folder holding files of the given size."""
+    def __init__(self, courses=2, depth=2, fanout=2, files=3, size=64 * 1024):
+        self.items = {}
+        self.courses = [self.folder('Course {}'.format(c), depth, fanout, files, size) for c in range(courses)]
+
+    def add(self, title, size=0):
+        """Add a new item with the next ref_id."""
+        item = Item(len(self.items) + 1, title, size)
+        self.items[item.ref_id] = item
+        return item
+
+    def folder(self, title, depth, fanout, files, size):
+        """Generate a folder with its files and subfolders."""
+        folder = self.add(title)
+        for f in range(files):
+            folder.children.append(self.add('Slides {} {}'.format(folder.ref_id, f), size))
+        if depth > 0:
+            for f in range(fanout):
+                folder.children.append(self.folder('Folder {}'.format(f), depth - 1, fanout, files, size))
+        return folder
+
+    def files(self):
+        """Return all files of the tree."""
+        return [item for item in self.items.values() if item.is_file]
+
+    def touch(self, count):
+        """Publish a new version of the first count files."""
+        for item in self.files()[:count]:
+            item.version += 1
+            item.listed += 1
+
+    def relist(self, count):
+        """Change the listed last update of the first count files, but not their content."""
+        for item in self.files()[:count]:
+            item.listed += 1
+
+
+def container(item, base_url):
+    """Render an item the way ILIAS renders it in a folder listing."""
+    if item.is_file:
+        href = base_url + 'goto.php?target=file_{}_download&amp;client_id=ILIAS'.format(item.ref_id)
+        size = '{:.1f} KB'.format(item.size / 1024).replace('.', ',')
+        properties = ['pdf', size, item.last_update().strftime('%d. %b %Y, %H:%M')]
+        properties = ''.join('<span class="il_ItemProperty"> {} &nbsp;&nbsp;</span>'.format(p) for p in properties)
+        properties = '<div class="ilListItemSection il_ItemProperties">{}</div>'.format(properties)
+    else:
+        href = 'ilias.php?ref_id={}&amp;cmd=view'.format(item.ref_id)
+        properties = ''
+    return ('<div class="il_ContainerListItem"><div class="il_ContainerItemTitle">'
+            '<a class="il_ContainerItemTitle" href="{}">{}</a></div>{}</div>').format(href, item.title, properties)
+
+
+def page(body):
+    """Render an HTML page around body."""
+    return '<html><head><title>ILIAS</title></head><body>{}</body></html>'.format(body).encode('utf-8')
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serve the CAS login, the personal desktop, folder listings and file downloads."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        """Do not log requests."""
+        pass
+
+    def send(self, status, body=b'', headers=None, head=False, cut=None):
+        """Send a response, without its body for HEAD requests.
+           If cut is given, the connection is closed after cut bytes of the body."""
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.server.sending(1)
+        try:
+            self.end_headers()
+            if head:
+                body = b''
+            elif cut is not None:
+                body = body[:cut]
+                self.close_connection = True
+            self.wfile.write(body)
+            self.server.count(self.command, len(body))
+        finally:
+            self.server.sending(-1)
+
+    def do_HEAD(self):
+        """Answer a HEAD request like a GET request without body."""
+        self.do_GET(head=True)
+
+    def do_POST(self):
+        """Log in with the CAS form and answer with the personal desktop."""
+        length = int(self.headers.get('Content-Length', 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        if form.get('lt') != [LOGIN_TOKEN] or form.get('password') != [self.server.password]:
+            return self.send(200, page(AUTH_FAILED_MSG))
+        session = self.server.login()
+        self.send(200, self.desktop(), {'Set-Cookie': 'PHPSESSID={}; Path=/'.format(session)})
+
+    def desktop(self):
+        """Render the personal desktop with the links to the courses."""
+        courses = ''.join('<a class="il_ContainerItemTitle" href="ilias.php?ref_id={}&amp;cmd=view">{}</a>'.format(
+            course.ref_id, course.title) for course in self.server.tree.courses)
+        return page(courses)
+
+    def login_page(self):
+        """Render the CAS login form."""
+        return page('<input type="hidden" name="lt" value="{}"/>'.format(LOGIN_TOKEN))
+
+    def do_GET(self, head=False):
+        """Serve a GET request, counting it while it is answered."""
+        self.server.answering(1)
+        try:
+            self.answer(head)
+        finally:
+            self.server.answering(-1)
+
+    def answer(self, head=False):
+        """Serve the CAS login page, folder listings and files."""
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/cas/login':
+            return self.send(200, self.login_page(), {'Set-Cookie': 'JSESSIONID=fakecas; Path=/cas'}, head)
+        # the personal desktop within a session, the login page otherwise
+        if url.path == '/ilias.php' and 'ref_id' not in query:
+            session = self.server.session
+            if session is not None and 'PHPSESSID=' + session in self.headers.get('Cookie', ''):
+                return self.send(200, self.desktop(), head=head)
+            return self.send(200, self.login_page(), head=head)
+        if url.path == '/ilias.php' and 'ref_id' in query:
+            folder = self.server.tree.items.get(int(query['ref_id'][0]))
+            if folder is not None and not folder.is_file:
+                listing = ''.join(container(child, self.server.url) for child in folder.children)
+                return self.send(200, page(listing), {'Content-Type': 'text/html; charset=UTF-8'}, head)
+        if url.path == '/goto.php' and 'target' in query:
+            item = self.server.tree.items.get(int(query['target'][0].split('_')[1]))
+            if item is not None and item.is_file:
+                return self.send_file(item, head)
+        self.send(404, head=head)
+
+    def send_file(self, item, head):
+        """Serve a file, answering conditional and Range requests."""
+        time.sleep(self.server.delay)
+        if self.server.fail(item):
+            return self.send(502, head=head)
+        last_modified = formatdate(item.last_update().timestamp(), usegmt=True)
+        headers = {'Content-Type': 'application/pdf', 'ETag': item.etag(), 'Last-Modified': last_modified}
+        if self.headers.get('If-None-Match') == item.etag():
+            return self.send(304, headers=headers, head=True)
+        body = item.content()
+        cut = None if head else self.server.cut(item)
+        if not self.server.ranges:
+            return self.send(200, body, headers, head, cut)
+        headers['Accept-Ranges'] = 'bytes'
+
+        # a range of the current version only
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match is None or self.headers.get('If-Range', item.etag()) not in (item.etag(), last_modified):
+            return self.send(200, body, headers, head, cut)
+        start = int(match.group(1))
+        end = int(match.group(2)) + 1 if match.group(2) else len(body)
+        headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, end - 1, len(body))
+        self.send(206, body[start:end], headers, head, cut)
+
+
+class FakeIlias(ThreadingHTTPServer):
+    """A fake ILIAS server on a free local port, serving from a background thread.
+       It counts the requests by method and the bytes of the response bodies.
+       Range requests are answered unless ranges is False."""
+    daemon_threads = True
+
+    def __init__(self, tree, password='secret', ranges=True):
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.tree = tree
+        self.password = password
+        self.ranges = ranges
+        # bytes after which the next download of a file by ref_id breaks off
+        self.cuts = {}
+        # seconds before a file is served and failures of the next requests of a file by ref_id
+        self.delay = 0
+        self.failures = {}
+        # the id of the current session and the number of logins
+        self.session = None
+        self.logins = 0
+        # responses being sent, GET and HEAD requests being answered and their peak
+        self.responses = 0
+        self.answered = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.bytes = 0
+
+    @property
+    def url(self):
+        """The base URL of the fake ILIAS."""
+        return 'http://127.0.0.1:{}/'.format(self.server_address[1])
+
+    @property
+    def login_url(self):
+        """The URL of the fake CAS login."""
+        return self.url + 'cas/login?service=' + self.url + 'ilias.php'
+
+    def count(self, method, size):
+        """Count a request and the bytes of its response body."""
+        with self.lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+            self.bytes += size
+
+    def sending(self, change):
+        """Count a response that started or finished sending."""
+        with self.lock:
+            self.responses += change
+
+    def answering(self, change):
+        """Count a GET or HEAD request that started or finished being answered."""
+        with self.lock:
+            self.answered += change
+            self.peak = max(self.peak, self.answered)
+
+    def settle(self, timeout=5, quiet=0.05):
+        """Wait until all responses are sent and counted, e.g. those a client gave up on,
+           and no request arrived for quiet seconds, e.g. one still in the socket buffer."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            stats = self.stats()
+            time.sleep(quiet)
+            if not self.responses and self.stats() == stats:
+                return
+
+    def login(self):
+        """Start a new session and return its id."""
+        with self.lock:
+            self.logins += 1
+            self.session = 'fakeilias{}'.format(self.logins)
+            return self.session
+
+    def expire(self):
+        """End the current session."""
+        with self.lock:
+            self.session = None
+
+    def fail(self, item):
+        """Return whether a request of item fails with 502 - Bad Gateway."""
+        with self.lock:
+            if not self.failures.get(item.ref_id):
+                return False
+            self.failures[item.ref_id] -= 1
+            return True
+
+    def cut(self, item):
+        """Return the bytes after which the download of item breaks off or None."""
+        with self.lock:
+            return self.cuts.pop(item.ref_id, None)
+
+    def stats(self):
+        """Return the total number of requests and bytes."""
+        with self.lock:
+            return sum(self.requests.values()), self.bytes
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,153 @@
+"""Batch module for crawling with several accounts in one process.
+
+Every account keeps its own configuration, session, destination and
+database in its own working directory, like a crawler run from there.
+Accounts share what they would fetch alike: a listing page is fetched and
+a file is downloaded once per cycle, by the first account that crawls it,
+and handed to every other account that crawls it too.
+"""
+
+from contextlib import contextmanager
+import os
+import shutil
+import tempfile
+import threading
+
+from request import CHUNK
+import util
+
+
+@contextmanager
+def working_directory(path):
+    """Change into the directory path for the enclosed block."""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+class SharedCache:
+    """The listings, probes and downloads of a cycle by URL, shared by the crawlers of a batch.
+
+    The downloaded files are kept by content hash in folder, such that
+    a content is kept once even if it is linked by several URLs.
+    """
+    def __init__(self, folder):
+        self.folder = util.bpath(folder)
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Forget the results of the last cycle."""
+        self.listings = {}
+        self.probes = {}
+        self.files = {}
+        for name in os.listdir(self.folder):
+            os.remove(self.folder + name)
+        # results taken from the cache instead of being requested again
+        self.shared_listings = 0
+        self.shared_probes = 0
+        self.shared_files = 0
+        self.shared_bytes = 0
+
+    def listing(self, url, fetch):
+        """Return the parsed listing of url, fetched with fetch unless another crawler did."""
+        with self.lock:
+            if url in self.listings:
+                self.shared_listings += 1
+                return self.listings[url]
+        items = fetch(url)
+        with self.lock:
+            self.listings[url] = items
+        return items
+
+    def head(self, url, probe):
+        """Return the response to a HEAD request of url, sent with probe unless another crawler did."""
+        with self.lock:
+            if url in self.probes:
+                self.shared_probes += 1
+                return self.probes[url]
+        response = probe(url)
+        with self.lock:
+            self.probes[url] = response
+        return response
+
+    def download(self, url, target, download, etag=None, modified=None, size=None):
+        """Download the file at url into target like Downloader.download, with download
+           unless another crawler did. The validators etag and modified are checked
+           against the shared response, the hash is None if they match."""
+        with self.lock:
+            entry = self.files.get(url)
+        if entry is None:
+            content_hash, headers = download(url, target, etag, modified, size)
+            if content_hash is not None:
+                self.keep(url, target, content_hash, headers)
+            return content_hash, headers
+
+        content_hash, headers = entry
+        with self.lock:
+            self.shared_files += 1
+        # the crawler has the shared content already, like after 304 - Not Modified
+        if etag and etag == headers.get('ETag') or not etag and modified and modified == headers.get('Last-Modified'):
+            return None, headers
+        with open(self.folder + content_hash, 'rb') as f:
+            shutil.copyfileobj(f, target, CHUNK)
+        target.flush()
+        with self.lock:
+            self.shared_bytes += target.tell()
+        target.seek(0)
+        return content_hash, headers
+
+    def keep(self, url, source, content_hash, headers):
+        """Keep the content downloaded into the file object source for the other crawlers."""
+        path = self.folder + content_hash
+        if not os.path.exists(path):
+            source.seek(0)
+            with open(path + '.tmp', 'wb') as f:
+                shutil.copyfileobj(source, f, CHUNK)
+            os.replace(path + '.tmp', path)
+            source.seek(0)
+        with self.lock:
+            self.files[url] = (content_hash, headers)
+
+
+class Batch:
+    """Crawl with the accounts configured in folders, one crawler each.
+
+    make_crawler is called with the name of the folder of an account,
+    within the folder, and returns the crawler of the account.
+    """
+    def __init__(self, folders, make_crawler):
+        self.folders = [os.path.abspath(folder) for folder in folders]
+        self.staging = tempfile.mkdtemp(prefix='slider-batch-')
+        self.shared = SharedCache(self.staging)
+        self.crawlers = []
+        for folder in self.folders:
+            with working_directory(folder):
+                crawler = make_crawler(os.path.basename(folder))
+            crawler.shared = self.shared
+            self.crawlers.append(crawler)
+
+    def run(self):
+        """Crawl with every account once and close their databases."""
+        try:
+            self.cycle()
+            for folder, crawler in zip(self.folders, self.crawlers):
+                with working_directory(folder):
+                    crawler.database.close(crawler.file_handler, crawler.dropbox)
+        finally:
+            shutil.rmtree(self.staging, ignore_errors=True)
+
+    def cycle(self):
+        """Crawl with every account, sharing the listings and downloads of this cycle."""
+        self.shared.clear()
+        for folder, crawler in zip(self.folders, self.crawlers):
+            print('Crawling for account {}.'.format(os.path.basename(folder)))
+            with working_directory(folder):
+                crawler.cycle()
+
+        shared = self.shared
+        print('Accounts shared {} listings, {} probes and {} downloads of {}.'.format(
+            shared.shared_listings, shared.shared_probes, shared.shared_files, util.format_size(shared.shared_bytes)))
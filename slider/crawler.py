@@ -1,273 +1,945 @@
-#!/usr/bin/python3
-"""Main module for crawling the content."""
-
-from datetime import datetime
-import hashlib
-import mimetypes
-import os
-import re
-import sys
-
-from bs4 import BeautifulSoup
-from requests.exceptions import ConnectionError
-import click
-
-from database import Database
-from request import RequestHandler
-from save_file import FileSaver
-from save_drop import DropboxSaver
-from util import Colors as clr
-import util
-
-SECRETS_FILE = 'app_secrets.py'
-CHLOG_FOLDER = '.changelog/'
-
-try:
-    import app_secrets as secrets
-except ImportError:
-    if not os.path.exists(SECRETS_FILE):
-        util.create_secrets(SECRETS_FILE)
-    else:
-        print(SECRETS_FILE + ' file is malformed or missing.')
-        print('Please start again from the <repo>/slider/ dir.')
-        os.remove(SECRETS_FILE)
-        sys.exit(1)
-
-
-class Crawler:
-    """A crawler for downloading university e-learning content."""
-    def __init__(self, dropbox, logall, mail, maxsize):
-        self.dropbox = dropbox
-        self.logall = logall
-        self.sendmail = mail
-        self.maxsize = maxsize
-
-        if self.dropbox:
-            assert secrets.PATH_IN_DB != ''
-            self.save_path = secrets.PATH_IN_DB
-            self.file_handler = DropboxSaver(self.save_path, secrets.DROPBOX_TOKEN)
-        else:
-            assert secrets.PATH != ''
-            self.save_path = secrets.PATH
-            self.file_handler = FileSaver(self.save_path)
-
-        self.req = RequestHandler(secrets.USER, secrets.PASSWORD)
-        self.file_handler.create_folder(CHLOG_FOLDER)
-        self.database = Database(self.file_handler, self.dropbox)
-
-        self.courses = secrets.COURSES
-        self.removed_label_flag = False
-        self.downloads = []
-        self.changelog = []
-
-    def __str__(self):
-        if not self.downloads:
-            return 'Files were already up to date.'
-        else:
-            s = 's' if len(self.downloads) != 1 else ''
-            d = 'DROPBOX/' if self.dropbox else ''
-            p = d + self.save_path
-            restr = '{} new file{} downloaded from ILIAS to {}.'.format(str(len(self.downloads)), s, p)
-            return restr
-
-    def run(self):
-        """Main entry point.
-
-        Authenticate the client, crawl the courses, persist the results,
-        write a changelog and optionally send a mail with the results.
-        """
-        # authentication
-        try:
-            response = self.req.login()
-            html_text = response.text
-        except ConnectionError as err:
-            print(err, 'A ConnectionError occurred. Please check your internet connection.', sep='\n')
-            sys.exit(1)
-
-        # check whether authentication worked; has to be done this way
-        # since HTTP response on failed authentication is 200 - OK.
-        auth_failed_msg = 'Anmeldedaten wurden nicht akzeptiert'
-        if auth_failed_msg in html_text:
-            print('Authorization failed. Please maintain user and password correctly.')
-            sys.exit(1)
-
-        # crawl courses
-        self.crawl(html_text)
-
-        # wrap up: close database, write changelog and send mail
-        self.database.close(self.file_handler, self.dropbox)
-        self.write_changelog()
-        if self.sendmail and self.downloads:
-            self.req.send_mail(self, self.downloads)
-
-        # print download stats
-        clrone = clr.BOLD
-        clrtwo = clr.GREEN if self.downloads else clr.ENDC
-        clrend = clr.ENDC
-        print(clrone, clrtwo, self, clrend, sep='')
-
-    def crawl(self, html_text):
-        """Loop through top level courses and crawl the content for every course."""
-        soup_courses = BeautifulSoup(html_text, 'html.parser')
-
-        for soup_course in soup_courses.findAll('a', {'class': 'il_ContainerItemTitle'}):
-            scs = soup_course.string
-            course_name = util.course_contains(scs, self.courses)
-            relative_link = soup_course.get('href')
-            course_url = 'https://ilias.uni-mannheim.de/' + relative_link
-
-            if course_name is not None:
-                self.crawl_course(course_url, course_name + '/')
-            else:
-                print(clr.BOLD, 'No download requested for course >> ', clr.ENDC, scs.lstrip(), sep='')
-
-    def crawl_course(self, course_url, folder_path):
-        """Recursively call this method until there is something to download
-           for this course in the respective path."""
-        html_text_course = self.req.session.get(course_url).text
-        soup_course = BeautifulSoup(html_text_course, 'html.parser')
-        containers = soup_course.find_all('div', {'class': 'il_ContainerListItem'})
-
-        if containers:
-            if not self.removed_label_flag:
-                util.print_method('folder_path', folder_path)
-
-            for container in containers:
-                file_ending = ''
-                soup_line = container.find('a', {'class': 'il_ContainerItemTitle'})
-                if soup_line:
-                    link = soup_line.get('href')
-                else:
-                    continue
-                item_properties = container.find('div', {'class': 'ilListItemSection il_ItemProperties'})
-                if item_properties is not None:
-                    item_prop = item_properties.find_all('span', {'class', 'il_ItemProperty'})
-                    properties = [str(prop.string.strip()) for prop in item_prop if prop.string is not None]
-                    if properties:
-                        file_ending = properties[0]
-                        last_update = properties[2]
-                        # 22. May 2019, 14:15 ->2019-05-22 14:15:00
-                        d = datetime.strptime(last_update, '%d. %b %Y, %H:%M')
-                        # 201905221415
-                        last_update = d.strftime('%Y%m%d%H%M')
-
-                if 'download' in link:
-                    self.file_handler.create_folder(folder_path)
-                    self.check_save(folder_path, soup_line.string, file_ending, last_update, link)
-                else:
-                    parsed = util.remove_edge_characters(soup_line.string)
-                    if not parsed:
-                        self.removed_label_flag = True
-                    self.crawl_course('https://ilias.uni-mannheim.de/' + link, folder_path + parsed)
-        else:
-            util.print_method('no_files_in', str(folder_path))
-
-    def check_save(self, folder_path, filename, file_ending, last_update, url):
-        """Prepare the file to be saved. Remove edge characters,
-           trim and add the correct file ending."""
-        # remove edge characters and trim
-        filename = re.sub(r'[&]', 'and', filename)
-        filename = re.sub(r'[!@#$/\:;*?<>|]', '', filename).strip()
-
-        http = self.req.session.head(url, headers={'Accept-Encoding': 'identity'})
-        file_size = http.headers['content-length']
-        if not file_ending:
-            file_ending = str(mimetypes.guess_extension(http.headers['content-type']))
-
-        relative_file = folder_path + filename
-        relative_path = relative_file + '.' + file_ending
-
-        # for printing what is done with that file
-        clrone = clr.ENDC
-        clrtwo = clr.ENDC
-        method = ''
-        messag = relative_path
-
-        # query db for path and update
-        res_pu = self.database.get_name_update(relative_path, last_update)
-
-        # example file sizes 2E8: 200.000.000 Bytes; 5E7: 30 MB
-        if float(file_size) >= self.maxsize:  # Skip
-            clrone = clr.BLUE
-            method = 'file_skiped'
-        # if db contains entry with path and update, file was already downloaded
-        elif res_pu:  # exists
-            method = 'loaded_once'
-        else:
-            # download file to compute hash
-            content = self.req.session.get(url).content
-            # compute content hash
-            content_hash = hashlib.sha1(content).hexdigest()
-
-            # query db for hash
-            res_h = self.database.get_hash(content_hash)
-            # filename or last update may have changed but hash exists
-            # thus file is known and was already downloaded
-            if res_h:  # exists
-                method = 'loaded_once'
-            else:
-                # query db for name
-                res_p = self.database.get_name(relative_path)
-                # if this name already exists in the database
-                # must be an update because otherwise the name + last_update
-                # or the hash should have been in the db already
-                if res_p:
-                    method = 'file_update'
-                    clrone = clr.GREEN
-                    relative_path = '{}_UP{}.{}'.format(relative_file, content_hash[:4], file_ending)
-                    messag = relative_path
-                # not an update: new file
-                else:
-                    # check if this filename exists already at the destination path
-                    # should not happen unless user renamed file to exactly this downloaded file name
-                    # check also only exists to inform user that file is not just overwritten
-                    # but safely moved to the .overwritten/ folder
-                    exists = self.file_handler.exists(relative_path)
-                    if not exists:
-                        method = 'downloading'
-                        clrone = clr.BOLD
-                    else:
-                        method = 'safe_overwr'
-                        clrone = clr.RED
-                    messag = relative_path + ' from ' + url
-                saved = self.file_handler.save_file(relative_path, content)
-                if saved:
-                    self.database.insert(relative_path, content_hash, last_update)
-                    self.downloads.append(method + ': ' + relative_path)
-
-        if method != ('file_skiped' and 'loaded_once') or self.logall:
-            self.changelog.append(str(method + ': ' + messag))
-
-        util.print_method(method, messag, clrone, clrtwo)
-
-    def write_changelog(self):
-        """Write a changelog to /chosen_dir/.changelog/changelog_{datetime}."""
-        if not self.changelog:
-            return
-        d = datetime.today().strftime('%Y-%m-%d_%H-%M-%S')
-        tmp = '# Changelog from {}\n'.format(d)
-        tmp += str(len(tmp) * '-') + '\n'
-        tmp += '\n'.join(self.changelog) + '\n'
-        b = tmp.encode('utf-8')
-        self.file_handler.save_file(CHLOG_FOLDER + 'changelog_{}.txt'.format(d), b, True)
-
-
-@click.command()
-@click.option('-d', '--dropbox', is_flag=True, help='Upload files using Dropbox API (requires access token).')
-@click.option('-l', '--logall', is_flag=True, help='Log everything to the changelog, not just downloads.')
-@click.option('-m', '--mail', is_flag=True, help='Send an email if there are new downloads.')
-@click.option('-x', '--maxsize', default=5E7, help='Define the maximum size of a file to be downloaded.')
-def cli(dropbox, logall, mail, maxsize):
-    try:
-        crawler = Crawler(dropbox, logall, mail, maxsize)
-        crawler.run()
-    except AssertionError:
-        print('AssertionError.', 'Please maintain the required settings in ' + SECRETS_FILE, sep='\n')
-        sys.exit(1)
-    except KeyboardInterrupt as kie:
-        print(kie, '\n', clr.BOLD, clr.RED, 'KeyboardInterrupt. Crawler terminated.', clr.ENDC, sep='')
-        sys.exit(1)
-
-
-if __name__ == '__main__':
-    cli()
+#!/usr/bin/python3
+"""Main module for crawling the content."""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, ExitStack
+from datetime import datetime
+import functools
+import hashlib
+import importlib.util
+import mimetypes
+import os
+import re
+import sys
+import time
+
+import click
+
+from database import DATABASE_FOLDER, Database
+import database
+from hashing import ALGORITHMS, LEGACY
+import hashing
+from manifest import DOWNLOADS, Manifest
+import listing
+from metrics import Metrics
+from pipeline import INFLIGHT, Pipeline
+from rules import Rules
+import save_base
+import savers
+from storage import STORAGES
+import storage
+from util import Colors as clr
+import util
+from watch import Watcher
+
+# the modules importing requests are executed on first use, such that --help does not wait for them
+download = util.lazy_import('download')
+request = util.lazy_import('request')
+profiling = util.lazy_import('profiling')
+
+SECRETS_FILE = 'app_secrets.py'
+CHLOG_FOLDER = '.changelog/'
+# cookies of the ILIAS session, kept between runs in the .db folder of the working directory
+SESSION_FILE = 'session.json'
+# entries applied from a manifest between two flushes of the saver
+APPLY_FLUSH = 50
+# colors of the methods printed for a file
+METHOD_COLORS = {
+    'file_skiped': clr.BLUE,
+    'file_update': clr.GREEN,
+    'downloading': clr.BOLD,
+    'safe_overwr': clr.RED
+}
+
+
+def load_secrets():
+    """Import the configuration from SECRETS_FILE or create it if it is missing."""
+    try:
+        import app_secrets as secrets
+    except ImportError:
+        if not os.path.exists(SECRETS_FILE):
+            util.create_secrets(SECRETS_FILE)
+        else:
+            print(SECRETS_FILE + ' file is malformed or missing.')
+            print('Please start again from the <repo>/slider/ dir.')
+            os.remove(SECRETS_FILE)
+            sys.exit(1)
+    return secrets
+
+
+def load_account(folder):
+    """Import the configuration of an account from the SECRETS_FILE in folder."""
+    path = os.path.join(folder, SECRETS_FILE)
+    if not os.path.exists(path):
+        print('No {} in {}.'.format(SECRETS_FILE, folder))
+        sys.exit(1)
+    spec = importlib.util.spec_from_file_location('app_secrets', path)
+    secrets = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(secrets)
+    return secrets
+
+
+class Crawler:
+    """A crawler for downloading university e-learning content.
+
+    The configuration is read from SECRETS_FILE unless a module or object
+    with the same attributes is passed as secrets. The files are saved with
+    the saver registered by name as saver, see savers, by default with
+    Dropbox if dropbox is set and locally otherwise. The optional SESSION_PATH
+    attribute overrides where the session is kept, None keeps none, the
+    optional RULES attribute holds the selection rules, see rules.
+    """
+    def __init__(self, dropbox, logall, mail, maxsize, workers=1, storage='tinydb',
+                 incremental=False, full=False, revisit=5, segment=2E7, prometheus=None, rate=None,
+                 objects=False, algorithm=LEGACY, zero_probe=False, probers=0, fetchers=0, inflight=INFLIGHT,
+                 saver=None, secrets=None):
+        if secrets is None:
+            secrets = load_secrets()
+        self.metrics = Metrics()
+        self.prometheus = prometheus
+        self.logall = logall
+        self.sendmail = mail
+        self.maxsize = maxsize
+        self.workers = workers
+        self.incremental = incremental
+        self.full = full
+        self.revisit = revisit
+        self.algorithm = algorithm
+        self.zero_probe = zero_probe
+        self.probers = probers
+        self.fetchers = fetchers
+        self.inflight = inflight
+
+        # only the selected saver and its dependencies are imported
+        saver = saver or ('dropbox' if dropbox else savers.DEFAULT)
+        self.file_handler = savers.load(saver).from_secrets(secrets, self.metrics, objects)
+        self.save_path = self.file_handler.base_path
+        # the database of a remote saver is cached in the working directory
+        self.dropbox = self.file_handler.REMOTE
+
+        session_path = getattr(secrets, 'SESSION_PATH', util.bpath(os.getcwd()) + DATABASE_FOLDER + SESSION_FILE)
+        # threads sending requests: the listing workers, the probers and the ranges of every fetcher
+        senders = workers + max(probers, 1) + max(fetchers, 1) * download.SEGMENTS
+        self.req = request.RequestHandler(secrets.USER, secrets.PASSWORD, senders,
+                                          getattr(secrets, 'ILIAS_BASE', request.ILIAS_BASE),
+                                          getattr(secrets, 'ILIAS_URL', request.ILIAS_URL), self.metrics, rate,
+                                          session_path=session_path)
+        self.file_handler.create_folder(CHLOG_FOLDER)
+        self.database = Database(self.file_handler, self.dropbox, storage, self.metrics)
+        self.downloader = download.Downloader(self.req, self.database.db_folder_path + download.PARTIAL_FOLDER,
+                                              segment, self.metrics, algorithm)
+        # records hashed with the legacy algorithm, which are migrated when their content is downloaded again
+        self.legacy_records = self.database.count_algorithm(LEGACY) if algorithm != LEGACY else 0
+
+        self.courses = secrets.COURSES
+        self.rules = Rules(self.courses, getattr(secrets, 'RULES', None), maxsize)
+        # listings and downloads shared with the other crawlers of a Batch
+        self.shared = None
+        # the manifest the planned files are added to instead of downloading them
+        self.manifest = None
+        # the pipeline the files of the crawled folders are passed through
+        self.pipeline = None
+        self.cycles = 0
+        self.reset()
+
+    def reset(self):
+        """Reset the results of the last run."""
+        # the number of the incremental run, counted once the run crawls, see count_run
+        self.run_number = 0
+        self.removed_label_flag = False
+        self.login_seconds = 0.0
+        # legacy records migrated to the configured hash algorithm
+        self.migrated = 0
+        # courses and folders, and files excluded by the selection rules before they were requested
+        self.pruned_folders = 0
+        self.pruned_files = 0
+        # HEAD requests not sent thanks to the listed file properties
+        self.saved_probes = 0
+        self.downloads = []
+        self.changelog = []
+        self.saved_bytes = 0
+        # url and hash of the saved files by path, url of the crawled folders by path
+        self.saves = {}
+        self.folder_urls = {}
+        # new files and sent requests of the crawled courses by name
+        self.course_downloads = {}
+        self.course_requests = {}
+
+    def __str__(self):
+        if not self.downloads:
+            return 'Files were already up to date.'
+        else:
+            s = 's' if len(self.downloads) != 1 else ''
+            d = 'DROPBOX/' if self.dropbox else ''
+            p = d + self.save_path
+            restr = '{} new file{} downloaded from ILIAS to {}.'.format(str(len(self.downloads)), s, p)
+            return restr
+
+    def run(self):
+        """Main entry point.
+
+        Authenticate the client, crawl the courses, persist the results,
+        write a changelog and optionally send a mail with the results.
+        """
+        self.cycle()
+        self.database.close(self.file_handler, self.dropbox)
+
+    def desktop(self):
+        """Return the personal desktop, logging in unless the session is still authenticated."""
+        start = time.perf_counter()
+        try:
+            html_text = self.req.desktop()
+        except request.RequestException as err:
+            print(err, 'A connection error occurred. Please check your internet connection.', sep='\n')
+            sys.exit(1)
+
+        # check whether authentication worked; has to be done this way
+        # since HTTP response on failed authentication is 200 - OK.
+        if request.AUTH_FAILED_MSG in html_text:
+            print('Authorization failed. Please maintain user and password correctly.')
+            sys.exit(1)
+        self.login_seconds = time.perf_counter() - start
+        return html_text
+
+    def cycle(self, due=None):
+        """Crawl the courses, or only the courses in due if it is given, persist
+           the results, write a changelog and optionally send a mail with the results.
+           The session and the database are kept open for the next cycle."""
+        # in watch mode, start the next cycle from scratch
+        if self.cycles:
+            self.metrics.reset()
+            self.file_handler.refresh()
+            self.downloader.resumed = 0
+            self.reset()
+        self.cycles += 1
+        self.count_run()
+
+        # authentication and crawl courses, keeping the possibly renewed session cookies
+        with self.interruptible():
+            self.crawl(self.desktop(), due)
+        self.req.save_session()
+
+        # finish deferred saves and forget the files that failed to save
+        self.flush()
+        self.finish()
+
+    @contextmanager
+    def interruptible(self):
+        """Persist the records of the files saved so far if the run is interrupted or fails,
+           such that the next run knows them instead of moving them to the overwritten folder."""
+        try:
+            yield
+        except BaseException:
+            self.database.commit()
+            raise
+
+    def count_run(self):
+        """Count a new incremental run, i.e. a run which crawls the courses.
+           Applying a manifest continues the run that planned it instead."""
+        self.run_number = self.database.next_run() if self.incremental else 0
+
+    def flush(self):
+        """Finish deferred saves and forget the files that failed to save,
+           returns their urls and folder paths."""
+        return [self.rollback(relative_path) for relative_path in self.file_handler.flush()]
+
+    def finish(self):
+        """Wrap up a run: persist database, write changelog, send mail, write metrics and print the stats."""
+        self.database.sync(self.file_handler, self.dropbox)
+        self.write_changelog()
+        if self.sendmail and self.downloads:
+            self.req.send_mail(self, self.downloads)
+        self.write_metrics()
+
+        # print download stats
+        clrone = clr.BOLD
+        clrtwo = clr.GREEN if self.downloads else clr.ENDC
+        clrend = clr.ENDC
+        print(clrone, clrtwo, self, clrend, sep='')
+        how = 'Stored session reused' if self.req.reused else 'Logged in'
+        print('{} within {:.2f} s.'.format(how, self.login_seconds))
+        if self.saved_bytes:
+            print('Conditional requests saved downloading {}.'.format(util.format_size(self.saved_bytes)))
+        if self.downloader.resumed:
+            print('Resumed downloads saved downloading {}.'.format(util.format_size(self.downloader.resumed)))
+        lookups = self.file_handler.hits + self.file_handler.misses
+        if lookups:
+            print('Path cache answered {} of {} lookups.'.format(self.file_handler.hits, lookups))
+        if self.pruned_folders or self.pruned_files:
+            print('Selection rules excluded {} folders and {} files, saving at least {} requests.'.format(
+                self.pruned_folders, self.pruned_files, self.pruned_folders + self.pruned_files))
+        if self.saved_probes:
+            print('Listed file properties saved {} HEAD requests.'.format(self.saved_probes))
+        if self.migrated:
+            print('Migrated {} records to {} hashes.'.format(self.migrated, self.algorithm))
+        if self.file_handler.deduplicated:
+            print('Object store linked {} files to stored content.'.format(self.file_handler.deduplicated))
+
+    def plan(self, path):
+        """Crawl the courses without downloading any file and write what
+           would be done with every file to the manifest at path."""
+        self.count_run()
+        self.manifest = Manifest(self.run_number)
+        self.crawl(self.desktop())
+        self.req.save_session()
+        self.manifest.write(path)
+        self.write_metrics()
+        self.database.close(self.file_handler, self.dropbox)
+        print('Planned {} downloads of {} into {}.'.format(len(self.manifest.downloads()),
+                                                           util.format_size(self.manifest.total_bytes()), path))
+
+    def apply(self, path):
+        """Download the files planned in the manifest at path, except for the entries applied before.
+
+        The entries are passed through the pipeline without probes, thus they
+        are fetched by the fetchers while they are stored and recorded in the
+        order of the manifest. Every flush of the saver persists the records
+        and logs the entries applied since, thus an interrupted apply resumes there. Finally, the
+        state of every folder whose files were all applied is kept.
+        """
+        manifest = Manifest.load(path)
+        self.run_number = manifest.run_number
+        self.desktop()
+        self.folder_urls.update((folder_path, folder['url']) for folder_path, folder in manifest.folders.items())
+        applied = manifest.applied()
+        pending = [entry for entry in manifest.downloads() if entry['url'] not in applied]
+        # the folders by path, which are not settled once one of their files failed
+        listings = {folder_path: {'settled': True} for folder_path in manifest.folders}
+        # urls of the entries applied since the last flush
+        done = []
+
+        def store(job, fetched):
+            if self.save(job, fetched):
+                done.append(job['url'])
+
+        with self.interruptible(), self.transfers(None, self.check_entry, store) as pipeline:
+            for number, entry in enumerate(pending, 1):
+                pipeline.feed({
+                    'url': entry['url'],
+                    'name': entry['path'],
+                    'entry': entry,
+                    'listing': listings.setdefault(entry['folder'], {'settled': True})
+                })
+                if number % APPLY_FLUSH == 0:
+                    self.commit(manifest, done, listings)
+            pipeline.drain()
+        self.commit(manifest, done, listings)
+        self.req.save_session()
+
+        if self.incremental:
+            for folder_path, folder in manifest.folders.items():
+                if not listings[folder_path]['settled']:
+                    self.database.remove_folder(folder['url'])
+                elif folder['state'] is not None:
+                    self.database.set_folder(folder['url'], folder['state'])
+        self.finish()
+        self.database.close(self.file_handler, self.dropbox)
+
+    def commit(self, manifest, done, listings):
+        """Finish the deferred saves and log the entries in done as applied,
+           except for the files that failed to save. The entries are logged
+           once their records are persisted, otherwise they are kept in done."""
+        for url, folder_path in self.flush():
+            if url in done:
+                done.remove(url)
+            listings[folder_path]['settled'] = False
+        if self.database.sync(self.file_handler, self.dropbox):
+            manifest.mark(done)
+            done.clear()
+
+    def crawl(self, html_text, due=None):
+        """Loop through top level courses and crawl the content for every course,
+           or only for the courses in due if it is given."""
+        with self.transfers(self.probe_file, self.check_file, self.save) as self.pipeline:
+            self.crawl_courses(html_text, due)
+        self.pipeline = None
+
+    def crawl_courses(self, html_text, due=None):
+        """Crawl the courses, passing the files of every course through the pipeline before the next."""
+        for scs, relative_link in listing.parse_courses(html_text):
+            course_name = self.rules.course(scs)
+            course_url = self.req.base_url + relative_link
+
+            if course_name is not None:
+                if due is not None and course_name not in due:
+                    continue
+                if self.rules.excludes_course(scs):
+                    self.pruned_folders += 1
+                    util.print_method('excluded', scs.strip(), clr.BLUE)
+                    continue
+                downloads, requests = len(self.downloads), self.req.requests
+                self.metrics.course = course_name
+                with self.metrics.phase('course'):
+                    self.crawl_course(course_url, course_name + '/')
+                    self.pipeline.drain()
+                self.metrics.course = ''
+                self.course_downloads[course_name] = len(self.downloads) - downloads
+                self.course_requests[course_name] = self.req.requests - requests
+            else:
+                print(clr.BOLD, 'No download requested for course >> ', clr.ENDC, scs.lstrip(), sep='')
+
+    def crawl_course(self, course_url, folder_path):
+        """Recursively call this method until there is something to download
+           for this course in the respective path."""
+        if self.workers > 1:
+            self.crawl_concurrent(course_url, folder_path)
+            return
+        items = self.fetch_listing(course_url)
+        self.handle_listing(course_url, folder_path, items, self.crawl_course)
+
+    def crawl_concurrent(self, course_url, folder_path):
+        """Crawl the folder tree of a course with a frontier of folder URLs.
+
+        The listing pages are fetched and parsed by a pool of workers, while
+        the listings are handled in the order their folders were discovered,
+        such that downloads, database and output stay sequential.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            frontier = deque()
+
+            def enqueue(url, path):
+                frontier.append((pool.submit(self.fetch_listing, url), url, path))
+
+            enqueue(course_url, folder_path)
+            while frontier:
+                future, url, path = frontier.popleft()
+                self.handle_listing(url, path, future.result(), enqueue)
+
+    def fetch_listing(self, url):
+        """Fetch a folder page and parse it into a list of items,
+           once for all crawlers if the crawler is part of a Batch."""
+        if self.shared is not None:
+            return self.shared.listing(url, self.parse_page)
+        return self.parse_page(url)
+
+    def parse_page(self, url):
+        """Fetch a folder page and parse it into a list of items."""
+        html_text = self.req.get_page(url)
+        with self.metrics.phase('parse'):
+            return listing.parse_listing(html_text)
+
+    def handle_listing(self, url, folder_path, items, descend):
+        """Check and save the files of a parsed folder page and pass
+           every subfolder with its folder path on to descend.
+
+        In incremental mode, the files of a folder whose listing did not change
+        since the last run are skipped, and so are its subfolders unless they
+        were last visited revisit or more runs ago. What is printed is passed
+        through the pipeline, such that it is printed in between the files.
+        """
+        if items is None:
+            self.note('no_files_in', str(folder_path))
+            return
+
+        if not self.removed_label_flag:
+            self.note('folder_path', folder_path)
+
+        self.folder_urls[folder_path] = url
+        fingerprint = self.fingerprint(url, items)
+        state = self.database.get_folder(url) if self.incremental else None
+        unchanged = not self.full and state is not None and state['fingerprint'] == fingerprint
+        if unchanged:
+            self.note('unchanged', folder_path)
+
+        listing = {'settled': True}
+        for item in items:
+            if 'download' in item.href:
+                if unchanged:
+                    continue
+                # the size and ending are listed, thus known without a request
+                excluded = self.rules.excludes_file(item)
+                if excluded:
+                    self.pruned_files += 1
+                    self.skip(folder_path, item, excluded)
+                    continue
+                if self.manifest is None:
+                    self.file_handler.create_folder(folder_path)
+                self.check_save(folder_path, item.title, item.file_ending, item.last_update, item.href, item.size,
+                                listing)
+            else:
+                parsed = util.remove_edge_characters(item.title)
+                if not parsed:
+                    self.removed_label_flag = True
+                folder_url = self.req.base_url + item.href
+                if self.rules.excludes_folder(folder_path + parsed):
+                    self.pruned_folders += 1
+                    self.note('excluded', folder_path + parsed, clr.BLUE)
+                    continue
+                if unchanged and self.revisit_later(folder_url):
+                    self.note('unchanged', folder_path + parsed)
+                    continue
+                descend(folder_url, folder_path + parsed)
+
+        self.pipeline.note(functools.partial(self.remember, url, folder_path, fingerprint, listing))
+
+    def skip(self, folder_path, item, excluded):
+        """Print why the file of a ListingItem in folder_path is excluded once the files before are handled.
+           A file skipped for its listed size is reported like one skipped for its probed size."""
+        if excluded != 'file_skiped':
+            self.note(excluded, folder_path + item.title, clr.BLUE, self.logall)
+            return
+        relative_path = self.file_path(folder_path, item.title)
+        if item.file_ending:
+            relative_path += '.' + item.file_ending
+        self.pipeline.note(functools.partial(self.report, excluded, relative_path, self.manifest is None))
+
+    def note(self, method, messag, clrone=clr.ENDC, log=False):
+        """Print what is done with a folder or a file once the files before are handled,
+           logging it to the changelog if log is set."""
+        def call():
+            if log:
+                self.changelog.append(method + ': ' + messag)
+            util.print_method(method, messag, clrone)
+        self.pipeline.note(call)
+
+    def remember(self, url, folder_path, fingerprint, listing):
+        """Remember the listing of a folder once all of its files are handled
+           and settled, when planning once they are applied."""
+        state = None
+        if self.incremental and listing['settled']:
+            state = {'fingerprint': fingerprint, 'visited': self.run_number}
+        if self.manifest is not None:
+            self.manifest.add_folder(folder_path, url, state)
+        elif state is not None:
+            self.database.set_folder(url, state)
+        # an unsettled folder is listed again in the next run, such that its failed files are retried
+        elif self.incremental:
+            self.database.remove_folder(url)
+
+    @staticmethod
+    def fingerprint(url, items):
+        """Compute a fingerprint of a folder from its url and the links
+           and last updates of its items."""
+        fingerprint = hashlib.sha1(url.encode('utf-8'))
+        for item in items:
+            fingerprint.update('\n{} {}'.format(item.href, item.last_update).encode('utf-8'))
+        return fingerprint.hexdigest()
+
+    def revisit_later(self, url):
+        """Decide whether a subfolder of an unchanged folder is skipped in this run,
+           i.e. it was visited less than revisit runs ago."""
+        state = self.database.get_folder(url)
+        return state is not None and self.run_number - state['visited'] < self.revisit
+
+    def check_save(self, folder_path, filename, file_ending, last_update, url, listed_size=None, listing=None):
+        """Prepare the file to be saved. Remove edge characters and trim, then
+           pass it into the pipeline, which adds the correct file ending and saves it.
+           settled of the dict listing of its folder is set to False if the file
+           had to be saved but saving failed."""
+        self.pipeline.feed({
+            'url': url,
+            'name': folder_path + filename,
+            'folder': folder_path,
+            'file': self.file_path(folder_path, filename),
+            'ending': file_ending,
+            'size': listed_size,
+            'lastupdate': last_update,
+            'listing': listing if listing is not None else {}
+        })
+
+    @staticmethod
+    def file_path(folder_path, filename):
+        """Return the relative path of the file filename in folder_path without its ending,
+           i.e. with edge characters removed and trimmed."""
+        filename = re.sub(r'[&]', 'and', filename)
+        filename = re.sub(r'[!@#$/\:;*?<>|]', '', filename).strip()
+        return folder_path + filename
+
+    def transfers(self, probe, plan, store):
+        """Return a pipeline of the stages probe, plan and store, which fetches files with prefetch."""
+        return Pipeline(probe, plan, self.prefetch, store, self.fail, request.RequestException,
+                        self.probers, self.fetchers, self.inflight)
+
+    def probe_file(self, job):
+        """Return the file ending and the size of the file of job, and the response
+           to the HEAD request for them or None if none was sent.
+
+        In zero probe mode, the listed file ending and size are trusted, such
+        that a file is only probed with a HEAD request if one of them is not
+        listed, its size is close to a size limit or it is downloaded
+        and may be fetched in byte ranges.
+        """
+        http = None
+        file_ending, file_size = job['ending'], job['size']
+        if (not self.zero_probe or not file_ending or file_size is None
+                or self.rules.near_limit(file_size)):
+            http = self.probe(job['url'])
+            file_size = http.headers['content-length']
+            if not file_ending:
+                file_ending = str(mimetypes.guess_extension(http.headers['content-type']))
+        return file_ending, file_size, http
+
+    def plan_file(self, job, probed):
+        """Decide what to do with the probed file of job before its content is requested
+           and return its manifest entry."""
+        url, last_update = job['url'], job['lastupdate']
+        file_ending, file_size, http = probed
+        relative_path = job['file'] + '.' + file_ending
+        # byte ranges can be resumed and fetched in parallel segments
+        range_size = None
+
+        # example file sizes 2E8: 200.000.000 Bytes; 5E7: 30 MB
+        if self.rules.excludes_size(float(file_size)):  # Skip
+            decision = 'file_skiped'
+        # if db contains entry with path and update, file was already downloaded
+        elif self.database.get_name_update(relative_path, last_update):  # exists
+            decision = 'loaded_once'
+        else:
+            # whether byte ranges are accepted is told by a probe
+            ranged = float(file_size) >= self.downloader.segment_size or self.downloader.partials.load(url) is not None
+            if http is None and ranged:
+                http = self.probe(url)
+            if http is not None and http.headers.get('accept-ranges') == 'bytes':
+                range_size = int(http.headers['content-length'])
+            # as far as it is known before the hash of the content
+            decision = 'file_update' if self.database.get_name(relative_path) else 'downloading'
+
+        if http is None:
+            self.saved_probes += 1
+        return {
+            'url': url,
+            'path': relative_path,
+            'folder': job['folder'],
+            'file': job['file'],
+            'ending': file_ending,
+            'size': int(float(file_size)),
+            'range_size': range_size,
+            'lastupdate': last_update,
+            'decision': decision
+        }
+
+    def check_file(self, job, probed):
+        """Plan the probed file of job. Returns the number of bytes to download
+           or None if it is not downloaded, e.g. because it is only planned."""
+        entry = job['entry'] = self.plan_file(job, probed)
+        if self.manifest is not None or entry['decision'] not in DOWNLOADS:
+            return None
+        return self.prepare(job)
+
+    def check_entry(self, job, probed):
+        """Plan the manifest entry of job like check_file, unless its file was downloaded in the meantime."""
+        entry = job['entry']
+        # e.g. by a crawl run since the manifest was written
+        if self.database.get_name_update(entry['path'], entry['lastupdate']):
+            job['entry'] = dict(entry, decision='loaded_once')
+            return None
+        self.file_handler.create_folder(entry['folder'])
+        return self.prepare(job)
+
+    def prepare(self, job):
+        """Prepare the download of the planned file of job, returns the number of bytes to download."""
+        # ask for the file only if it changed since it was downloaded last
+        job['cached'] = self.database.get_http(job['url']) or {}
+        return job['entry']['size']
+
+    def prefetch(self, job):
+        """Download the planned file of job into a staging file and compute hash on
+           the way. Returns the stack that removes the staging file, the staging file,
+           the hash of its content or None if it was not modified, and the response headers."""
+        stack = ExitStack()
+        try:
+            content = stack.enter_context(self.file_handler.staging_file(job['entry']['path']))
+            content_hash, headers = self.transfer(job['entry'], content, job['cached'])
+        except BaseException:
+            stack.close()
+            raise
+        return stack, content, content_hash, headers
+
+    def save(self, job, fetched):
+        """Store the fetched file of job, or report the planned file of job if none was
+           fetched, when planning adding it to the manifest. Returns False if saving failed."""
+        entry = job['entry']
+        if fetched is None:
+            if self.manifest is not None:
+                self.manifest.add(entry)
+            self.report(entry['decision'], entry['path'], log=self.manifest is None)
+            return True
+        stack, content, content_hash, headers = fetched
+        with stack:
+            settled = self.store(entry, content, content_hash, headers, job['cached'])
+        if not settled:
+            job['listing']['settled'] = False
+        return settled
+
+    def fail(self, job, err):
+        """Report the file of job whose probe or download failed. The received
+           bytes of a large file are kept to resume in the next run."""
+        self.changelog.append('download_failed: ' + job['name'])
+        util.print_method('download_failed', '{} ({})'.format(job['name'], err), clr.RED)
+        job['listing']['settled'] = False
+
+    def transfer(self, entry, content, cached):
+        """Download the file of a manifest entry into the file object content,
+           conditional on the validators cached for it.
+           Returns the hash of the content or None if it was not modified, and the response headers."""
+        if self.shared is not None:
+            return self.shared.download(entry['url'], content, self.downloader.download, cached.get('etag'),
+                                        cached.get('modified'), entry['range_size'])
+        return self.downloader.download(entry['url'], content, cached.get('etag'), cached.get('modified'),
+                                        entry['range_size'])
+
+    def store(self, entry, content, content_hash, headers, cached):
+        """Save the downloaded content of a manifest entry unless it is known,
+           and record it in the database. Returns False if saving failed."""
+        url, relative_path, last_update = entry['url'], entry['path'], entry['lastupdate']
+        messag = relative_path
+        settled = True
+
+        # not modified, thus the file is known and was already downloaded
+        if content_hash is None:
+            method = 'loaded_once'
+            content_hash = cached['hashvalue']
+            self.saved_bytes += cached['length']
+            # remember the last update, such that no request is sent next time
+            self.database.insert(relative_path, content_hash, last_update, cached.get('algorithm', LEGACY))
+            cacheable = False
+        # query db for hash
+        # filename or last update may have changed but hash exists
+        # thus file is known and was already downloaded
+        elif self.known_content(content_hash, content):  # exists
+            method = 'loaded_once'
+            cacheable = True
+        else:
+            # query db for name
+            res_p = self.database.get_name(relative_path)
+            # if this name already exists in the database
+            # must be an update because otherwise the name + last_update
+            # or the hash should have been in the db already
+            if res_p:
+                method = 'file_update'
+                relative_path = '{}_UP{}.{}'.format(entry['file'], content_hash[:4], entry['ending'])
+                messag = relative_path
+            # not an update: new file
+            else:
+                # check if this filename exists already at the destination path
+                # should not happen unless user renamed file to exactly this downloaded file name
+                # check also only exists to inform user that file is not just overwritten
+                # but safely moved to the .overwritten/ folder
+                exists = self.file_handler.exists(relative_path)
+                if not exists:
+                    method = 'downloading'
+                else:
+                    method = 'safe_overwr'
+                messag = relative_path + ' from ' + url
+            saved = self.file_handler.save_file(relative_path, content, content_hash=content_hash)
+            if saved:
+                self.database.insert(relative_path, content_hash, last_update, self.algorithm)
+                self.downloads.append(method + ': ' + relative_path)
+                self.saves[relative_path] = (url, content_hash, entry['folder'])
+            cacheable = saved
+            settled = saved
+
+        # cache the validators of the response for conditional requests
+        if cacheable and (headers.get('ETag') or headers.get('Last-Modified')):
+            self.database.set_http(url, {
+                'etag': headers.get('ETag'),
+                'modified': headers.get('Last-Modified'),
+                'length': os.fstat(content.fileno()).st_size,
+                'type': headers.get('Content-Type'),
+                'hashvalue': content_hash,
+                'algorithm': self.algorithm
+            })
+
+        self.report(method, messag)
+        return settled
+
+    def report(self, method, messag, log=True):
+        """Print what is done with a file and log it to the changelog unless it is skipped or known."""
+        if log and (method != ('file_skiped' and 'loaded_once') or self.logall):
+            self.changelog.append(str(method + ': ' + messag))
+        util.print_method(method, messag, METHOD_COLORS.get(method, clr.ENDC))
+
+    def probe(self, url):
+        """Send a HEAD request for the headers of the file at url, once for all crawlers of a Batch."""
+        return self.shared.head(url, self.req.head) if self.shared is not None else self.req.head(url)
+
+    def known_content(self, content_hash, content):
+        """Check whether the content with content_hash was downloaded before.
+
+        While there are records hashed with the legacy algorithm, the content
+        is also hashed with it, and its legacy records are migrated to the
+        configured algorithm when found.
+        """
+        if self.database.get_hash(content_hash):
+            return True
+        if not self.legacy_records:
+            return False
+        with self.metrics.phase('hash'):
+            legacy_hash = hashing.file_hash(content, LEGACY)
+        migrated = len(self.database.get_hash(legacy_hash))
+        if migrated:
+            self.database.rehash(legacy_hash, content_hash, self.algorithm)
+            self.legacy_records -= migrated
+            self.migrated += migrated
+        return bool(migrated)
+
+    def rollback(self, relative_path):
+        """Forget a file that was recorded as saved but failed to save in the end,
+           such that it is downloaded again in the next run. Returns its url and folder path."""
+        url, content_hash, folder_path = self.saves.pop(relative_path)
+        self.database.remove(relative_path, content_hash)
+        self.database.remove_http(url)
+        self.database.remove_folder(self.folder_urls[folder_path])
+        self.downloads = [d for d in self.downloads if not d.endswith(': ' + relative_path)]
+        self.changelog.append('save_failed: ' + relative_path)
+        util.print_method('save_failed', relative_path, clr.RED)
+        return url, folder_path
+
+    def write_changelog(self):
+        """Write a changelog to /chosen_dir/.changelog/changelog_{datetime}."""
+        if not self.changelog:
+            return
+        d = datetime.today().strftime('%Y-%m-%d_%H-%M-%S')
+        tmp = '# Changelog from {}\n'.format(d)
+        tmp += str(len(tmp) * '-') + '\n'
+        tmp += '\n'.join(self.changelog) + '\n'
+        b = tmp.encode('utf-8')
+        self.file_handler.save_file(CHLOG_FOLDER + 'changelog_{}.txt'.format(d), b, True)
+
+    def profile_stages(self):
+        """Return the stages a profile of the crawler is tagged by, as their functions and modules."""
+        return {
+            'crawl': [Crawler.crawl, Crawler.crawl_courses],
+            'crawl_course': [Crawler.crawl_course, Crawler.crawl_concurrent, Crawler.fetch_listing, Crawler.parse_page,
+                             Crawler.handle_listing],
+            'check_save': [Crawler.check_save, Crawler.probe_file, Crawler.plan_file, Crawler.check_file,
+                           Crawler.check_entry, Crawler.prefetch, Crawler.transfer, Crawler.save, Crawler.store],
+            'saver': [save_base, sys.modules[type(self.file_handler).__module__]],
+            'Database': [database, storage]
+        }
+
+    def write_profile(self, profiler):
+        """Write the profile of the run to /chosen_dir/.changelog/profile_{datetime}, i.e. the cProfile stats
+           to .prof, the collapsed stacks to .folded and the report to .txt."""
+        d = self.metrics.start.strftime('%Y-%m-%d_%H-%M-%S')
+        for ending, content in profiler.results().items():
+            self.file_handler.save_file(CHLOG_FOLDER + 'profile_{}.{}'.format(d, ending), content, True)
+        print('Profile written to {}profile_{}.txt.'.format(CHLOG_FOLDER, d))
+
+    def write_metrics(self):
+        """Write the metrics of the run to /chosen_dir/.changelog/metrics_{datetime}.json
+           and to the Prometheus textfile if one was chosen."""
+        summary = {
+            'downloads': len(self.downloads),
+            'login_seconds': round(self.login_seconds, 6),
+            'session_reused': int(self.req.reused),
+            'conditional_saved_bytes': self.saved_bytes,
+            'resumed_bytes': self.downloader.resumed,
+            'path_cache_hits': self.file_handler.hits,
+            'path_cache_misses': self.file_handler.misses,
+            'deduplicated_files': self.file_handler.deduplicated,
+            'migrated_records': self.migrated,
+            'pruned_requests': self.pruned_folders + self.pruned_files,
+            'saved_probes': self.saved_probes
+        }
+        d = self.metrics.start.strftime('%Y-%m-%d_%H-%M-%S')
+        b = self.metrics.to_json(**summary).encode('utf-8')
+        self.file_handler.save_file(CHLOG_FOLDER + 'metrics_{}.json'.format(d), b, True)
+
+        # replaced atomically, such that the collector never reads a partial file
+        if self.prometheus:
+            with open(self.prometheus + '.tmp', 'w') as f:
+                f.write(self.metrics.to_prometheus(**summary))
+            os.replace(self.prometheus + '.tmp', self.prometheus)
+
+
+@click.command()
+@click.option('-d', '--dropbox', is_flag=True, help='Upload files using Dropbox API (requires access token).')
+@click.option('--saver', help='Save the files with the saver registered by this name, e.g. local or dropbox.')
+@click.option('-l', '--logall', is_flag=True, help='Log everything to the changelog, not just downloads.')
+@click.option('-m', '--mail', is_flag=True, help='Send an email if there are new downloads.')
+@click.option('-x', '--maxsize', default=5E7, help='Define the maximum size of a file to be downloaded.')
+@click.option('-w', '--workers', default=1, help='Number of workers fetching folder pages concurrently.')
+@click.option('-s', '--storage', default='tinydb', type=click.Choice(sorted(STORAGES)),
+              help='Storage backend of the download database.')
+@click.option('-i', '--incremental', is_flag=True, help='Skip folders whose listing did not change since the last run.')
+@click.option('-f', '--full', is_flag=True, help='Force a complete crawl in incremental mode.')
+@click.option('-r', '--revisit', default=5, help='Revisit subfolders of unchanged folders every n runs.')
+@click.option('-g', '--segment', default=2E7, help='Minimum size of a file to be downloaded in parallel byte ranges.')
+@click.option('-p', '--prometheus', type=click.Path(dir_okay=False),
+              help='Write the metrics of the run to a Prometheus textfile.')
+@click.option('--watch', type=float, help='Keep running and poll every course at most every n seconds.')
+@click.option('--budget', type=int, help='Maximum number of requests per hour in watch mode.')
+@click.option('--rate', type=float, help='Maximum number of requests per second.')
+@click.option('-o', '--objects', is_flag=True, help='Store every content once and save files as hardlinks to it.')
+@click.option('--gc', is_flag=True, help='Remove the stored contents no saved file links to, then exit.')
+@click.option('--hash', 'algorithm', default=LEGACY, type=click.Choice(sorted(ALGORITHMS)),
+              help='Hash algorithm of the downloaded files.')
+@click.option('-z', '--zero-probe', is_flag=True,
+              help='Trust the listed file properties and send HEAD requests only where they fall short.')
+@click.option('--probers', default=0, help='Number of workers sending HEAD requests ahead, 0 for none.')
+@click.option('--fetchers', default=0, help='Number of workers downloading files ahead, 0 for none.')
+@click.option('--inflight', default=INFLIGHT, help='Maximum number of bytes downloaded ahead.')
+@click.option('--batch', multiple=True, type=click.Path(exists=True, file_okay=False),
+              help='Crawl for the account configured in this folder, may be repeated.')
+@click.option('--plan', type=click.Path(dir_okay=False),
+              help='Write the files a run would download to a manifest instead of downloading them.')
+@click.option('--apply', type=click.Path(exists=True, dir_okay=False),
+              help='Download the files planned in a manifest, resuming an interrupted apply.')
+@click.option('--profile', is_flag=True,
+              help='Profile the run and write CPU and allocation reports by stage to the changelog folder.')
+def cli(dropbox, saver, logall, mail, maxsize, workers, storage, incremental, full, revisit, segment, prometheus,
+        watch, budget, rate, objects, gc, algorithm, zero_probe, probers, fetchers, inflight, batch, plan, apply,
+        profile):
+    if batch and watch:
+        raise click.UsageError('--watch cannot be combined with --batch.')
+    if (plan or apply) and (watch or batch or plan and apply):
+        raise click.UsageError('--plan and --apply cannot be combined with each other, --watch or --batch.')
+    if profile and (watch or batch):
+        raise click.UsageError('--profile cannot be combined with --watch or --batch.')
+    if dropbox and saver not in (None, 'dropbox'):
+        raise click.UsageError('--dropbox cannot be combined with another saver.')
+    saver = saver or ('dropbox' if dropbox else savers.DEFAULT)
+    if not savers.exists(saver):
+        raise click.UsageError('No saver is registered as {}.'.format(saver))
+    if saver != 'local' and (objects or gc):
+        raise click.UsageError('The object store is only available for local folders.')
+    options = dict(dropbox=dropbox, logall=logall, mail=mail, maxsize=maxsize, workers=workers, storage=storage,
+                   incremental=incremental, full=full, revisit=revisit, segment=segment, prometheus=prometheus,
+                   rate=rate, objects=objects, algorithm=algorithm, zero_probe=zero_probe, probers=probers,
+                   fetchers=fetchers, inflight=inflight, saver=saver)
+    try:
+        if batch:
+            from batch import Batch
+
+            def make_crawler(name):
+                # every account writes its own Prometheus textfile
+                path = None
+                if prometheus:
+                    root, ext = os.path.splitext(prometheus)
+                    path = root + '_' + name + ext
+                return Crawler(**dict(options, prometheus=path, secrets=load_account('.')))
+            Batch(batch, make_crawler).run()
+            return
+        crawler = Crawler(**options)
+        profiler = profiling.Profiler(crawler.profile_stages()) if profile else None
+        if profiler is not None:
+            profiler.start()
+        try:
+            if gc:
+                removed, size = crawler.file_handler.collect_garbage()
+                print('Removed {} stored contents of {}.'.format(removed, util.format_size(size)))
+            elif plan:
+                crawler.plan(plan)
+            elif apply:
+                crawler.apply(apply)
+            elif watch:
+                Watcher(crawler, watch, budget).run()
+            else:
+                crawler.run()
+        # an interrupted run is profiled as well
+        finally:
+            if profiler is not None:
+                profiler.stop()
+                crawler.write_profile(profiler)
+    except AssertionError:
+        print('AssertionError.', 'Please maintain the required settings in ' + SECRETS_FILE, sep='\n')
+        sys.exit(1)
+    except KeyboardInterrupt as kie:
+        print(kie, '\n', clr.BOLD, clr.RED, 'KeyboardInterrupt. Crawler terminated.', clr.ENDC, sep='')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    cli()
@@ -1,86 +1,222 @@
 """Database module."""
 
 import os
-import shutil
-
-from tinydb import TinyDB, Query
 
+from hashing import LEGACY
+from metrics import NoMetrics, timed
+from storage import STORAGES, TinyDBStorage
 import util
 
 DATABASE_FOLDER = '.db/'
-DATABASE_PATH = DATABASE_FOLDER + 'files.json'
+# metadata table of HTTP response headers by URL
+HTTP_TABLE = 'http'
+# metadata table of folder listing fingerprints by URL
+FOLDER_TABLE = 'folders'
+# metadata table of run counters
+RUN_TABLE = 'runs'
+LEGACY_PATH = DATABASE_FOLDER + TinyDBStorage.FILENAME
 
 
 class Database:
-    """A class to handle a TinyDB instance for keeping track of downloads."""
-    def __init__(self, file_handler, dropbox):
-        curr = util.bpath(os.getcwd())
+    """A class to handle a storage backend for keeping track of downloads.
+
+    In local mode, the database is opened in place in the chosen download
+    folder. With Dropbox, a copy is cached in the working directory together
+    with the Dropbox revision it was downloaded or uploaded as, such that it
+    is only downloaded if it changed remotely and only uploaded if the run
+    added records.
+    """
+    def __init__(self, file_handler, dropbox, storage='tinydb', metrics=None):
+        self.metrics = metrics or NoMetrics()
+        storage_class = STORAGES[storage]
+        self.relative_path = DATABASE_FOLDER + storage_class.FILENAME
+        if dropbox:
+            curr = util.bpath(os.getcwd())
+        else:
+            curr = file_handler.base_path
         self.db_folder_path = curr + DATABASE_FOLDER
-        self.db_path = curr + DATABASE_PATH
-        self.setup(file_handler, dropbox)
-
-        self.db = TinyDB(self.db_path)
-
-    def insert(self, filepath, filehash, fileupdate):
-        """Insert an element into the database."""
-        self.db.insert({'path': filepath, 'hashvalue': filehash, 'lastupdate': fileupdate})
-
+        self.db_path = curr + self.relative_path
+        self.rev_path = self.db_path + '.rev'
+        self.legacy_path = curr + LEGACY_PATH
+        migrate = self.setup(file_handler, dropbox)
+
+        self.db = storage_class(self.db_path)
+        self.dirty = migrate
+        if migrate:
+            self.db.migrate(self.legacy_path)
+            # the downloaded TinyDB database is not needed anymore
+            if dropbox:
+                os.remove(self.legacy_path)
+
+    @timed('db_write')
+    def insert(self, filepath, filehash, fileupdate, algorithm=LEGACY):
+        """Insert an element into the database, hashed with algorithm."""
+        self.db.insert(filepath, filehash, fileupdate, algorithm)
+        self.changed()
+
+    @timed('db_write')
+    def rehash(self, filehash, newhash, algorithm):
+        """Replace the hashvalue filehash of its elements by newhash of algorithm."""
+        self.db.rehash(filehash, newhash, algorithm)
+        self.changed()
+
+    @timed('db_write')
+    def remove(self, filepath, filehash):
+        """Remove the elements with the given path filepath and hashvalue filehash."""
+        self.db.remove(filepath, filehash)
+        self.changed()
+
+    @timed('db_query')
     def get_hash(self, filehash):
         """Retrieve all elements with the given hashvalue filehash."""
-        file = Query()
-        return self.db.search(file.hashvalue == filehash)
+        return self.db.get_hash(filehash)
+
+    @timed('db_query')
+    def count_algorithm(self, algorithm):
+        """Count the elements hashed with algorithm."""
+        return self.db.count_algorithm(algorithm)
 
+    @timed('db_query')
     def get_name(self, filepath):
         """Retrieve all elements with the given path filepath."""
-        file = Query()
-        return self.db.search(file.path == filepath)
+        return self.db.get_name(filepath)
 
+    @timed('db_query')
     def get_name_update(self, filepath, fileupdate):
         """Retrieve all elements with the given path filepath and last update fileupdate."""
-        file = Query()
-        return self.db.search((file.path == filepath) & (file.lastupdate == fileupdate))
-
+        return self.db.get_name_update(filepath, fileupdate)
+
+    @timed('db_query')
+    def get_http(self, url):
+        """Retrieve the cached HTTP metadata of the file at url or None."""
+        return self.db.get_meta(HTTP_TABLE, url)
+
+    @timed('db_write')
+    def set_http(self, url, http):
+        """Cache the HTTP metadata of the file at url."""
+        self.db.set_meta(HTTP_TABLE, url, http)
+        self.changed()
+
+    @timed('db_write')
+    def remove_http(self, url):
+        """Forget the HTTP metadata of the file at url."""
+        self.db.delete_meta(HTTP_TABLE, url)
+        self.changed()
+
+    @timed('db_query')
+    def get_folder(self, url):
+        """Retrieve the state of the folder at url or None."""
+        return self.db.get_meta(FOLDER_TABLE, url)
+
+    @timed('db_write')
+    def set_folder(self, url, state):
+        """Store the state of the folder at url, i.e. its fingerprint and
+           the number of the incremental run it was visited last. Like the
+           run counter, it is no record, thus it is uploaded with the records."""
+        self.db.set_meta(FOLDER_TABLE, url, state)
+
+    @timed('db_write')
+    def remove_folder(self, url):
+        """Forget the state of the folder at url."""
+        self.db.delete_meta(FOLDER_TABLE, url)
+
+    def changed(self):
+        """Mark the records as changed since the database was synced. A cached copy then no longer
+           has the remote revision, thus the remote database wins unless the run syncs."""
+        if not self.dirty and os.path.exists(self.rev_path):
+            os.remove(self.rev_path)
+        self.dirty = True
+
+    def next_run(self):
+        """Count an incremental run and return its number."""
+        run = (self.db.get_meta(RUN_TABLE, 'incremental') or 0) + 1
+        self.db.set_meta(RUN_TABLE, 'incremental', run)
+        return run
+
+    @timed('db_sync')
     def setup(self, file_handler, dropbox):
         """Setup the database.
 
-        Create the folder where the database will be stored,
-        create the database itself or, if the database already exists
-        copy its file in the working directory. This is required
-        because when the Dropbox API is used, the file must be available
-        locally to read from and write to it.
+        Create the folder where the database will be stored. When the
+        Dropbox API is used, the file must be available locally to read
+        from and write to it, thus download it to the working directory
+        unless the cached copy has the same revision as the remote file.
+
+        Returns True if the SQLite database does not exist yet but a TinyDB
+        database does, whose records are then migrated once.
         """
         if not os.path.exists(self.db_folder_path):
             os.makedirs(self.db_folder_path)
+        legacy = self.relative_path != LEGACY_PATH
+
+        # database file is saved locally and opened in place
+        if not dropbox:
+            return legacy and not os.path.exists(self.db_path) and os.path.exists(self.legacy_path)
+
+        rev = file_handler.revision(self.relative_path)
         # database does not exist yet
-        if not file_handler.exists(DATABASE_PATH):
+        if rev is None:
             file_handler.create_folder(DATABASE_FOLDER)
-        # database exists
-        else:
-            # database is saved in Dropbox
-            # download it to working dir
-            if dropbox:
-                file_handler.download_file(DATABASE_PATH, self.db_path)
-            # database file is saved locally
-            # copy it to working dir
-            else:
-                src = file_handler.base_path + DATABASE_PATH
-                shutil.copyfile(src, self.db_path)
+            self.remove_cache()
+            # migrate records of an existing TinyDB database
+            if legacy and file_handler.exists(LEGACY_PATH):
+                file_handler.download_file(LEGACY_PATH, self.legacy_path)
+                return True
+        # database is saved in Dropbox and changed since it was cached
+        elif rev != self.cached_revision():
+            file_handler.download_file(self.relative_path, self.db_path)
+            self.write_revision(rev)
+        return False
+
+    def cached_revision(self):
+        """Return the Dropbox revision of the cached database or None."""
+        if not os.path.exists(self.db_path) or not os.path.exists(self.rev_path):
+            return None
+        with open(self.rev_path) as f:
+            return f.read().strip()
+
+    def write_revision(self, rev):
+        """Remember the Dropbox revision of the cached database."""
+        with open(self.rev_path, 'w') as f:
+            f.write(rev)
+
+    def remove_cache(self):
+        """Remove the cached database and its revision."""
+        for path in (self.db_path, self.rev_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    @timed('db_write')
+    def commit(self):
+        """Persist all changes to the local or cached database without syncing it,
+           e.g. those of an interrupted run."""
+        self.db.commit()
 
     def close(self, file_handler, dropbox):
         """Close the database.
 
-        Close the database connection and put it to
-        the chosen download folder, i.e. upload it
-        to dropbox or move it to the respective local folder.
+        Persist all changes, see sync, and close the database connection.
         """
+        self.sync(file_handler, dropbox)
         self.db.close()
 
-        if dropbox:
-            with open(self.db_path, 'rb') as f:
-                file_handler.save_file(DATABASE_PATH, f.read(), mute=True, overwrite=True)
-        else:
-            dest = file_handler.base_path + DATABASE_PATH
-            shutil.copyfile(self.db_path, dest)
+    @timed('db_sync')
+    def sync(self, file_handler, dropbox):
+        """Persist all changes, keeping the database open.
 
-        # remove db file from local working dir
-        shutil.rmtree(self.db_folder_path)
+        If the database is saved in Dropbox and records were added,
+        upload it and remember the revision of the uploaded file.
+        Returns False if the upload failed.
+        """
+        self.db.commit()
+        if dropbox and self.dirty:
+            with open(self.db_path, 'rb') as f:
+                saved = file_handler.upload_database(self.relative_path, f)
+            # on failure, the remote database wins on the next run
+            if not saved:
+                if os.path.exists(self.rev_path):
+                    os.remove(self.rev_path)
+                return False
+            self.write_revision(file_handler.revision(self.relative_path))
+            self.dirty = False
+        return True
@@ -0,0 +1,301 @@
+"""Download module for resumable and segmented downloads.
+
+A download that fails halfway keeps its received bytes and the byte ranges
+still missing in a folder next to the database, from where the next run
+resumes it with Range requests. Files from a given size on are fetched as
+byte range segments in parallel. A server that ignores Range requests
+answers with the whole file, which is then streamed from the start.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+
+from requests.exceptions import ChunkedEncodingError, RequestException
+from requests.structures import CaseInsensitiveDict
+
+from hashing import LEGACY, Hasher
+import hashing
+from metrics import NoMetrics, timed
+from request import CHUNK
+
+PARTIAL_FOLDER = 'partial/'
+# bytes read from a response at once, a broken off download loses at most these
+READ_CHUNK = 64 * 1024
+# number of byte ranges a large file is split into
+SEGMENTS = 4
+# days after which a partial download is given up
+PARTIAL_DAYS = 7
+
+
+class RangeError(RequestException):
+    """A Range request was not answered with the requested range."""
+
+
+class Segment:
+    """A byte range of a file from start to end, exclusive,
+       or to the end of the file if end is None."""
+    def __init__(self, start, end=None):
+        self.start = start
+        self.end = end
+        self.received = 0
+
+    @property
+    def position(self):
+        """The offset of the next byte to receive."""
+        return self.start + self.received
+
+    def done(self):
+        """Whether all bytes of the range were received."""
+        return self.end is not None and self.position >= self.end
+
+    def missing(self):
+        """Return the range still missing as a list [start, end]."""
+        return [self.position, self.end]
+
+    def header(self):
+        """Return the Range header value of the range still missing."""
+        return 'bytes={}-{}'.format(self.position, '' if self.end is None else self.end - 1)
+
+
+class PartialStore:
+    """Partial downloads by URL, each kept as a data file with the
+       received bytes and a JSON file with its validator and missing ranges."""
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.prune()
+
+    def paths(self, url):
+        """Return the paths of the data and the state file of url."""
+        key = self.folder + hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return key + '.part', key + '.json'
+
+    def load(self, url):
+        """Return the state of the partial download of url or None."""
+        data, path = self.paths(url)
+        if not os.path.exists(data) or not os.path.exists(path):
+            return None
+        with open(path) as f:
+            state = json.load(f)
+        return state if state.get('url') == url else None
+
+    def restore(self, url, target):
+        """Copy the received bytes of the partial download of url into the file object target."""
+        with open(self.paths(url)[0], 'rb') as f:
+            shutil.copyfileobj(f, target, CHUNK)
+        target.flush()
+
+    def save(self, url, source, validator, missing):
+        """Keep the bytes received into the file object source, the validator
+           of the response and the missing ranges of the download of url."""
+        data, path = self.paths(url)
+        source.flush()
+        source.seek(0)
+        with open(data, 'wb') as f:
+            shutil.copyfileobj(source, f, CHUNK)
+        with open(path, 'w') as f:
+            json.dump({'url': url, 'validator': validator, 'missing': missing}, f)
+
+    def remove(self, url):
+        """Forget the partial download of url."""
+        for path in self.paths(url):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def prune(self):
+        """Give up the partial downloads older than PARTIAL_DAYS."""
+        limit = time.time() - PARTIAL_DAYS * 24 * 3600
+        for name in os.listdir(self.folder):
+            if os.path.getmtime(self.folder + name) < limit:
+                os.remove(self.folder + name)
+
+
+class Downloader:
+    """Download files with the session of a RequestHandler.
+
+    Partial downloads are kept in folder and files of at least segment_size
+    bytes are split into SEGMENTS ranges, both only if the server announced
+    to accept Range requests for the file. Contents are hashed with algorithm.
+    """
+    def __init__(self, req, folder, segment_size, metrics=None, algorithm=LEGACY):
+        self.metrics = metrics or NoMetrics()
+        self.req = req
+        self.algorithm = algorithm
+        self.partials = PartialStore(folder)
+        self.segment_size = segment_size
+        # bytes that were not downloaded again thanks to resuming
+        self.resumed = 0
+
+    @timed('download')
+    def download(self, url, target, etag=None, modified=None, size=None):
+        """Download the file at url into the file object target.
+
+        Returns the hash of the content with algorithm and the response headers.
+        If etag or modified of a previous response are given, the request is
+        conditional and the hash is None if the server answers with
+        304 - Not Modified. size is the length of the file if the server accepts Range requests
+        for it. Only then a failed download is kept to be resumed, resuming
+        takes precedence over a conditional request.
+        """
+        state = self.partials.load(url) if size else None
+        if state is not None:
+            self.partials.restore(url, target)
+            segments = [Segment(start, end) for start, end in state['missing']]
+            headers = {'If-Range': state['validator']}
+        else:
+            segments = self.split(size)
+            headers = {}
+            if etag:
+                headers['If-None-Match'] = etag
+            if modified:
+                headers['If-Modified-Since'] = modified
+        self.partials.remove(url)
+
+        response_headers = CaseInsensitiveDict()
+        try:
+            # the slots of all ranges are taken at once
+            with self.req.host_slot(url, len(segments)):
+                content_hash = self.fetch(url, target, segments, headers, response_headers)
+        except BaseException:
+            if response_headers:
+                validator = response_headers.get('ETag') or response_headers.get('Last-Modified')
+                ranges = response_headers.get('Accept-Ranges') == 'bytes' or 'Content-Range' in response_headers
+            else:
+                validator = state['validator'] if state is not None else None
+                ranges = True
+            missing = [segment.missing() for segment in segments if not segment.done()]
+            received = state is not None or any(segment.received for segment in segments)
+            if size and ranges and validator and missing and received:
+                self.partials.save(url, target, validator, missing)
+            raise
+
+        # unless the file changed and was downloaded from the start
+        restarted = segments[0].start == 0 and segments[0].end is None
+        if state is not None and content_hash is not None and not restarted:
+            self.resumed += size - sum((end or size) - start for start, end in state['missing'])
+        target.seek(0)
+        return content_hash, response_headers
+
+    def split(self, size):
+        """Split a file of size bytes into segments."""
+        if not size or size < self.segment_size:
+            return [Segment(0)]
+        bounds = [size * i // SEGMENTS for i in range(SEGMENTS + 1)]
+        return [Segment(start, end) for start, end in zip(bounds, bounds[1:])]
+
+    def request(self, url, segment, headers):
+        """Send a streaming GET request for the missing range of segment
+           within the host slots held by download."""
+        headers = dict(headers)
+        if segment.position or segment.end is not None:
+            headers['Range'] = segment.header()
+        return self.req.stream(url, headers, held=True)
+
+    def fetch(self, url, target, segments, headers, response_headers):
+        """Fetch the missing ranges of segments into target and return the hash
+           of the content or None if the server answers with 304 - Not Modified.
+
+        The first range is requested with headers. If the server answers with
+        the whole file, the segments are replaced by a single one from the start.
+        Raises HTTPError if the server answers the request of the whole file with an error.
+        """
+        first = segments[0]
+        with self.request(url, first, headers) as response:
+            response_headers.update(response.headers)
+            if response.status_code == 304:
+                return None
+            if response.status_code != 206 and (first.position or first.end is not None):
+                # server ignores Range or the file changed since the partial download
+                if response.status_code != 200:
+                    response.close()
+                    return self.restart(url, target, segments, response_headers)
+                segments[:] = [Segment(0)]
+                first = segments[0]
+                target.truncate(0)
+            elif response.status_code == 206:
+                self.check_range(response, first)
+            else:
+                response.raise_for_status()
+
+            # the whole file is streamed from the start, thus hashed on the way
+            if first.start == 0 and first.end is None:
+                hasher = Hasher(self.algorithm)
+                try:
+                    self.receive(response, target, first, hasher=hasher)
+                except BaseException:
+                    hasher.close()
+                    raise
+                # the time the hash lags behind the transfer
+                with self.metrics.phase('hash'):
+                    return hasher.hexdigest()
+
+            validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+            cancelled = threading.Event()
+            with ThreadPoolExecutor(max_workers=SEGMENTS) as pool:
+                futures = [pool.submit(self.fetch_range, url, target, segment, validator, cancelled)
+                           for segment in segments[1:]]
+                try:
+                    self.receive(response, target, first)
+                    for future in futures:
+                        future.result()
+                except RangeError:
+                    cancelled.set()
+                    response.close()
+                    return self.restart(url, target, segments, response_headers)
+                except BaseException:
+                    cancelled.set()
+                    raise
+
+        with self.metrics.phase('hash'):
+            return hashing.file_hash(target, self.algorithm)
+
+    def restart(self, url, target, segments, response_headers):
+        """Download the whole file again without Range requests."""
+        segments[:] = [Segment(0)]
+        target.truncate(0)
+        response_headers.clear()
+        return self.fetch(url, target, segments, {}, response_headers)
+
+    def fetch_range(self, url, target, segment, validator, cancelled):
+        """Fetch the missing range of segment into target."""
+        headers = {'If-Range': validator} if validator else {}
+        with self.request(url, segment, headers) as response:
+            if response.status_code != 206:
+                raise RangeError('Range {} was answered with {}.'.format(segment.header(), response.status_code))
+            self.check_range(response, segment)
+            self.receive(response, target, segment, cancelled)
+
+    @staticmethod
+    def check_range(response, segment):
+        """Check that a 206 - Partial Content response starts at the position of segment."""
+        match = re.match(r'bytes (\d+)-', response.headers.get('Content-Range', ''))
+        if match is None or int(match.group(1)) != segment.position:
+            raise RangeError('Range {} was answered with {}.'.format(
+                segment.header(), response.headers.get('Content-Range')))
+
+    def receive(self, response, target, segment, cancelled=None, hasher=None):
+        """Write the body of response into target at the position of segment,
+           feeding hasher on the way if it is given."""
+        received = segment.received
+        try:
+            for chunk in response.iter_content(READ_CHUNK):
+                if cancelled is not None and cancelled.is_set():
+                    return
+                if segment.end is not None:
+                    chunk = chunk[:segment.end - segment.position]
+                if hasher is not None:
+                    hasher.update(chunk)
+                os.pwrite(target.fileno(), chunk, segment.position)
+                segment.received += len(chunk)
+                if segment.done():
+                    return
+            if segment.end is not None and not segment.done():
+                raise ChunkedEncodingError('Range {} ended early.'.format(segment.header()))
+        finally:
+            self.metrics.add_bytes('download', segment.received - received)
@@ -0,0 +1,86 @@
+"""Hashing module for the content hashes of the downloaded files.
+
+The algorithm is configurable, sha1 is the algorithm of the records written
+before it was. A Hasher computes a hash in a worker thread, fed chunk by chunk
+while the content arrives, such that hashing overlaps with the transfer.
+hashlib releases the GIL while it hashes a chunk, thus the worker really
+runs alongside the download.
+"""
+
+import hashlib
+import queue
+import threading
+
+import util
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# algorithm of the records without one
+LEGACY = 'sha1'
+# chunks waiting for the worker, such that a slow hash holds back the download
+QUEUE_CHUNKS = 64
+# chunk size for hashing a file
+CHUNK = 1024 * 1024
+
+# constructors of the available algorithms by name
+ALGORITHMS = {
+    'sha1': hashlib.sha1,
+    'blake2b': hashlib.blake2b,
+}
+if xxhash is not None:
+    ALGORITHMS['xxhash'] = xxhash.xxh3_128
+
+
+def new(algorithm):
+    """Return a new hash object of algorithm."""
+    return ALGORITHMS[algorithm]()
+
+
+def file_hash(source, algorithm):
+    """Return the hash of the content of the file object source, read from the start."""
+    content_hash = new(algorithm)
+    source.seek(0)
+    for chunk in util.iter_chunks(source, CHUNK):
+        content_hash.update(chunk)
+    source.seek(0)
+    return content_hash.hexdigest()
+
+
+class Hasher:
+    """Compute the hash of a content in a worker thread, fed chunk by chunk.
+
+    The worker is stopped by hexdigest or, if the content is given up, by close.
+    """
+    def __init__(self, algorithm):
+        self.hash = new(algorithm)
+        self.chunks = queue.Queue(QUEUE_CHUNKS)
+        self.closed = False
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def run(self):
+        """Hash the queued chunks until the end of the content."""
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                return
+            self.hash.update(chunk)
+
+    def update(self, chunk):
+        """Queue the next chunk of the content."""
+        self.chunks.put(chunk)
+
+    def close(self):
+        """Stop the worker once it hashed the queued chunks."""
+        if not self.closed:
+            self.closed = True
+            self.chunks.put(None)
+        self.worker.join()
+
+    def hexdigest(self):
+        """Wait for the worker and return the hash of the content."""
+        self.close()
+        return self.hash.hexdigest()
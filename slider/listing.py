@@ -0,0 +1,182 @@
+"""Listing module for extracting the items of ILIAS pages.
+
+Instead of building a full BeautifulSoup tree of every page, the pages are
+streamed through an HTML tokenizer and only the nodes of interest, i.e. the
+titles and item properties of the containers, are kept.
+"""
+
+from collections import namedtuple
+from datetime import datetime
+from html.parser import HTMLParser
+import re
+
+# an item of a folder listing, size and last_update are empty if not listed
+ListingItem = namedtuple('ListingItem', ['title', 'href', 'file_ending', 'size', 'last_update'])
+
+CONTAINER_CLASS = 'il_ContainerListItem'
+TITLE_CLASS = 'il_ContainerItemTitle'
+PROPERTIES_CLASS = 'ilListItemSection il_ItemProperties'
+PROPERTY_CLASS = 'il_ItemProperty'
+
+# elements without an end tag
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+
+SIZE_UNITS = {'bytes': 1, 'b': 1, 'kb': 1024, 'mb': 1024 ** 2, 'gb': 1024 ** 3}
+
+
+def node_string(node):
+    """Return the text of a captured node if it has a single text descendant,
+       following single children like the string property of BeautifulSoup."""
+    while len(node) == 1:
+        if isinstance(node[0], str):
+            return node[0]
+        node = node[0]
+    return None
+
+
+class ListingParser(HTMLParser):
+    """A streaming parser collecting the title links and item properties of ILIAS pages.
+
+    The content of a captured element is kept as a nested list of
+    its children, where text is a str and an element is a list.
+    """
+    def __init__(self, containers):
+        super().__init__()
+        # collect title links within containers or everywhere
+        self.containers = containers
+        self.found = False
+        self.items = []
+        # open divs of the current container
+        self.depth = 0
+        # open divs at which the properties div of the current container was opened
+        self.props_depth = 0
+        # title and properties of the current container
+        self.link = None
+        self.properties = []
+        self.props_done = False
+        # stack of the nodes captured at the moment
+        self.capture = []
+        self.capture_tag = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.capture:
+            child = []
+            self.capture[-1].append(child)
+            if tag not in VOID_TAGS:
+                self.capture.append(child)
+            return
+
+        classes = ''
+        for name, value in attrs:
+            if name == 'class':
+                classes = ' '.join((value or '').split())
+                break
+
+        if self.containers and not self.depth:
+            if tag == 'div' and CONTAINER_CLASS in classes.split():
+                self.found = True
+                self.depth = 1
+                self.link = None
+                self.properties = []
+                self.props_done = False
+            return
+
+        if tag == 'div':
+            self.depth += 1
+            if not self.props_done and not self.props_depth and classes == PROPERTIES_CLASS:
+                self.props_depth = self.depth
+        elif tag == 'a' and self.link is None and TITLE_CLASS in classes.split():
+            self.link = [dict(attrs).get('href'), []]
+            self.start_capture(tag, self.link[1])
+        elif tag == 'span' and self.props_depth and PROPERTY_CLASS in classes.split():
+            self.properties.append([])
+            self.start_capture(tag, self.properties[-1])
+
+    def start_capture(self, tag, node):
+        self.capture = [node]
+        self.capture_tag = tag
+
+    def handle_endtag(self, tag):
+        if self.capture:
+            if len(self.capture) > 1:
+                self.capture.pop()
+            elif tag == self.capture_tag:
+                self.capture = []
+                if not self.containers:
+                    self.items.append((node_string(self.link[1]), self.link[0]))
+                    self.link = None
+            return
+
+        if tag != 'div' or not self.depth:
+            return
+        if self.depth == self.props_depth:
+            self.props_depth = 0
+            self.props_done = True
+        self.depth -= 1
+        if not self.depth:
+            self.close_container()
+
+    def handle_data(self, data):
+        if self.capture:
+            self.capture[-1].append(data)
+
+    def close_container(self):
+        """Turn the title and properties of the closed container into a ListingItem."""
+        if self.link is None:
+            return
+        file_ending, size, last_update = '', None, ''
+        properties = [prop.strip() for prop in map(node_string, self.properties) if prop is not None]
+        if properties:
+            file_ending = properties[0]
+            size = parse_size(properties[1]) if len(properties) > 1 else None
+            last_update = parse_update(properties[2]) if len(properties) > 2 else ''
+        self.items.append(ListingItem(node_string(self.link[1]), self.link[0], file_ending, size, last_update))
+
+
+def parse_courses(html_text):
+    """Parse the courses of the personal desktop into a list of (title, href) tuples."""
+    parser = ListingParser(containers=False)
+    parser.feed(html_text)
+    parser.close()
+    return parser.items
+
+
+def parse_listing(html_text):
+    """Parse the items of a folder page into a list of ListingItem,
+       returns None if the page has no items."""
+    parser = ListingParser(containers=True)
+    parser.feed(html_text)
+    parser.close()
+    if not parser.found:
+        return None
+    return parser.items
+
+
+def parse_size(text):
+    """Parse a listed file size like 1,2 MB or 1.234 KB into bytes, returns None if it is no size.
+
+    Of two separators the last one is the decimal separator, a single
+    separator followed by three digits is a thousands separator.
+    """
+    match = re.fullmatch(r'(\d[\d.,]*)\s*([a-zA-Z]+)', text)
+    if match is None or match.group(2).lower() not in SIZE_UNITS:
+        return None
+    number = match.group(1)
+    separators = re.findall(r'[.,]', number)
+    if separators and (len(set(separators)) > 1 or not re.search(r'[.,]\d{3}$', number)):
+        decimal = separators[-1]
+        integer, fraction = number.rsplit(decimal, 1)
+        number = re.sub(r'[.,]', '', integer) + '.' + fraction
+    else:
+        number = re.sub(r'[.,]', '', number)
+    return int(float(number) * SIZE_UNITS[match.group(2).lower()])
+
+
+def parse_update(text):
+    """Parse a listed last update like 22. May 2019, 14:15 into 201905221415.
+       Relative dates like Today, 14:15 are kept as they are."""
+    try:
+        d = datetime.strptime(text, '%d. %b %Y, %H:%M')
+    except ValueError:
+        return text
+    return d.strftime('%Y%m%d%H%M')
@@ -0,0 +1,90 @@
+"""Manifest module for planning downloads and applying them later.
+
+A plan run crawls the courses, but instead of downloading the files, it
+writes a manifest of what it would do with every file. An apply run then
+downloads the planned files. Every applied entry is appended to a log next
+to the manifest, from where an interrupted apply resumes.
+"""
+
+from datetime import datetime
+import json
+import os
+
+# decisions of the entries which are downloaded when the manifest is applied
+DOWNLOADS = ('downloading', 'file_update')
+LOG_SUFFIX = '.log'
+
+
+class Manifest:
+    """The planned files of a crawl run and the crawled folders.
+
+    An entry is a dict with the keys url, path, folder, file, ending, size,
+    range_size, lastupdate and decision, i.e. file_skiped, loaded_once or,
+    as far as it is known before the download, downloading or file_update.
+    A folder is stored by its path with its url and, in incremental mode,
+    its state to be remembered once its files are applied.
+    """
+    def __init__(self, run_number=0, entries=None, folders=None, path=None):
+        self.run_number = run_number
+        self.entries = entries or []
+        self.folders = folders or {}
+        self.path = path
+
+    def add(self, entry):
+        """Add the entry of a file."""
+        self.entries.append(entry)
+
+    def add_folder(self, folder_path, url, state=None):
+        """Add a crawled folder with its state."""
+        self.folders[folder_path] = {'url': url, 'state': state}
+
+    def downloads(self):
+        """Return the entries to download."""
+        return [entry for entry in self.entries if entry['decision'] in DOWNLOADS]
+
+    def total_bytes(self):
+        """Return the expected number of bytes to download."""
+        return sum(entry['size'] for entry in self.downloads())
+
+    def write(self, path):
+        """Write the manifest to path, replacing a manifest and its log from before."""
+        self.path = path
+        manifest = {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'run': self.run_number,
+            'total_bytes': self.total_bytes(),
+            'entries': self.entries,
+            'folders': self.folders
+        }
+        with open(path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(path + '.tmp', path)
+        if os.path.exists(path + LOG_SUFFIX):
+            os.remove(path + LOG_SUFFIX)
+
+    @classmethod
+    def load(cls, path):
+        """Read the manifest at path."""
+        with open(path) as f:
+            manifest = json.load(f)
+        return cls(manifest['run'], manifest['entries'], manifest['folders'], path)
+
+    def applied(self):
+        """Return the urls of the entries applied before according to the log."""
+        applied = set()
+        if not os.path.exists(self.path + LOG_SUFFIX):
+            return applied
+        with open(self.path + LOG_SUFFIX) as f:
+            for line in f:
+                try:
+                    applied.add(json.loads(line))
+                except ValueError:
+                    # the last line of an interrupted write
+                    continue
+        return applied
+
+    def mark(self, urls):
+        """Log the entries of urls as applied."""
+        with open(self.path + LOG_SUFFIX, 'a') as f:
+            for url in urls:
+                f.write(json.dumps(url) + '\n')
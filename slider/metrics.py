@@ -0,0 +1,188 @@
+"""Metrics module for timing the phases of a crawl run.
+
+Every phase, e.g. fetching a listing or saving a file, is recorded per
+course with its count, bytes and a histogram of its latencies. The metrics
+of a run are exported as JSON and in the Prometheus text format.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime
+import functools
+import json
+import threading
+import time
+
+# upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float('inf'))
+PREFIX = 'slider_'
+
+
+def timed(phase):
+    """Decorate a method to record its latencies in the metrics of its object under phase."""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.phase(phase):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class Phase:
+    """The count, bytes and latency histogram of a phase."""
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, seconds):
+        """Record a latency."""
+        self.count += 1
+        self.seconds += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def merge(self, other):
+        """Add the records of other to this phase."""
+        self.count += other.count
+        self.seconds += other.seconds
+        self.bytes += other.bytes
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+    def cumulative(self):
+        """Return the cumulative bucket counts by upper bound."""
+        counts, total = [], 0
+        for count in self.buckets:
+            total += count
+            counts.append(total)
+        return list(zip(BUCKETS, counts))
+
+    def to_dict(self):
+        """Return the phase as a JSON serializable dict."""
+        return {
+            'count': self.count,
+            'seconds': round(self.seconds, 6),
+            'bytes': self.bytes,
+            'buckets': {format_bound(bound): count for bound, count in self.cumulative()}
+        }
+
+
+class Metrics:
+    """The phases of a crawl run by name and course.
+
+    The course of the phases recorded from now on is set as attribute
+    course, phases outside of a course are recorded with an empty course.
+    Recording is thread safe, such that workers can record concurrently.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget all phases and start anew."""
+        with self.lock:
+            self.start = datetime.now()
+            self.started = time.perf_counter()
+            self.course = ''
+            self.phases = {}
+
+    def get(self, name):
+        """Return the phase name of the current course."""
+        key = (name, self.course)
+        if key not in self.phases:
+            self.phases[key] = Phase()
+        return self.phases[key]
+
+    @contextmanager
+    def phase(self, name):
+        """Record the latency of the enclosed block under phase name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name, seconds):
+        """Record a latency under phase name."""
+        with self.lock:
+            self.get(name).observe(seconds)
+
+    def add_bytes(self, name, size):
+        """Count size bytes for phase name."""
+        with self.lock:
+            self.get(name).bytes += size
+
+    def totals(self):
+        """Return the phases of all courses by name."""
+        totals = {}
+        for (name, course), phase in self.phases.items():
+            totals.setdefault(name, Phase()).merge(phase)
+        return totals
+
+    def to_dict(self, **summary):
+        """Return the metrics as a JSON serializable dict, summary holds further values of the run."""
+        with self.lock:
+            courses = {}
+            for (name, course), phase in sorted(self.phases.items()):
+                courses.setdefault(course, {})[name] = phase.to_dict()
+            return dict(summary, **{
+                'start': self.start.isoformat(timespec='seconds'),
+                'seconds': round(time.perf_counter() - self.started, 6),
+                'phases': {name: phase.to_dict() for name, phase in sorted(self.totals().items())},
+                'courses': courses
+            })
+
+    def to_json(self, **summary):
+        """Return the metrics as JSON text."""
+        return json.dumps(self.to_dict(**summary), indent=2)
+
+    def to_prometheus(self, **summary):
+        """Return the metrics in the Prometheus text format, summary holds further gauges of the run."""
+        lines = []
+        gauges = dict(summary, duration_seconds=time.perf_counter() - self.started,
+                      timestamp_seconds=self.start.timestamp())
+        for name, value in sorted(gauges.items()):
+            lines.append('# TYPE {}run_{} gauge'.format(PREFIX, name))
+            lines.append('{}run_{} {}'.format(PREFIX, name, value))
+
+        histogram = PREFIX + 'phase_seconds'
+        lines.append('# HELP {} Latency of the phases of the last run by course.'.format(histogram))
+        lines.append('# TYPE {} histogram'.format(histogram))
+        with self.lock:
+            phases = sorted(self.phases.items())
+        for (name, course), phase in phases:
+            labels = 'phase="{}",course="{}"'.format(escape(name), escape(course))
+            for bound, count in phase.cumulative():
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(histogram, labels, format_bound(bound), count))
+            lines.append('{}_sum{{{}}} {}'.format(histogram, labels, phase.seconds))
+            lines.append('{}_count{{{}}} {}'.format(histogram, labels, phase.count))
+
+        lines.append('# HELP {}phase_bytes Bytes of the phases of the last run by course.'.format(PREFIX))
+        lines.append('# TYPE {}phase_bytes gauge'.format(PREFIX))
+        for (name, course), phase in phases:
+            if phase.bytes:
+                labels = 'phase="{}",course="{}"'.format(escape(name), escape(course))
+                lines.append('{}phase_bytes{{{}}} {}'.format(PREFIX, labels, phase.bytes))
+        return '\n'.join(lines) + '\n'
+
+
+class NoMetrics(Metrics):
+    """Metrics recording nothing, the default of the instrumented classes."""
+    def observe(self, name, seconds):
+        pass
+
+    def add_bytes(self, name, size):
+        pass
+
+
+def format_bound(bound):
+    """Format an upper bound of a bucket like Prometheus."""
+    return '+Inf' if bound == float('inf') else str(bound)
+
+
+def escape(value):
+    """Escape a label value of the Prometheus text format."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
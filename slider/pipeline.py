@@ -0,0 +1,149 @@
+"""Pipeline module for transferring files in stages.
+
+A file passes the stages probe, plan, fetch and store. Probes and fetches
+wait for the network and are run by pools of probers and fetchers, and a
+fetched content is hashed on the way in the thread of a Hasher. Planning
+and storing query and update the database, thus they run in the thread that
+feeds the pipeline, one file after another in the order the files were fed.
+Bounded windows connect the stages: a stage that is too far ahead of the
+next one waits for it, and so does a fetch that would exceed the bytes in
+flight. Without workers, every stage runs in the feeding thread right away.
+"""
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# jobs ahead of the next stage per worker
+WINDOW = 2
+# maximum number of bytes being fetched or waiting to be stored
+INFLIGHT = 1E8
+
+# kinds of the jobs between the stages
+JOB = 'job'
+NOTE = 'note'
+FAILED = 'failed'
+PLANNED = 'planned'
+FETCHING = 'fetching'
+
+
+def run(pool, function, job):
+    """Submit function of job to pool, or call it right away without a pool. Returns its future."""
+    if pool is not None:
+        return pool.submit(function, job)
+    future = Future()
+    try:
+        future.set_result(function(job))
+    except Exception as err:
+        future.set_exception(err)
+    return future
+
+
+class Pipeline:
+    """Pass jobs through the stages probe, plan, fetch and store.
+
+    probe(job) and fetch(job) are called by the workers, plan(job, probed)
+    and store(job, fetched) by the feeding thread in order. plan returns the
+    number of bytes to fetch or None if the job is not fetched, then store
+    gets None. Without probe, plan gets the job as probed. A job whose probe,
+    plan or fetch raised one of errors is passed to fail(job, err) instead
+    of store. A note is a callable fed in between the jobs, which is called
+    in order in the store stage, e.g. to print what happens in between.
+    """
+    def __init__(self, probe, plan, fetch, store, fail, errors, probers=0, fetchers=0, inflight=INFLIGHT):
+        self.probe = probe
+        self.plan = plan
+        self.fetch = fetch
+        self.store = store
+        self.fail = fail
+        self.errors = errors
+        self.probers = ThreadPoolExecutor(probers) if probers and probe is not None else None
+        self.fetchers = ThreadPoolExecutor(fetchers) if fetchers else None
+        self.probe_window = WINDOW * probers
+        self.fetch_window = WINDOW * fetchers
+        self.inflight = inflight
+        # jobs being probed and fetched in the order they were fed
+        self.probing = deque()
+        self.fetching = deque()
+        # bytes in flight and the most bytes in flight at a time
+        self.bytes = 0
+        self.peak = 0
+
+    def feed(self, job):
+        """Pass a job into the pipeline."""
+        future = run(self.probers, self.probe, job) if self.probe is not None else None
+        self.probing.append((job, JOB, future))
+        while len(self.probing) > self.probe_window:
+            self.advance()
+
+    def note(self, call):
+        """Call call once the jobs fed before are stored."""
+        self.probing.append((call, NOTE, None))
+        while len(self.probing) > self.probe_window:
+            self.advance()
+
+    def advance(self):
+        """Plan the first probed job and pass it on to the fetch stage."""
+        job, kind, future = self.probing.popleft()
+        if kind == NOTE:
+            self.schedule(job, NOTE)
+            return
+        try:
+            size = self.plan(job, future.result() if future is not None else job)
+        except self.errors as err:
+            self.schedule(job, FAILED, err)
+            return
+        if size is None:
+            self.schedule(job, PLANNED)
+        else:
+            self.schedule(job, FETCHING, size=size)
+
+    def schedule(self, job, kind, payload=None, size=0):
+        """Pass a job on to the fetch stage, fetching it if it is planned to,
+           once the bytes in flight allow it."""
+        if kind == FETCHING:
+            while self.fetching and self.bytes + size > self.inflight:
+                self.settle()
+            self.bytes += size
+            self.peak = max(self.peak, self.bytes)
+            payload = run(self.fetchers, self.fetch, job)
+        self.fetching.append((job, kind, payload, size))
+        while len(self.fetching) > self.fetch_window:
+            self.settle()
+
+    def settle(self):
+        """Store the first fetched job."""
+        job, kind, payload, size = self.fetching.popleft()
+        if kind == NOTE:
+            job()
+        elif kind == FAILED:
+            self.fail(job, payload)
+        elif kind == PLANNED:
+            self.store(job, None)
+        else:
+            try:
+                fetched = payload.result()
+            except self.errors as err:
+                self.fail(job, err)
+                return
+            finally:
+                self.bytes -= size
+            self.store(job, fetched)
+
+    def drain(self):
+        """Pass all jobs fed so far through the pipeline."""
+        while self.probing:
+            self.advance()
+        while self.fetching:
+            self.settle()
+
+    def close(self):
+        """Wait for the workers and stop them."""
+        for pool in (self.probers, self.fetchers):
+            if pool is not None:
+                pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,194 @@
+"""Profiling module for finding out where a run spends its time and memory.
+
+A Profiler runs cProfile in the thread that starts it and traces the
+allocations with tracemalloc, while a sampler thread records the stacks of
+all threads at an interval and snapshots the allocations whenever the traced
+memory reaches a new peak. Samples and allocations are tagged with the
+innermost stage they happened in, a stage being a set of functions and
+modules. The results are the cProfile stats, the sampled stacks collapsed
+into the input format of flamegraph.pl, each rooted at its stage, and a
+report of the samples by stage and the top allocations at the peak.
+"""
+
+from collections import Counter
+import cProfile
+import dis
+import inspect
+import io
+import marshal
+import pstats
+import sys
+import threading
+import tracemalloc
+
+import util
+
+# seconds between two samples of the stacks
+INTERVAL = 0.005
+# frames kept of the traceback of every traced allocation
+FRAMES = 32
+# factor the traced memory grows by until its peak is snapshotted again
+PEAK_GROWTH = 1.1
+# number of functions and allocations in the report
+TOP = 20
+# stage of the samples and allocations outside of every stage
+OTHER = 'other'
+
+
+class Stages:
+    """The stages by the code of their functions and the files of their modules."""
+    def __init__(self, stages):
+        self.codes = {}
+        self.files = {}
+        # the lines of the functions by file, to tag the frames of tracemalloc
+        self.spans = {}
+        for stage, targets in stages.items():
+            for target in targets:
+                if inspect.ismodule(target):
+                    self.files[target.__file__] = stage
+                    continue
+                code = target.__code__
+                self.codes[code] = stage
+                lines = [line for _, line in dis.findlinestarts(code) if line is not None]
+                self.spans.setdefault(code.co_filename, []).append((code.co_firstlineno, max(lines), stage))
+
+    def of_code(self, code):
+        """Return the stage of the function with code or None."""
+        return self.codes.get(code) or self.files.get(code.co_filename)
+
+    def of_line(self, filename, lineno):
+        """Return the stage of a line of a file or None."""
+        for first, last, stage in self.spans.get(filename, ()):
+            if first <= lineno <= last:
+                return stage
+        return self.files.get(filename)
+
+    def of_traceback(self, traceback):
+        """Return the innermost stage of a tracemalloc traceback."""
+        for frame in reversed(traceback):
+            stage = self.of_line(frame.filename, frame.lineno)
+            if stage is not None:
+                return stage
+        return OTHER
+
+
+def label(code):
+    """Return the label of the function with code in a collapsed stack."""
+    return '{}:{}'.format(code.co_filename.rsplit('/', 1)[-1], code.co_name)
+
+
+class Profiler:
+    """Profile the enclosed block, tagging the samples and allocations by stages,
+       a dict of the functions and modules of every stage by its name.
+
+    The samples of other threads than the profiled one are only kept
+    within a stage, such that idle workers do not drown the stages.
+    """
+    def __init__(self, stages, interval=INTERVAL):
+        self.stages = Stages(stages)
+        self.interval = interval
+        self.profile = cProfile.Profile()
+        self.thread = threading.get_ident()
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        # collapsed stacks and samples by stage
+        self.stacks = Counter()
+        self.samples = Counter()
+        self.peak = 0
+        self.snapshot = None
+
+    def start(self):
+        """Start profiling the calling thread and sampling all threads."""
+        tracemalloc.start(FRAMES)
+        self.sampler.start()
+        self.profile.enable()
+
+    def stop(self):
+        """Stop profiling."""
+        self.profile.disable()
+        self.stopped.set()
+        self.sampler.join()
+        self.snapshot_peak()
+        tracemalloc.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def sample(self):
+        """Sample the stacks of all threads until profiling stops."""
+        sampler = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident != sampler:
+                    self.record(ident, frame)
+            self.snapshot_peak()
+
+    def record(self, ident, frame):
+        """Count the stack of a thread ending in frame."""
+        stage = None
+        labels = []
+        while frame is not None:
+            if stage is None:
+                stage = self.stages.of_code(frame.f_code)
+            labels.append(label(frame.f_code))
+            frame = frame.f_back
+        if stage is None:
+            if ident != self.thread:
+                return
+            stage = OTHER
+        labels.append(stage)
+        self.stacks[';'.join(reversed(labels))] += 1
+        self.samples[stage] += 1
+
+    def snapshot_peak(self):
+        """Snapshot the traced allocations if the traced memory reached a new peak."""
+        current, _ = tracemalloc.get_traced_memory()
+        if current > self.peak * PEAK_GROWTH:
+            self.peak = current
+            # leave out the samples of the profiler itself
+            self.snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, __file__)])
+
+    def collapsed(self):
+        """Return the sampled stacks in the collapsed format of flamegraph.pl."""
+        return ''.join('{} {}\n'.format(stack, count) for stack, count in sorted(self.stacks.items()))
+
+    def report(self):
+        """Return the report of the samples and the top allocations at the peak by stage
+           and the top functions of the profiled thread."""
+        out = io.StringIO()
+        total = sum(self.samples.values()) or 1
+        print('Samples every {:.0f} ms by stage:'.format(self.interval * 1000), file=out)
+        for stage, count in self.samples.most_common():
+            print('  {:<16} {:>8} {:>6.1f}%'.format(stage, count, 100 * count / total), file=out)
+
+        statistics = self.snapshot.statistics('traceback')
+        sizes = Counter()
+        for statistic in statistics:
+            sizes[self.stages.of_traceback(statistic.traceback)] += statistic.size
+        print('\nAllocations at the peak of {} by stage:'.format(util.format_size(self.peak)), file=out)
+        for stage, size in sizes.most_common():
+            print('  {:<16} {:>10}'.format(stage, util.format_size(size)), file=out)
+        print('\nTop {} allocations at the peak:'.format(TOP), file=out)
+        for statistic in statistics[:TOP]:
+            frame = statistic.traceback[-1]
+            print('  {:>10} {:>8} blocks  {:<16} {}:{}'.format(
+                util.format_size(statistic.size), statistic.count, self.stages.of_traceback(statistic.traceback),
+                frame.filename, frame.lineno), file=out)
+
+        print('\nTop {} functions of the profiled thread by cumulative time:'.format(TOP), file=out)
+        pstats.Stats(self.profile, stream=out).sort_stats('cumulative').print_stats(TOP)
+        return out.getvalue()
+
+    def results(self):
+        """Return the contents of the profile files by file ending: the cProfile
+           stats, the collapsed stacks and the report."""
+        self.profile.create_stats()
+        return {
+            'prof': marshal.dumps(self.profile.stats),
+            'folded': self.collapsed().encode('utf-8'),
+            'txt': self.report().encode('utf-8')
+        }
@@ -1,32 +1,233 @@
 """Handler module for requests and user specific configuration data."""
 
+from collections import deque
+from contextlib import contextmanager, ExitStack
 from datetime import datetime
+import json
+import os
 import re
 import smtplib
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
 
 import requests
+from requests.cookies import create_cookie
+from requests.exceptions import RequestException  # noqa: F401, raised to the crawler
 
+from metrics import NoMetrics, timed
+from transport import RETRIES, TIMEOUT, TokenBucket, Transport
+
+# base URL of Ilias
+ILIAS_BASE = 'https://ilias.uni-mannheim.de/'
 # URL for accessing Ilias
 ILIAS_URL = 'https://cas.uni-mannheim.de/cas/login?' \
-            'service=https://ilias.uni-mannheim.de/ilias.php?' \
+            'service=' + ILIAS_BASE + 'ilias.php?' \
             'baseClass=ilPersonalDesktopGUI&cmd=jumpToSelectedItems'
 
+# chunk size for streaming downloads
+CHUNK = 1024 * 1024
+
+# maximum number of concurrent requests against a single host
+HOST_LIMIT = 4
+
+# the response to a failed login is 200 - OK, thus it is recognized by this message
+AUTH_FAILED_MSG = 'Anmeldedaten wurden nicht akzeptiert'
+# the field of the login ticket, by which the CAS login form is recognized
+LOGIN_FIELD = 'name="lt"'
+
+# attributes of a cookie kept in the session file
+COOKIE_FIELDS = ('name', 'value', 'domain', 'path', 'secure', 'expires')
+
+
+class HostSlots:
+    """The slots of the concurrent requests against a host, at most limit at a time.
+
+    A caller may take several slots at once, e.g. for the ranges of a
+    download, instead of taking them one after another while holding some,
+    which could deadlock. Callers take their slots in turn, such that one
+    waiting for several is not starved by those taking one.
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        self.free = limit
+        self.turn = threading.Lock()
+        self.released = threading.Condition()
+
+    @contextmanager
+    def take(self, count=1):
+        """Hold count slots, at most all of them, for the enclosed block."""
+        count = min(count, self.limit)
+        with self.turn, self.released:
+            self.released.wait_for(lambda: self.free >= count)
+            self.free -= count
+        try:
+            yield
+        finally:
+            with self.released:
+                self.free += count
+                self.released.notify_all()
+
 
 class RequestHandler:
-    """Handler Class for the HTTP requests."""
-    def __init__(self, user, password):
+    """Handler Class for the HTTP requests.
+
+    All requests are sent with one session over a Transport, which limits
+    them to rate requests per second if a rate is given. Except for the
+    login, they are sent within the HOST_LIMIT slots of their host, see
+    host_slot. workers is the number of threads sending requests. If a
+    session_path is given, the cookies of the session are kept there
+    between runs.
+    """
+    def __init__(self, user, password, workers=1, base_url=ILIAS_BASE, login_url=ILIAS_URL, metrics=None,
+                 rate=None, timeout=TIMEOUT, retries=RETRIES, session_path=None):
+        self.metrics = metrics or NoMetrics()
+        self.base_url = base_url
+        self.login_url = login_url
+        # the page CAS redirects to after the login
+        self.desktop_url = login_url.split('service=', 1)[-1]
+        self.authenticated = False
+        # whether the last call of desktop reused the session instead of logging in
+        self.reused = False
         self.session = requests.Session()
+        self.session_path = session_path
+        # number of sent requests and their times within the last hour
+        self.requests = 0
+        self.sent = deque()
+        self.session.hooks['response'].append(self.count_request)
+        # keep a connection alive for every request within the host slots and for the login
+        bucket = TokenBucket(rate) if rate else None
+        transport = Transport(min(workers, HOST_LIMIT) + 1, timeout, retries, bucket=bucket)
+        self.session.mount('https://', transport)
+        self.session.mount('http://', transport)
+        self.host_slots = {}
+        self.host_lock = threading.Lock()
         self.username = user
         self.password = password
         self.mail = self.username + '@mail.uni-mannheim.de'
+        self.load_session()
+
+    def load_session(self):
+        """Restore the cookies of the stored session, which is assumed to be
+           authenticated until the personal desktop shows otherwise."""
+        if self.session_path is None or not os.path.exists(self.session_path):
+            return
+        try:
+            with open(self.session_path) as f:
+                cookies = json.load(f)
+        except ValueError:
+            return
+        for cookie in cookies:
+            self.session.cookies.set_cookie(create_cookie(**cookie))
+        self.authenticated = bool(cookies)
+
+    def save_session(self):
+        """Store the cookies of the session, readable and writable by the user only."""
+        if self.session_path is None:
+            return
+        cookies = [{field: getattr(cookie, field) for field in COOKIE_FIELDS} for cookie in self.session.cookies]
+        folder = os.path.dirname(self.session_path) or '.'
+        os.makedirs(folder, exist_ok=True)
+        # mkstemp creates the file with mode 0600, replacing keeps the stored session whole
+        fd, tmp = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(cookies, f)
+        os.replace(tmp, self.session_path)
+
+    def count_request(self, response, *args, **kwargs):
+        """Count a request of the session, called for every response including redirects."""
+        with self.host_lock:
+            self.requests += 1
+            self.sent.append(time.monotonic())
+
+    def requests_within(self, seconds):
+        """Return the number of requests sent within the last seconds, at most an hour."""
+        limit = time.monotonic() - seconds
+        with self.host_lock:
+            while self.sent and self.sent[0] < time.monotonic() - 3600:
+                self.sent.popleft()
+            return sum(1 for sent in self.sent if sent >= limit)
+
+    def host_slot(self, url, count=1):
+        """Return a context manager holding count of the slots limiting
+           the concurrent requests against the host of url."""
+        host = urlparse(url).netloc
+        with self.host_lock:
+            if host not in self.host_slots:
+                self.host_slots[host] = HostSlots(HOST_LIMIT)
+            return self.host_slots[host].take(count)
+
+    @timed('listing')
+    def get_page(self, url):
+        """HTTP GET request for the HTML text of a page within the per host limit."""
+        with self.host_slot(url):
+            response = self.session.get(url)
+        self.metrics.add_bytes('listing', len(response.content))
+        return response.text
+
+    @timed('probe')
+    def head(self, url):
+        """HTTP HEAD request for the headers of the file at url, as sent without compression,
+           within the per host limit. Raises HTTPError if the server answers with an error,
+           also after the retries."""
+        with self.host_slot(url):
+            response = self.session.head(url, headers={'Accept-Encoding': 'identity'})
+        response.raise_for_status()
+        return response
+
+    @contextmanager
+    def stream(self, url, headers=None, held=False):
+        """HTTP GET request whose body is streamed, to be used as context manager.
+
+        The request holds a host slot until the response is closed, unless
+        the caller holds one for it (held). Raises HTTPError if the server
+        still answers with a server error after the retries, client errors
+        are left to the caller, e.g. to a Range request which cannot be satisfied.
+        """
+        with ExitStack() as stack:
+            if not held:
+                stack.enter_context(self.host_slot(url))
+            response = stack.enter_context(self.session.get(url, headers=headers, stream=True))
+            if response.status_code >= 500:
+                response.raise_for_status()
+            yield response
 
     def get_login_cookies(self):
         """HTTP GET request for getting cookies."""
-        response = requests.get(ILIAS_URL)
+        response = self.session.get(self.login_url)
         cookies = response.cookies
         lt = re.findall('(LT-.*?)\"', response.text)[0]
         return lt, cookies
 
+    def desktop(self):
+        """Return the HTML text of the personal desktop.
+
+        The session, also a stored one, is reused as long as it is
+        authenticated, otherwise, i.e. without a session or when the desktop
+        request ends on a login page, log in again and store the new session.
+        A desktop without courses is still a valid session.
+        """
+        if self.authenticated:
+            with self.metrics.phase('session'):
+                response = self.session.get(self.desktop_url)
+            self.reused = not self.login_page(response, self.desktop_url)
+            if self.reused:
+                return response.text
+        html_text = self.login().text
+        self.authenticated = AUTH_FAILED_MSG not in html_text
+        if self.authenticated:
+            self.save_session()
+        return html_text
+
+    @staticmethod
+    def login_page(response, url):
+        """Check whether the response to a request of url shows a login page, i.e. whether
+           it was redirected to another page or shows the CAS login form or a failed login."""
+        redirected = urlparse(response.url).path != urlparse(url).path
+        return redirected or LOGIN_FIELD in response.text or AUTH_FAILED_MSG in response.text
+
+    @timed('login')
     def login(self):
         """HTTP POST request to login and get
            the HTML response from Ilias for crawling."""
@@ -39,7 +240,7 @@ class RequestHandler:
             '_eventId': 'submit',
             'submit': 'Anmelden'
         }
-        response = self.session.post(ILIAS_URL, data=payload, cookies=cookies)
+        response = self.session.post(self.login_url, data=payload, cookies=cookies)
         return response
 
     def send_mail(self, subject, new_lst):
@@ -0,0 +1,95 @@
+"""Rules module for selecting what is crawled.
+
+The selection rules are given in the configuration as a dict RULES with
+the optional keys
+- exclude_courses: regular expressions of course titles not to crawl,
+  even if they are among COURSES,
+- exclude_folders: glob patterns of folder paths not to crawl, relative to
+  the download folder and without a trailing /, e.g. 'Course/Exercises*',
+- allow_endings and deny_endings: file endings to download only and never,
+- min_size and max_size: sizes in bytes a file must have at least and less.
+They are compiled once and evaluated on the listings, such that excluded
+folders and files are never requested. Listed sizes are rounded, thus a
+file whose listed size is close to a size limit is decided on its size
+after a request.
+"""
+
+import fnmatch
+import re
+
+RULE_KEYS = {'exclude_courses', 'exclude_folders', 'allow_endings', 'deny_endings', 'min_size', 'max_size'}
+# listed sizes are rounded, thus within this fraction of a size limit a file is decided after a request
+LISTED_PRECISION = 0.05
+
+
+def compile_any(patterns):
+    """Compile regular expressions into one matching any of them, None if there are none."""
+    patterns = list(patterns)
+    if not patterns:
+        return None
+    return re.compile('|'.join('(?:{})'.format(pattern) for pattern in patterns))
+
+
+def ending(file_ending):
+    """Normalize a file ending for comparison."""
+    return file_ending.strip().lstrip('.').lower()
+
+
+class Rules:
+    """The courses to crawl and the selection rules, compiled into one matcher.
+
+    The size rules include maxsize, the maximum size of a file to download.
+    """
+    def __init__(self, courses, rules=None, maxsize=None):
+        rules = rules or {}
+        unknown = set(rules) - RULE_KEYS
+        assert not unknown, 'Unknown selection rules: ' + ', '.join(sorted(unknown))
+
+        self.courses = [(name, re.compile(name)) for name in courses]
+        self.excluded_courses = compile_any(rules.get('exclude_courses', []))
+        self.excluded_folders = compile_any(fnmatch.translate(glob.rstrip('/'))
+                                            for glob in rules.get('exclude_folders', []))
+        allowed = rules.get('allow_endings')
+        self.allowed = {ending(e) for e in allowed} if allowed is not None else None
+        self.denied = {ending(e) for e in rules.get('deny_endings', [])}
+        self.min_size = rules.get('min_size')
+        sizes = [size for size in (rules.get('max_size'), maxsize) if size is not None]
+        self.max_size = min(sizes) if sizes else None
+
+    def course(self, title):
+        """Return the name in COURSES of the first course matching title or None."""
+        for name, pattern in self.courses:
+            if pattern.search(title) is not None:
+                return name
+        return None
+
+    def excludes_course(self, title):
+        """Check whether the course with title is excluded."""
+        return self.excluded_courses is not None and self.excluded_courses.search(title) is not None
+
+    def excludes_folder(self, folder_path):
+        """Check whether the folder at folder_path is excluded."""
+        return self.excluded_folders is not None and self.excluded_folders.match(folder_path.rstrip('/')) is not None
+
+    def excludes_file(self, item):
+        """Return why the file of a ListingItem is excluded, i.e. 'file_skiped' for its size
+           or 'excluded' for its ending, or None. Unlisted properties and listed sizes
+           close to a size limit exclude nothing."""
+        if item.file_ending:
+            file_ending = ending(item.file_ending)
+            if file_ending in self.denied or self.allowed is not None and file_ending not in self.allowed:
+                return 'excluded'
+        if item.size is not None and not self.near_limit(item.size):
+            return self.excludes_size(item.size)
+        return None
+
+    def excludes_size(self, size):
+        """Return 'file_skiped' if a file of size bytes is excluded by the size rules, otherwise None."""
+        if self.max_size is not None and size >= self.max_size or self.min_size is not None and size < self.min_size:
+            return 'file_skiped'
+        return None
+
+    def near_limit(self, size):
+        """Check whether a listed size is too close to a size limit to decide on it."""
+        return any(abs(size - limit) <= LISTED_PRECISION * limit
+                   for limit in (self.min_size, self.max_size) if limit is not None)
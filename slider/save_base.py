@@ -1,5 +1,9 @@
 """Base class module for file saving functionalities."""
 
+from contextlib import contextmanager
+import tempfile
+
+from metrics import NoMetrics
 import util
 
 from abc import ABC, abstractmethod
@@ -8,9 +12,25 @@ from abc import ABC, abstractmethod
 class BaseSaver(ABC):
     """An abstract base class for saving files."""
     OVERW_FOLDER = '.overwritten/'
+    # whether the files are saved remotely, then the database is cached in the working
+    # directory and kept in sync with the saver by revision, download_file and upload_database
+    REMOTE = False
 
-    def __init__(self, base_path):
+    def __init__(self, base_path, metrics=None):
         self.base_path = util.bpath(base_path)
+        self.metrics = metrics or NoMetrics()
+        # path lookups answered from a cache and from the storage
+        self.hits = 0
+        self.misses = 0
+        # saved files whose content was stored already
+        self.deduplicated = 0
+
+    @classmethod
+    def from_secrets(cls, secrets, metrics=None, objects=False):
+        """Create the saver for the configuration secrets, saving into PATH.
+           objects asks for a content-addressed store, which only FileSaver offers."""
+        assert secrets.PATH != ''
+        return cls(secrets.PATH, metrics)
 
     @abstractmethod
     def exists(self, relative_path):
@@ -23,6 +43,30 @@ class BaseSaver(ABC):
         pass
 
     @abstractmethod
-    def save_file(self, relative_path, content, overwrite=False):
-        """Save the file."""
+    def save_file(self, relative_path, content, overwrite=False, content_hash=None):
+        """Save the file. The content is a bytes object, a file-like object or an iterator of bytes,
+           content_hash is the hash of the content if it is known."""
         pass
+
+    def refresh(self):
+        """Forget what is known about the storage and reset the counters,
+           such that changes from outside are seen in the next run of a long-running process."""
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+
+    def flush(self):
+        """Finish all deferred saves, returns the relative paths of the files that failed to save."""
+        return []
+
+    def upload_database(self, relative_path, content):
+        """Save the database file content at relative_path, replacing the file there,
+           returns whether it was saved."""
+        return self.save_file(relative_path, content, overwrite=True)
+
+    @contextmanager
+    def staging_file(self, relative_path):
+        """Yield a temporary file to stream the content for relative_path into,
+           before it is passed to save_file. The file is removed afterwards."""
+        with tempfile.TemporaryFile() as staged:
+            yield staged
@@ -1,54 +1,217 @@
 """Module for Dropbox file saving."""
 
-import io
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import json
+import os
 import sys
+import tempfile
+import time
 
 from dropbox.exceptions import ApiError, AuthError
 import dropbox
 
+from database import DATABASE_FOLDER
+from metrics import timed
 from save_base import BaseSaver
 import util
 
-# chunk size for uploading large files to Dropbox
-CHUNK = 32 * 1024 * 1024
+# cache of the Dropbox namespace index, next to the cached database
+DROPBOX_INDEX = 'dropbox_index.json'
+# chunk size for uploading large files to Dropbox,
+# at most two chunks are held in memory at a time
+CHUNK = 8 * 1024 * 1024
+# number of concurrent upload sessions
+UPLOAD_WORKERS = 4
+# maximum number of uploads committed in one batch
+BATCH_SIZE = 1000
+# seconds between polling the status of a batch commit or folder creation
+POLL_INTERVAL = 1
 
 
 class DropboxSaver(BaseSaver):
-    """A class for operations on files, handling the interaction with Dropbox."""
-    def __init__(self, base_path, token):
-        super().__init__(base_path)
+    """A class for operations on files, handling the interaction with Dropbox.
+
+    Staged files are uploaded in upload sessions by a pool of workers,
+    streaming them from disk, and committed together in batches.
+
+    Instead of asking Dropbox for the metadata of every path, an index of
+    all paths below the base path and the revisions of its files is kept.
+    It is listed once and then updated with the changes since the cursor
+    of the last run, which is cached in index_path if it is given.
+    """
+    REMOTE = True
+
+    def __init__(self, base_path, token, index_path=None, metrics=None):
+        super().__init__(base_path, metrics)
         assert token != ''
         self.token = token
         self.dbx = dropbox.Dropbox(token, timeout=180)
+        self.staged = set()
+        # folders to be created in a batch
+        self.pending_folders = set()
+        self.pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS)
+        # relative paths and futures of the upload sessions to be committed
+        self.pending = []
+        self.failed = []
+        # revisions of the files and None for the folders by lower case path
+        self.index = {}
+        self.index_path = index_path
+        self.cursor = None
 
         try:
             self.dbx.users_get_current_account()
         except AuthError:
             print('Invalid Dropbox access token.')
             sys.exit(1)
+        self.load_index()
+
+    @classmethod
+    def from_secrets(cls, secrets, metrics=None, objects=False):
+        """Create the saver for the configuration secrets, saving into PATH_IN_DB with DROPBOX_TOKEN.
+           The index is cached in the database folder of the working directory."""
+        assert secrets.PATH_IN_DB != ''
+        index_path = util.bpath(os.getcwd()) + DATABASE_FOLDER + DROPBOX_INDEX
+        return cls(secrets.PATH_IN_DB, secrets.DROPBOX_TOKEN, index_path, metrics)
+
+    @timed('index')
+    def load_index(self, cached=True):
+        """Build the index of all paths below the base path, starting
+           from the cached index and cursor of the last run if cached and possible."""
+        if cached and self.index_path is not None and os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                cache = json.load(f)
+            if cache.get('base_path') == self.base_path:
+                self.index = cache['index']
+                self.cursor = cache['cursor']
+
+        try:
+            if self.cursor is not None:
+                result = self.dbx.files_list_folder_continue(self.cursor)
+            else:
+                result = self.dbx.files_list_folder(util.dbpath(self.base_path), recursive=True)
+        except ApiError as err:
+            # cursor expired, list all paths again
+            if self.cursor is not None:
+                self.index, self.cursor = {}, None
+                return self.load_index(cached=False)
+            # base path does not exist yet
+            if err.error.is_path() and err.error.get_path().is_not_found():
+                return
+            raise
+
+        while True:
+            self.update_index(result.entries)
+            if not result.has_more:
+                break
+            result = self.dbx.files_list_folder_continue(result.cursor)
+        self.cursor = result.cursor
+
+    def update_index(self, entries):
+        """Apply the metadata of listed entries to the index in their order.
+           Consecutive deletions are removed together in one pass over the index."""
+        deleted = set()
+        for entry in entries:
+            if isinstance(entry, dropbox.files.DeletedMetadata):
+                deleted.add(entry.path_lower)
+                continue
+            # a path may be deleted and added again within the entries
+            self.remove_index(deleted)
+            deleted = set()
+            if isinstance(entry, dropbox.files.FileMetadata):
+                self.add_index(entry.path_lower, entry.rev)
+            else:
+                self.add_index(entry.path_lower, None)
+        self.remove_index(deleted)
+
+    def remove_index(self, deleted):
+        """Remove the paths in deleted and all paths below them from the index."""
+        if not deleted:
+            return
+
+        def removed(path):
+            while path not in deleted:
+                parent = os.path.dirname(path)
+                if parent == path:
+                    return False
+                path = parent
+            return True
+        self.index = {path: rev for path, rev in self.index.items() if not removed(path)}
+
+    def add_index(self, path, rev=None):
+        """Add a path and all its parent folders below the base path to the index.
+           Pending parent folders no longer need to be created on their own."""
+        path = path.lower()
+        self.index[path] = rev
+        base = util.dbpath(self.base_path).lower()
+        parent = os.path.dirname(path)
+        while parent.startswith(base + '/') and parent not in self.index:
+            self.index[parent] = None
+            parent = os.path.dirname(parent)
+        if self.pending_folders:
+            self.pending_folders = {p for p in self.pending_folders if not path.startswith(p.lower() + '/')}
+
+    def refresh(self):
+        """Update the index with the changes since the last run and reset the counters."""
+        super().refresh()
+        self.load_index()
+
+    def save_index(self):
+        """Cache the index and the cursor for the next run."""
+        if self.index_path is None:
+            return
+        # base path was created by this run
+        if self.cursor is None:
+            try:
+                self.cursor = self.dbx.files_list_folder_get_latest_cursor(
+                    util.dbpath(self.base_path), recursive=True).cursor
+            except ApiError:
+                return
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        with open(self.index_path, 'w') as f:
+            json.dump({'base_path': self.base_path, 'cursor': self.cursor, 'index': self.index}, f)
 
     def exists(self, relative_path):
         """Check whether a file or a folder already exists at the given path relative in Dropbox."""
         path = util.dbpath(self.base_path + util.rpath(relative_path))
+        return path.lower() in self.index
 
-        try:
-            self.dbx.files_get_metadata(path)
-        except ApiError:
-            return False
-        return True
-
+    @timed('folder')
     def create_folder(self, relative_path):
-        """Creating a folder at the given path in Dropbox."""
+        """Creating a folder at the given path in Dropbox.
+
+        The folder is created with the next batch, see flush,
+        unless an upload into the folder creates it before.
+        """
         if not self.exists(relative_path):
             path = util.dbpath(self.base_path + util.rpath(relative_path))
-            self.dbx.files_create_folder_v2(path=path, autorename=False)
+            self.pending_folders.add(path)
+            self.add_index(path)
 
-    def save_file(self, relative_path, content, mute=False, overwrite=False):
-        """Save the file in Dropbox by uploading it with the Dropbox API."""
-        path = util.dbpath(self.base_path + util.rpath(relative_path))
+    @contextmanager
+    def staging_file(self, relative_path):
+        """Yield a temporary file to stream the content for relative_path into.
+           If it is passed to save_file, it is removed once it is uploaded,
+           otherwise it is removed afterwards."""
+        staged = tempfile.NamedTemporaryFile(prefix='slider-', suffix='.part', delete=False)
+        self.staged.add(staged.name)
+        try:
+            with staged:
+                yield staged
+        finally:
+            if staged.name in self.staged:
+                self.staged.discard(staged.name)
+                os.remove(staged.name)
 
-        file_size = len(content)
-        large_file = file_size > CHUNK
+    @timed('save')
+    def save_file(self, relative_path, content, mute=False, overwrite=False, content_hash=None):
+        """Save the file in Dropbox by uploading it with the Dropbox API.
+
+        A staged file is uploaded in the background and committed with the
+        next batch, see flush. Other content is read in chunks of size CHUNK,
+        if it exceeds one chunk it is uploaded in an upload session.
+        """
+        path = util.dbpath(self.base_path + util.rpath(relative_path))
 
         # handle potential overwriting
         if not overwrite:  # default
@@ -56,45 +219,153 @@ class DropboxSaver(BaseSaver):
         else:  # allow overwriting
             upload_mode = dropbox.files.WriteMode.overwrite
 
-        # if file exists and it should not be overwritten or it is a large file
+        # if file exists and it should not be overwritten
         # move it to the overwritten folder to avoid overwriting the existing file
-        if self.exists(relative_path) and (not overwrite or large_file):
+        if not overwrite and self.exists(relative_path):
             try:
                 self.move_file(relative_path, BaseSaver.OVERW_FOLDER + relative_path)
             except ApiError as err:
                 print('Moving {} failed due to:\n{}\n'.format(path, err))
                 return False
 
+        commit = dropbox.files.CommitInfo(path=path, mode=upload_mode, mute=mute)
+
+        # staged file is uploaded by the pool and committed in a batch
+        if getattr(content, 'name', None) in self.staged:
+            content.flush()
+            self.staged.discard(content.name)
+            self.pending.append((relative_path, self.pool.submit(self.upload_session, content.name, commit)))
+            if len(self.pending) >= BATCH_SIZE:
+                self.failed.extend(self.commit_pending())
+            return True
+
+        # look one chunk ahead to know whether it is a large file
+        chunks = util.iter_chunks(content, CHUNK)
+        chunk = next(chunks, b'')
+        following = next(chunks, None)
+        large_file = following is not None
+
         try:
             # file is uploaded as a whole
             if not large_file:
-                self.dbx.files_upload(content, path, mute=mute, mode=upload_mode)
+                metadata = self.dbx.files_upload(chunk, path, mute=mute, mode=upload_mode)
+                self.add_index(path, metadata.rev)
                 return True
 
             # file exceeds size CHUNK, upload in smaller chunks
             else:
-                f = io.BytesIO(content)
-                result = self.dbx.files_upload_session_start(f.read(CHUNK))
-                cursor = dropbox.files.UploadSessionCursor(session_id=result.session_id, offset=f.tell())
-                commit = dropbox.files.CommitInfo(path=path)
-
-                while f.tell() < int(file_size):
-                    if (int(file_size) - f.tell()) <= CHUNK:
-                        self.dbx.files_upload_session_finish(f.read(CHUNK), cursor, commit)
-                        return True
-                    else:
-                        self.dbx.files_upload_session_append(f.read(CHUNK), cursor.session_id, cursor.offset)
-                        cursor.offset = f.tell()
+                result = self.dbx.files_upload_session_start(chunk)
+                cursor = dropbox.files.UploadSessionCursor(session_id=result.session_id, offset=len(chunk))
+
+                for chunk in chunks:
+                    self.dbx.files_upload_session_append(following, cursor.session_id, cursor.offset)
+                    cursor.offset += len(following)
+                    following = chunk
+                metadata = self.dbx.files_upload_session_finish(following, cursor, commit)
+                self.add_index(path, metadata.rev)
+                return True
 
         except ApiError as err:
             print('Uploading {} failed due to:\n{}\n'.format(path, err))
             return False
 
+    def upload_session(self, file_path, commit):
+        """Upload the local file at file_path in a closed upload session,
+           remove the file and return the argument to commit the session."""
+        try:
+            with open(file_path, 'rb') as f:
+                chunk = f.read(CHUNK)
+                following = f.read(CHUNK)
+                result = self.dbx.files_upload_session_start(chunk, close=not following)
+                cursor = dropbox.files.UploadSessionCursor(session_id=result.session_id, offset=len(chunk))
+                while following:
+                    chunk, following = following, f.read(CHUNK)
+                    self.dbx.files_upload_session_append_v2(chunk, cursor, close=not following)
+                    cursor.offset += len(chunk)
+            return dropbox.files.UploadSessionFinishArg(cursor=cursor, commit=commit)
+        finally:
+            os.remove(file_path)
+
+    def commit_pending(self):
+        """Wait for the pending upload sessions and commit them in one batch.
+           Returns the relative paths of the files that failed to upload."""
+        pending, self.pending = self.pending, []
+        failed, committed, entries = [], [], []
+        for relative_path, future in pending:
+            try:
+                entries.append(future.result())
+                committed.append(relative_path)
+            except (ApiError, IOError) as err:
+                print('Uploading {} failed due to:\n{}\n'.format(relative_path, err))
+                failed.append(relative_path)
+        if not entries:
+            return failed
+
+        try:
+            launch = self.dbx.files_upload_session_finish_batch(entries)
+            if launch.is_async_job_id():
+                status = self.dbx.files_upload_session_finish_batch_check(launch.get_async_job_id())
+                while status.is_in_progress():
+                    time.sleep(POLL_INTERVAL)
+                    status = self.dbx.files_upload_session_finish_batch_check(launch.get_async_job_id())
+                result = status.get_complete()
+            else:
+                result = launch.get_complete()
+        except ApiError as err:
+            print('Committing {} uploads failed due to:\n{}\n'.format(len(entries), err))
+            return failed + committed
+
+        for relative_path, entry in zip(committed, result.entries):
+            if entry.is_failure():
+                print('Uploading {} failed due to:\n{}\n'.format(relative_path, entry.get_failure()))
+                failed.append(relative_path)
+            else:
+                metadata = entry.get_success()
+                self.add_index(metadata.path_lower, metadata.rev)
+        return failed
+
+    def create_pending_folders(self):
+        """Create the folders that were not created by uploads in one batch."""
+        paths, self.pending_folders = sorted(self.pending_folders), set()
+        if not paths:
+            return
+        try:
+            launch = self.dbx.files_create_folder_batch(paths, autorename=False)
+            if launch.is_async_job_id():
+                status = self.dbx.files_create_folder_batch_check(launch.get_async_job_id())
+                while status.is_in_progress():
+                    time.sleep(POLL_INTERVAL)
+                    status = self.dbx.files_create_folder_batch_check(launch.get_async_job_id())
+        except ApiError as err:
+            print('Creating {} folders failed due to:\n{}\n'.format(len(paths), err))
+
+    @timed('flush')
+    def flush(self):
+        """Commit all pending uploads and create all pending folders,
+           returns the relative paths of the files that failed to upload."""
+        failed, self.failed = self.failed + self.commit_pending(), []
+        self.create_pending_folders()
+        self.save_index()
+        return failed
+
+    def revision(self, relative_path):
+        """Return the revision of the file at the given relative path in Dropbox
+           or None if it does not exist."""
+        path = util.dbpath(self.base_path + util.rpath(relative_path))
+        return self.index.get(path.lower())
+
+    def upload_database(self, relative_path, content):
+        """Upload the database file content to relative_path without notifying the user,
+           replacing the file there, returns whether it was saved."""
+        return self.save_file(relative_path, content, mute=True, overwrite=True)
+
     def move_file(self, relative_from_path, relative_to_path):
         """Move a file from relative_from_path to relative_to_path."""
         fr = util.dbpath(self.base_path + util.rpath(relative_from_path))
         to = util.dbpath(self.base_path + util.rpath(relative_to_path))
-        self.dbx.files_move(fr, to, autorename=True)
+        metadata = self.dbx.files_move(fr, to, autorename=True)
+        self.index.pop(fr.lower(), None)
+        self.update_index([metadata])
 
     def download_file(self, relative_download_path, destination_path):
         """Download a file located at relative_download_path and
@@ -105,4 +376,5 @@ class DropboxSaver(BaseSaver):
         # download file
         with open(dest, 'wb') as f:
             metadata, res = self.dbx.files_download(down)
-            f.write(res.content)
+            for chunk in res.iter_content(CHUNK):
+                f.write(chunk)
@@ -1,41 +1,281 @@
 """Module for local file system saving."""
 
+from contextlib import contextmanager
 import os
 import shutil
+import tempfile
 
+from metrics import timed
 from save_base import BaseSaver
 import util
 
+# chunk size for copying file contents
+CHUNK = 1024 * 1024
+# content-addressed store of the saved files, by content hash
+OBJECTS_FOLDER = '.objects/'
+
 
 class FileSaver(BaseSaver):
-    """A class for operations on files, handling the interaction with the local filesystem."""
-    def __init__(self, base_path):
-        super().__init__(base_path)
+    """A class for operations on files, handling the interaction with the local filesystem.
+
+    Instead of a stat call for every lookup, the paths below the base path
+    are cached for the run. The top level is listed on the first lookup and
+    every top level folder, i.e. a course, is walked once when it is first
+    touched. The saver keeps the cache up to date with what it writes and
+    moves, and counts the lookups answered from the cache as hits.
+
+    With objects, every content is stored once in OBJECTS_FOLDER by its
+    hash and the saved paths are hardlinks to it, such that a content saved
+    again, e.g. after the database was reset, takes neither space nor writes.
+    """
+    def __init__(self, base_path, metrics=None, objects=False):
+        super().__init__(base_path, metrics)
+        self.objects = objects
+        self.staged = set()
+        # whether a path is a folder by relative path without trailing /
+        self.known = {}
+        # folders whose contents are all known
+        self.listed = set()
+        # top level folders that were walked
+        self.scanned = set()
+        # temporary files are private, saved files get the default permissions
+        umask = os.umask(0)
+        os.umask(umask)
+        self.file_mode = 0o666 & ~umask
+
+    @classmethod
+    def from_secrets(cls, secrets, metrics=None, objects=False):
+        """Create the saver for the configuration secrets, saving into PATH."""
+        assert secrets.PATH != ''
+        return cls(secrets.PATH, metrics, objects)
+
+    def refresh(self):
+        """Forget the cached paths and reset the counters."""
+        super().refresh()
+        self.known = {}
+        self.listed = set()
+        self.scanned = set()
+
+    @staticmethod
+    def key(relative_path):
+        """Return the cache key of a relative path."""
+        return util.rpath(relative_path).rstrip('/')
+
+    def scan(self, folder, recursive):
+        """Add the contents of a folder to the cache, walking it if recursive.
+           Symbolic links to folders are not followed, their contents stay unknown."""
+        folders = [folder]
+        while folders:
+            folder = folders.pop()
+            try:
+                with os.scandir(self.base_path + folder) as entries:
+                    for entry in entries:
+                        path = folder + '/' + entry.name if folder else entry.name
+                        if entry.is_dir():
+                            self.known[path] = True
+                            if recursive and not entry.is_symlink():
+                                folders.append(path)
+                        elif entry.is_file():
+                            self.known[path] = False
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            else:
+                self.known[folder] = True
+            # a missing folder is known to be empty
+            self.listed.add(folder)
 
     def exists(self, relative_path):
         """Check whether a file or a folder already exists at the given relative path."""
-        path = self.base_path + util.rpath(relative_path)
-        return os.path.exists(path)
+        path = self.key(relative_path)
+        if '' not in self.listed:
+            self.scan('', recursive=False)
+        top = path.split('/')[0]
+        if self.known.get(top) and top not in self.scanned:
+            self.scanned.add(top)
+            self.scan(top, recursive=True)
+
+        exists = self.lookup(path)
+        if exists is not None:
+            self.hits += 1
+            return exists
+        self.misses += 1
+        return os.path.exists(self.base_path + path)
+
+    def lookup(self, path):
+        """Return whether a path exists according to the cache or None if it is unknown."""
+        if path in self.known:
+            return True
+        while path:
+            parent = os.path.dirname(path)
+            # missing in a listed folder or below a file
+            if parent in self.listed or self.known.get(parent) is False:
+                return False
+            if parent in self.known:
+                return None
+            path = parent
+        return None
+
+    def remember(self, relative_path, is_folder):
+        """Add a path written by the saver and its parent folders to the cache."""
+        path = self.key(relative_path)
+        self.known[path] = is_folder
+        parent = os.path.dirname(path)
+        while parent and parent not in self.known:
+            self.known[parent] = True
+            parent = os.path.dirname(parent)
+
+    def forget(self, relative_path):
+        """Remove a path moved away by the saver from the cache."""
+        self.known.pop(self.key(relative_path), None)
 
+    @timed('folder')
     def create_folder(self, relative_path):
         """Creating a folder at the given relative path."""
         if not self.exists(relative_path):
             path = self.base_path + util.rpath(relative_path)
             os.makedirs(path)
+            # new folders are empty
+            key = self.key(relative_path)
+            while key not in self.known:
+                self.known[key] = True
+                self.listed.add(key)
+                if not key:
+                    break
+                key = os.path.dirname(key)
 
-    def save_file(self, relative_path, content, overwrite=False):
-        """Save the file locally."""
+    @contextmanager
+    def staging_file(self, relative_path):
+        """Yield a temporary file next to the destination of relative_path.
+           If it is passed to save_file, it is renamed to its destination,
+           otherwise it is removed afterwards."""
+        folder = os.path.dirname(self.base_path + util.rpath(relative_path))
+        staged = tempfile.NamedTemporaryFile(dir=folder, prefix='.', suffix='.part', delete=False)
+        self.staged.add(staged.name)
+        try:
+            with staged:
+                yield staged
+        finally:
+            self.staged.discard(staged.name)
+            if os.path.exists(staged.name):
+                os.remove(staged.name)
+
+    @timed('save')
+    def save_file(self, relative_path, content, overwrite=False, content_hash=None):
+        """Save the file locally.
+
+        The content is written to a temporary file next to the destination
+        which is then atomically renamed, such that an interrupted run never
+        leaves a truncated file behind. Staged files are renamed directly.
+        In the object store, the content is stored by its content_hash and
+        linked to its destination.
+        """
         path = self.base_path + util.rpath(relative_path)
+        blob = self.object_path(content_hash) if self.objects and content_hash else None
 
-        # move file instead of overwriting it
-        if self.exists(relative_path) and not overwrite:
-            to = self.base_path + util.rpath(BaseSaver.OVERW_FOLDER + relative_path)
-            shutil.move(path, to)
+        # move file instead of overwriting it, unless it has the same content already
+        if self.exists(relative_path) and not overwrite and not self.same_object(path, blob):
+            relative_to = BaseSaver.OVERW_FOLDER + util.rpath(relative_path)
+            self.create_folder(os.path.dirname(relative_to))
+            shutil.move(path, self.base_path + relative_to)
+            self.forget(relative_path)
+            self.remember(relative_to, False)
 
         # save file
-        with open(path, 'wb') as file:
-            try:
-                file.write(content)
+        try:
+            if blob is not None:
+                if not self.store(blob, content):
+                    return False
+                self.link(blob, path)
+                self.remember(relative_path, False)
                 return True
+
+            if getattr(content, 'name', None) in self.staged:
+                content.flush()
+                os.chmod(content.name, self.file_mode)
+                os.replace(content.name, path)
+                self.remember(relative_path, False)
+                return True
+
+            folder = os.path.dirname(path)
+            with tempfile.NamedTemporaryFile(dir=folder, prefix='.', suffix='.part', delete=False) as file:
+                try:
+                    for chunk in util.iter_chunks(content, CHUNK):
+                        file.write(chunk)
+                except IOError:
+                    os.remove(file.name)
+                    return False
+            os.chmod(file.name, self.file_mode)
+            os.replace(file.name, path)
+            self.remember(relative_path, False)
+            return True
+        except IOError:
+            return False
+
+    def object_path(self, content_hash):
+        """Return the path of the blob of content_hash in the object store."""
+        return '{}{}{}/{}'.format(self.base_path, OBJECTS_FOLDER, content_hash[:2], content_hash[2:])
+
+    @staticmethod
+    def same_object(path, blob):
+        """Check whether the file at path is a link to blob."""
+        return blob is not None and os.path.exists(path) and os.path.exists(blob) and os.path.samefile(path, blob)
+
+    def store(self, blob, content):
+        """Store content as blob unless the blob exists already.
+           Returns False if the content could not be written."""
+        if os.path.exists(blob):
+            self.deduplicated += 1
+            return True
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        if getattr(content, 'name', None) in self.staged:
+            content.flush()
+            os.chmod(content.name, self.file_mode)
+            os.replace(content.name, blob)
+            return True
+
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(blob), suffix='.part', delete=False) as file:
+            try:
+                for chunk in util.iter_chunks(content, CHUNK):
+                    file.write(chunk)
             except IOError:
+                os.remove(file.name)
                 return False
+        os.chmod(file.name, self.file_mode)
+        os.replace(file.name, blob)
+        return True
+
+    def link(self, blob, path):
+        """Materialize blob at path as a hardlink, or as a copy where
+           the file system does not support hardlinks."""
+        # renaming a link onto a link of the same file does nothing
+        if self.same_object(path, blob):
+            return
+        tmp = '{}/.{}.link'.format(os.path.dirname(path), os.path.basename(blob))
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        try:
+            os.link(blob, tmp)
+        except OSError:
+            shutil.copyfile(blob, tmp)
+            os.chmod(tmp, self.file_mode)
+        os.replace(tmp, path)
+
+    def collect_garbage(self):
+        """Remove the blobs of the object store that no saved path links to,
+           and the leftovers of interrupted writes.
+           Returns the number and the total size of the removed blobs."""
+        removed, size = 0, 0
+        objects = self.base_path + OBJECTS_FOLDER
+        for folder, _, names in os.walk(objects, topdown=False):
+            for name in names:
+                path = os.path.join(folder, name)
+                stat = os.stat(path)
+                if stat.st_nlink == 1 or name.endswith('.part'):
+                    os.remove(path)
+                    removed += 1
+                    size += stat.st_size
+            if folder != objects and not os.listdir(folder):
+                os.rmdir(folder)
+        return removed, size
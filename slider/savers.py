@@ -0,0 +1,54 @@
+"""Savers module, the registry of the backends saving the downloaded files.
+
+A saver is registered by name as the module and class implementing it,
+which are only imported once the saver is selected, such that a run does
+not pay for the dependencies of the backends it does not use. The savers
+of other packages are registered as entry points in the group ENTRY_POINTS,
+e.g. 'webdav = slider_webdav:WebDAVSaver'. A saver is a subclass of
+BaseSaver, created from the configuration with from_secrets.
+"""
+
+import importlib
+
+# entry point group of the savers of other packages
+ENTRY_POINTS = 'slider.savers'
+# the saver without configuration
+DEFAULT = 'local'
+
+# built-in savers by name as module:class
+SAVERS = {
+    'local': 'save_file:FileSaver',
+    'dropbox': 'save_drop:DropboxSaver',
+}
+
+
+def register(name, target):
+    """Register the saver target, given as module:class, by name."""
+    SAVERS[name] = target
+
+
+def entry_points():
+    """Return the entry points of the savers of other packages by name."""
+    try:
+        from importlib import metadata
+    except ImportError:
+        return {}
+    found = metadata.entry_points()
+    group = found.select(group=ENTRY_POINTS) if hasattr(found, 'select') else found.get(ENTRY_POINTS, [])
+    return {entry_point.name: entry_point for entry_point in group}
+
+
+def exists(name):
+    """Check whether a saver is registered by name."""
+    return name in SAVERS or name in entry_points()
+
+
+def load(name):
+    """Import and return the saver class registered by name."""
+    if name in SAVERS:
+        module, _, attribute = SAVERS[name].partition(':')
+        return getattr(importlib.import_module(module), attribute)
+    plugins = entry_points()
+    if name not in plugins:
+        raise KeyError('Unknown saver ' + name)
+    return plugins[name].load()
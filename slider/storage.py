@@ -0,0 +1,265 @@
+"""Storage backends module for the download database."""
+
+from abc import ABC, abstractmethod
+import json
+
+from hashing import LEGACY
+import util
+
+# the backend of the selected storage is imported on first use
+sqlite3 = util.lazy_import('sqlite3')
+tinydb = util.lazy_import('tinydb')
+
+# changes of the SQLite storage committed in one transaction at most
+COMMIT_INTERVAL = 500
+
+
+class BaseStorage(ABC):
+    """An abstract base class for storing the records of downloaded files.
+
+    A record is a dict with the keys path, hashvalue, lastupdate and
+    algorithm, the hash algorithm, which records from before are missing.
+    Besides the records, a storage keeps tables of metadata, i.e.
+    JSON serializable values stored by a unique key.
+    """
+    FILENAME = ''
+
+    def __init__(self, path):
+        self.path = path
+
+    @abstractmethod
+    def insert(self, filepath, filehash, fileupdate, algorithm=LEGACY):
+        """Insert a record."""
+        pass
+
+    @abstractmethod
+    def rehash(self, filehash, newhash, algorithm):
+        """Replace the hashvalue filehash of its records by newhash of algorithm."""
+        pass
+
+    @abstractmethod
+    def count_algorithm(self, algorithm):
+        """Count the records hashed with algorithm."""
+        pass
+
+    @abstractmethod
+    def remove(self, filepath, filehash):
+        """Remove the records with the given path filepath and hashvalue filehash."""
+        pass
+
+    @abstractmethod
+    def get_hash(self, filehash):
+        """Retrieve all records with the given hashvalue filehash."""
+        pass
+
+    @abstractmethod
+    def get_name(self, filepath):
+        """Retrieve all records with the given path filepath."""
+        pass
+
+    @abstractmethod
+    def get_name_update(self, filepath, fileupdate):
+        """Retrieve all records with the given path filepath and last update fileupdate."""
+        pass
+
+    @abstractmethod
+    def get_meta(self, table, key):
+        """Retrieve the metadata value stored by key in table or None."""
+        pass
+
+    @abstractmethod
+    def set_meta(self, table, key, value):
+        """Store the metadata value by key in table, replacing a previous value."""
+        pass
+
+    @abstractmethod
+    def delete_meta(self, table, key):
+        """Delete the metadata value stored by key in table."""
+        pass
+
+    def commit(self):
+        """Persist all changes, keeping the storage open."""
+        pass
+
+    @abstractmethod
+    def close(self):
+        """Persist all changes and close the storage."""
+        pass
+
+
+class TinyDBStorage(BaseStorage):
+    """A storage keeping the records in a TinyDB JSON document."""
+    FILENAME = 'files.json'
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.db = tinydb.TinyDB(path)
+
+    def insert(self, filepath, filehash, fileupdate, algorithm=LEGACY):
+        """Insert a record into the TinyDB."""
+        self.db.insert({'path': filepath, 'hashvalue': filehash, 'lastupdate': fileupdate, 'algorithm': algorithm})
+
+    def rehash(self, filehash, newhash, algorithm):
+        """Replace the hashvalue filehash of its records by newhash of algorithm."""
+        file = tinydb.Query()
+        self.db.update({'hashvalue': newhash, 'algorithm': algorithm}, file.hashvalue == filehash)
+
+    def count_algorithm(self, algorithm):
+        """Count the records hashed with algorithm."""
+        file = tinydb.Query()
+        if algorithm == LEGACY:
+            return self.db.count((file.algorithm == algorithm) | ~file.algorithm.exists())
+        return self.db.count(file.algorithm == algorithm)
+
+    def remove(self, filepath, filehash):
+        """Remove the records with the given path filepath and hashvalue filehash from the TinyDB."""
+        file = tinydb.Query()
+        self.db.remove((file.path == filepath) & (file.hashvalue == filehash))
+
+    def get_hash(self, filehash):
+        """Retrieve all records with the given hashvalue filehash."""
+        file = tinydb.Query()
+        return self.db.search(file.hashvalue == filehash)
+
+    def get_name(self, filepath):
+        """Retrieve all records with the given path filepath."""
+        file = tinydb.Query()
+        return self.db.search(file.path == filepath)
+
+    def get_name_update(self, filepath, fileupdate):
+        """Retrieve all records with the given path filepath and last update fileupdate."""
+        file = tinydb.Query()
+        return self.db.search((file.path == filepath) & (file.lastupdate == fileupdate))
+
+    def get_meta(self, table, key):
+        """Retrieve the metadata value stored by key in the TinyDB table or None."""
+        meta = tinydb.Query()
+        document = self.db.table(table).get(meta.key == key)
+        return document['value'] if document is not None else None
+
+    def set_meta(self, table, key, value):
+        """Store the metadata value by key in the TinyDB table."""
+        meta = tinydb.Query()
+        self.db.table(table).upsert({'key': key, 'value': value}, meta.key == key)
+
+    def delete_meta(self, table, key):
+        """Delete the metadata value stored by key in the TinyDB table."""
+        meta = tinydb.Query()
+        self.db.table(table).remove(meta.key == key)
+
+    def close(self):
+        """Close the TinyDB."""
+        self.db.close()
+
+
+class SQLiteStorage(BaseStorage):
+    """A storage keeping the records in an indexed SQLite table.
+
+    The index on (path, lastupdate) also serves the lookups by path.
+    The algorithm column is added to tables from before it existed.
+    The changes of a run are batched in transactions of COMMIT_INTERVAL
+    changes, such that an interrupted run loses at most one of them.
+    """
+    FILENAME = 'files.sqlite'
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS files (path TEXT NOT NULL, hashvalue TEXT NOT NULL, lastupdate TEXT NOT NULL,'
+        ' algorithm TEXT NOT NULL DEFAULT \'sha1\');'
+        'CREATE INDEX IF NOT EXISTS files_path_update ON files (path, lastupdate);'
+        'CREATE INDEX IF NOT EXISTS files_hash ON files (hashvalue);'
+        'CREATE TABLE IF NOT EXISTS meta (tbl TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,'
+        ' PRIMARY KEY (tbl, key));'
+    )
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        # changes since the last commit
+        self.changes = 0
+        self.db.executescript(SQLiteStorage.SCHEMA)
+        columns = [row['name'] for row in self.db.execute('PRAGMA table_info(files)')]
+        if 'algorithm' not in columns:
+            self.db.execute('ALTER TABLE files ADD COLUMN algorithm TEXT NOT NULL DEFAULT \'{}\''.format(LEGACY))
+
+    def insert(self, filepath, filehash, fileupdate, algorithm=LEGACY):
+        """Insert a record within the current transaction."""
+        self.db.execute('INSERT INTO files VALUES (?, ?, ?, ?)', (filepath, filehash, fileupdate, algorithm))
+        self.changed()
+
+    def rehash(self, filehash, newhash, algorithm):
+        """Replace the hashvalue filehash of its records by newhash of algorithm."""
+        self.db.execute('UPDATE files SET hashvalue = ?, algorithm = ? WHERE hashvalue = ?',
+                        (newhash, algorithm, filehash))
+        self.changed()
+
+    def count_algorithm(self, algorithm):
+        """Count the records hashed with algorithm."""
+        return self.db.execute('SELECT COUNT(*) FROM files WHERE algorithm = ?', (algorithm,)).fetchone()[0]
+
+    def remove(self, filepath, filehash):
+        """Remove the records with the given path filepath and hashvalue filehash."""
+        self.db.execute('DELETE FROM files WHERE path = ? AND hashvalue = ?', (filepath, filehash))
+        self.changed()
+
+    def select(self, where, params):
+        """Retrieve all records matching the where clause as dicts."""
+        rows = self.db.execute('SELECT path, hashvalue, lastupdate, algorithm FROM files WHERE ' + where, params)
+        return [dict(row) for row in rows]
+
+    def get_hash(self, filehash):
+        """Retrieve all records with the given hashvalue filehash."""
+        return self.select('hashvalue = ?', (filehash,))
+
+    def get_name(self, filepath):
+        """Retrieve all records with the given path filepath."""
+        return self.select('path = ?', (filepath,))
+
+    def get_name_update(self, filepath, fileupdate):
+        """Retrieve all records with the given path filepath and last update fileupdate."""
+        return self.select('path = ? AND lastupdate = ?', (filepath, fileupdate))
+
+    def migrate(self, tinydb_path):
+        """Import all records of the TinyDB JSON document at tinydb_path."""
+        with open(tinydb_path) as f:
+            tables = json.load(f)
+        records = tables.get('_default', {}).values()
+        self.db.executemany('INSERT INTO files VALUES (?, ?, ?, ?)',
+                            [(r['path'], r['hashvalue'], r['lastupdate'], r.get('algorithm', LEGACY)) for r in records])
+
+    def get_meta(self, table, key):
+        """Retrieve the metadata value stored by key in table or None."""
+        row = self.db.execute('SELECT value FROM meta WHERE tbl = ? AND key = ?', (table, key)).fetchone()
+        return json.loads(row['value']) if row is not None else None
+
+    def set_meta(self, table, key, value):
+        """Store the metadata value by key in table within the current transaction."""
+        self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?, ?)', (table, key, json.dumps(value)))
+        self.changed()
+
+    def delete_meta(self, table, key):
+        """Delete the metadata value stored by key in table."""
+        self.db.execute('DELETE FROM meta WHERE tbl = ? AND key = ?', (table, key))
+        self.changed()
+
+    def changed(self):
+        """Count a change, committing the transaction once it holds COMMIT_INTERVAL changes."""
+        self.changes += 1
+        if self.changes >= COMMIT_INTERVAL:
+            self.commit()
+
+    def commit(self):
+        """Commit the current transaction."""
+        self.db.commit()
+        self.changes = 0
+
+    def close(self):
+        """Commit the current transaction and close the connection."""
+        self.commit()
+        self.db.close()
+
+
+# available storage backends by name
+STORAGES = {
+    'tinydb': TinyDBStorage,
+    'sqlite': SQLiteStorage,
+}
@@ -0,0 +1,66 @@
+"""Transport module for the HTTP connections of a session.
+
+A Transport is mounted on a requests session. It keeps a pool of keep-alive
+connections, applies default connect and read timeouts, retries idempotent
+requests with exponential backoff and takes a token of a shared TokenBucket
+before every request, such that the rate of all callers is limited together.
+"""
+
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# seconds to wait for a connection and between two bytes of a response
+TIMEOUT = (10, 60)
+# retries of a failed idempotent request, with a backoff from BACKOFF seconds doubling per retry
+RETRIES = 3
+BACKOFF = 0.5
+# responses retried like failed connections
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """A token bucket limiting the requests to rate per second with bursts of up to burst requests.
+
+    Tokens are reserved in the order of the callers, a caller waits outside
+    of the lock until its token is due, such that waiting callers do not
+    block each other.
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, waiting until one is available."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class Transport(HTTPAdapter):
+    """An adapter with a pool of pool_size connections per host, default timeouts,
+       retries of idempotent requests and an optional TokenBucket shared by all requests."""
+    def __init__(self, pool_size, timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF, bucket=None):
+        # the idempotent methods are retried by default, the keyword naming them changed in urllib3 1.26
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUS, raise_on_status=False)
+        super().__init__(pool_maxsize=pool_size, max_retries=retry)
+        self.timeout = timeout
+        self.bucket = bucket
+
+    def send(self, request, **kwargs):
+        """Send a request, with the default timeouts unless the caller gives some."""
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        if self.bucket is not None:
+            self.bucket.acquire()
+        return super().send(request, **kwargs)
@@ -1,5 +1,6 @@
 """Util module."""
 
+import importlib.util
 import re
 import sys
 
@@ -16,6 +17,19 @@ class Colors:
     ENDC = '\033[0m'
 
 
+def lazy_import(name):
+    """Return the module name, which is only executed once one of its attributes is accessed."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
 # CLI utils
 def create_secrets(file):
     """Create secrets file with required configuration."""
@@ -28,22 +42,14 @@ def create_secrets(file):
             'PATH = \'\'  # Path to the destination folder\n\n'
             '# dropbox (-d): Required if you want to download files and upload them to Dropbox\n'
             'DROPBOX_TOKEN = \'\'  # Personal Dropbox API token\n'
-            'PATH_IN_DB = \'\'  # Destination path of downloaded files within Dropbox\n'))
+            'PATH_IN_DB = \'\'  # Destination path of downloaded files within Dropbox\n\n'
+            '# rules: Optional selection rules of courses, folders and files, see README\n'
+            '# RULES = {}\n'))
     print('File app_secrets.py was created. Please maintain your credentials.')
     sys.exit(1)
 
 
 # crawler utils
-def course_contains(original, courses):
-    """Check in the config data whether the user
-       wants to download content for this course."""
-    for name in courses:
-        compiler = re.compile(name)
-        if compiler.search(original) is not None:
-            return name
-    return None
-
-
 def remove_edge_characters(line):
     r"""Replaces all !@#$/\:;*?<>| with _
         Dateien/ will be removed from the string (which would lead to
@@ -59,6 +65,30 @@ def print_method(method, messag, clrone=Colors.ENDC, clrtwo=Colors.ENDC):
     print('{}{}:{} {}'.format(clrone, method, clrtwo, messag))
 
 
+def format_size(size):
+    """Format a number of bytes as a human readable string."""
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1000:
+            return '{:.1f} {}'.format(size, unit)
+        size /= 1000
+    return '{:.1f} GB'.format(size)
+
+
+def iter_chunks(source, size):
+    """Yield the content of source in chunks. The source can be a bytes object,
+       a file-like object or an iterator of bytes, whose chunks are passed as they are."""
+    if isinstance(source, (bytes, bytearray)):
+        for start in range(0, len(source), size):
+            yield source[start:start + size]
+    elif hasattr(source, 'read'):
+        for chunk in iter(lambda: source.read(size), b''):
+            yield chunk
+    else:
+        for chunk in source:
+            if chunk:
+                yield chunk
+
+
 # path utils
 def bpath(path):
     """Returns valid base path of the form: /path/to/folder/ ."""
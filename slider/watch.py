@@ -0,0 +1,95 @@
+"""Watch module for crawling in a long-running process.
+
+Instead of a full crawl per cron run, the crawler logs in once, keeps its
+session and database open and polls every course at its own interval.
+"""
+
+import time
+
+from util import Colors as clr
+import util
+
+# the interval of an unchanged course grows up to this factor
+MAX_BACKOFF = 16
+# seconds to wait at least between two cycles, and if the budget is used up
+MIN_WAIT = 1
+BUDGET_WAIT = 60
+HOUR = 3600
+
+
+class Watcher:
+    """Crawl the courses of a crawler in cycles.
+
+    Every course is polled at its own interval, starting at interval seconds.
+    Whenever a course changed, its interval is reset to interval seconds,
+    whenever it did not, its interval is doubled up to MAX_BACKOFF times
+    interval seconds. If a budget of requests per hour is given, a due
+    course is only crawled if the requests it took last time still fit
+    into the budget, otherwise it is postponed.
+    """
+    def __init__(self, crawler, interval, budget=None):
+        self.crawler = crawler
+        self.interval = interval
+        self.budget = budget
+        # polling interval, time of the next poll and requests of the last crawl by course
+        self.intervals = {}
+        self.next_poll = {}
+        self.costs = {}
+        # due courses that did not fit into the budget
+        self.postponed = []
+
+    def run(self):
+        """Poll the due courses until the process is terminated."""
+        while True:
+            self.poll()
+            time.sleep(self.wait())
+
+    def due(self, now):
+        """Return the due courses which fit into the budget, the longest overdue first."""
+        courses = sorted((c for c in self.crawler.courses if self.next_poll.get(c, 0) <= now),
+                         key=lambda c: self.next_poll.get(c, 0))
+        if self.budget is None:
+            return courses
+
+        # the personal desktop is fetched in every cycle
+        used = self.crawler.req.requests_within(HOUR) + 1
+        selected, self.postponed = [], []
+        for course in courses:
+            cost = self.costs.get(course, 0)
+            if used + cost <= self.budget:
+                selected.append(course)
+                used += cost
+            else:
+                self.postponed.append(course)
+        return selected
+
+    def poll(self):
+        """Crawl the due courses in one cycle and schedule their next polls.
+           Returns the crawled courses."""
+        now = time.time()
+        due = self.due(now)
+        if self.postponed:
+            util.print_method('over_budget', ', '.join(self.postponed), clr.BLUE)
+        if not due:
+            return due
+
+        self.crawler.cycle(due)
+        for course in due:
+            interval = self.intervals.get(course)
+            if interval is None or self.crawler.course_downloads.get(course):
+                interval = self.interval
+            else:
+                interval = min(2 * interval, MAX_BACKOFF * self.interval)
+            self.intervals[course] = interval
+            self.next_poll[course] = now + interval
+            if course in self.crawler.course_requests:
+                self.costs[course] = self.crawler.course_requests[course]
+
+        polls = ', '.join('{} in {}s'.format(c, int(self.intervals[c])) for c in due)
+        util.print_method('next_polls', polls, clr.LIGHTGREY)
+        return due
+
+    def wait(self):
+        """Return the seconds until the next course is due."""
+        next_poll = min((self.next_poll.get(c, 0) for c in self.crawler.courses), default=time.time() + HOUR)
+        return max(next_poll - time.time(), BUDGET_WAIT if self.postponed else MIN_WAIT)
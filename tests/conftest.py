@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the modules of slider/ import each other as top level modules,
+# the fake ILIAS server lives with the benchmarks
+sys.path.insert(0, os.path.join(ROOT, 'slider'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from bench_crawl import make_secrets  # noqa: E402
+from crawler import Crawler  # noqa: E402
+from fake_ilias import CourseTree, FakeIlias  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    # two courses of a file folder and two subfolders with two files each
+    with FakeIlias(CourseTree(courses=2, depth=1, fanout=2, files=2, size=2048)) as server:
+        yield server
+
+
+@pytest.fixture
+def make_crawler(server):
+    # a crawler of all courses of server, saving into path
+    def make_crawler(path, **options):
+        return Crawler(False, False, False, 5E7, secrets=make_secrets(server, str(path)), **options)
+    return make_crawler
@@ -0,0 +1,59 @@
+import os
+
+from click.testing import CliRunner
+
+from batch import Batch
+from crawler import Crawler, cli, load_account
+
+
+def make_account(server, folder, courses):
+    folder.mkdir()
+    (folder / 'app_secrets.py').write_text(
+        'USER = {!r}\nPASSWORD = {!r}\nCOURSES = {!r}\nPATH = {!r}\nDROPBOX_TOKEN = \'\'\nPATH_IN_DB = \'\'\n'
+        'ILIAS_BASE = {!r}\nILIAS_URL = {!r}\n'.format(
+            folder.name, server.password, courses, str(folder / 'out'), server.url, server.login_url))
+    return str(folder)
+
+
+def make_crawler(name):
+    return Crawler(False, False, False, 5E7, storage='sqlite', secrets=load_account('.'))
+
+
+def files(path):
+    return sorted(os.path.relpath(os.path.join(root, name), path)
+                  for root, dirs, names in os.walk(path) for name in names if not root.startswith(path + '/.'))
+
+
+def test_accounts_share_listings_and_downloads(server, tmp_path):
+    alice = make_account(server, tmp_path / 'alice', ['Course 0', 'Course 1'])
+    bob = make_account(server, tmp_path / 'bob', ['Course 1'])
+    batch = Batch([alice, bob], make_crawler)
+    batch.run()
+
+    alice_files, bob_files = files(alice + '/out'), files(bob + '/out')
+    assert len(alice_files) == 12
+    assert bob_files == [name for name in alice_files if name.startswith('Course 1')]
+    # every listing, probe and file of the common course was requested once
+    assert batch.shared.shared_files == len(bob_files)
+    assert batch.shared.shared_probes == len(bob_files)
+    assert batch.shared.shared_listings == 3
+    assert server.requests['HEAD'] == 12
+    assert not os.path.exists(batch.staging)
+
+    # each account keeps its own session and database
+    assert os.path.exists(bob + '/.db/session.json')
+    batch = Batch([alice, bob], make_crawler)
+    batch.run()
+    assert [crawler.downloads for crawler in batch.crawlers] == [[], []]
+
+
+def test_cli(server, tmp_path):
+    alice = make_account(server, tmp_path / 'alice', ['Course 0'])
+    bob = make_account(server, tmp_path / 'bob', ['Course 1'])
+    result = CliRunner().invoke(cli, ['--batch', alice, '--batch', bob, '--storage', 'sqlite', '--incremental',
+                                      '--prometheus', str(tmp_path / 'slider.prom')])
+    assert result.exit_code == 0, result.output
+    assert len(files(alice + '/out')) == len(files(bob + '/out')) == 6
+    # the options reach the crawler of every account
+    assert os.path.exists(alice + '/out/.db/files.sqlite')
+    assert os.path.exists(str(tmp_path / 'slider_bob.prom'))
@@ -0,0 +1,88 @@
+import hashlib
+import os
+
+import pytest
+
+
+def crawl(make_crawler, path, **options):
+    crawler = make_crawler(path, **options)
+    crawler.run()
+    return crawler
+
+
+def saved_files(path):
+    return sorted(os.path.relpath(os.path.join(root, name), path)
+                  for root, dirs, files in os.walk(path) for name in files
+                  if not os.path.relpath(root, path).startswith('.'))
+
+
+@pytest.mark.parametrize('options', [
+    {}, {'workers': 3}, {'storage': 'sqlite'}, {'incremental': True}, {'segment': 1024}, {'objects': True},
+    {'zero_probe': True}, {'probers': 2, 'fetchers': 3}, {'workers': 3, 'fetchers': 2, 'inflight': 4096}])
+def test_cold_and_warm_runs(server, make_crawler, tmp_path, options):
+    assert len(crawl(make_crawler, tmp_path, **options).downloads) == 12
+    assert len(saved_files(str(tmp_path))) == 12
+    assert 'Course 1/Folder 1/Slides 16 1.pdf' in saved_files(str(tmp_path))
+    assert crawl(make_crawler, tmp_path, **options).downloads == []
+
+    server.tree.touch(1)
+    update = hashlib.sha1(server.tree.items[2].content()).hexdigest()[:4]
+    assert crawl(make_crawler, tmp_path, **options).downloads == [
+        'file_update: Course 0/Slides 1 0_UP{}.pdf'.format(update)]
+    assert len(saved_files(str(tmp_path))) == 13
+
+
+def test_zero_probe(server, make_crawler, tmp_path):
+    crawler = crawl(make_crawler, tmp_path, zero_probe=True)
+    assert len(crawler.downloads) == 12
+    assert crawler.saved_probes == 12
+    assert 'HEAD' not in server.requests
+
+    # a warm run only fetches the desktop and the listings
+    requests = server.requests['GET']
+    crawler = crawl(make_crawler, tmp_path, zero_probe=True)
+    assert crawler.downloads == []
+    assert 'HEAD' not in server.requests
+    assert server.requests['GET'] - requests == 1 + 6
+
+    # files which may be fetched in byte ranges are probed
+    server.tree.touch(1)
+    crawler = crawl(make_crawler, tmp_path, zero_probe=True, segment=1024)
+    assert len(crawler.downloads) == 1
+    assert server.requests['HEAD'] == 1
+
+
+def test_interrupted_run(server, make_crawler, tmp_path):
+    crawler = make_crawler(tmp_path, storage='sqlite')
+    save_file = crawler.file_handler.save_file
+    saved = []
+
+    def interrupt(relative_path, *args, **kwargs):
+        if len(saved) == 4:
+            raise KeyboardInterrupt
+        saved.append(relative_path)
+        return save_file(relative_path, *args, **kwargs)
+    crawler.file_handler.save_file = interrupt
+    with pytest.raises(KeyboardInterrupt):
+        crawler.run()
+
+    # the records of the files saved before the interrupt were kept
+    crawler = crawl(make_crawler, tmp_path, storage='sqlite')
+    assert len(crawler.downloads) == 8
+    assert all(download.startswith('downloading') for download in crawler.downloads)
+    assert len(saved_files(str(tmp_path))) == 12
+
+
+def test_failed_download_is_retried(server, make_crawler, tmp_path):
+    crawl(make_crawler, tmp_path, incremental=True)
+    updated = server.tree.items[5]
+    updated.version += 1
+    updated.listed += 1
+    server.cuts[5] = 1000
+    assert crawl(make_crawler, tmp_path, incremental=True, full=True).downloads == []
+
+    # the folder of the failed file is listed again, though its parent is unchanged
+    server.settle()
+    update = hashlib.sha1(updated.content()).hexdigest()[:4]
+    assert crawl(make_crawler, tmp_path, incremental=True).downloads == [
+        'file_update: Course 0/Folder 0/Slides 4 0_UP{}.pdf'.format(update)]
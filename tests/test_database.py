@@ -0,0 +1,163 @@
+import json
+import types
+
+from database import DATABASE_FOLDER, Database
+from save_base import BaseSaver
+from storage import SQLiteStorage, TinyDBStorage
+import storage
+
+
+def local(path):
+    return types.SimpleNamespace(base_path=str(path) + '/')
+
+
+class FakeDropbox:
+    def __init__(self):
+        self.files = {}
+        self.revisions = {}
+        self.revision_count = 0
+        self.downloads = 0
+        self.uploads = 0
+
+    def revision(self, path):
+        return self.revisions.get(path)
+
+    def exists(self, path):
+        return path in self.files
+
+    def create_folder(self, path):
+        pass
+
+    def download_file(self, path, local_path):
+        self.downloads += 1
+        with open(local_path, 'wb') as f:
+            f.write(self.files[path])
+
+    def upload_database(self, path, f):
+        self.uploads += 1
+        self.upload(path, f.read())
+        return True
+
+    def upload(self, path, content):
+        self.revision_count += 1
+        self.files[path] = content
+        self.revisions[path] = 'rev{}'.format(self.revision_count)
+
+
+class RemoteSaver(BaseSaver):
+    # a saver of a plugin implementing the BaseSaver contract only
+    REMOTE = True
+
+    def __init__(self):
+        super().__init__('/remote')
+        self.files = {}
+
+    def exists(self, relative_path):
+        return relative_path in self.files
+
+    def create_folder(self, relative_path):
+        pass
+
+    def save_file(self, relative_path, content, overwrite=False, content_hash=None):
+        self.files[relative_path] = content.read()
+        return True
+
+    def revision(self, relative_path):
+        return str(len(self.files[relative_path])) if relative_path in self.files else None
+
+
+def test_migrate_tinydb(tmp_path):
+    (tmp_path / '.db').mkdir()
+    legacy = TinyDBStorage(str(tmp_path / DATABASE_FOLDER / TinyDBStorage.FILENAME))
+    legacy.insert('Course 0/Slides.pdf', 'abc', '01. Jan 2020, 10:00', 'blake2b')
+    legacy.close()
+    # records from before the hash algorithm was kept
+    tables = json.loads((tmp_path / '.db' / 'files.json').read_text())
+    tables['_default']['2'] = {'path': 'Course 0/Notes.pdf', 'hashvalue': 'def', 'lastupdate': 'Heute, 09:00'}
+    (tmp_path / '.db' / 'files.json').write_text(json.dumps(tables))
+
+    database = Database(local(tmp_path), False, storage='sqlite')
+    assert database.get_name('Course 0/Slides.pdf') == [{
+        'path': 'Course 0/Slides.pdf', 'hashvalue': 'abc', 'lastupdate': '01. Jan 2020, 10:00', 'algorithm': 'blake2b'}]
+    assert database.get_name_update('Course 0/Notes.pdf', 'Heute, 09:00') == [
+        {'path': 'Course 0/Notes.pdf', 'hashvalue': 'def', 'lastupdate': 'Heute, 09:00', 'algorithm': 'sha1'}]
+    database.close(None, False)
+
+    # the records are migrated once and the TinyDB database is kept as it was
+    database = Database(local(tmp_path), False, storage='sqlite')
+    assert len(database.get_hash('abc')) == 1
+    assert database.count_algorithm('sha1') == 1
+    database.close(None, False)
+    assert (tmp_path / '.db' / 'files.json').exists()
+
+
+def test_revision(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dropbox = FakeDropbox()
+    database = Database(dropbox, True, storage='sqlite')
+    database.insert('Course 0/Slides.pdf', 'abc', 'Heute, 09:00')
+    database.close(dropbox, True)
+    assert dropbox.uploads == 1
+
+    # the cached copy has the revision of the uploaded database, a run without records uploads nothing
+    database = Database(dropbox, True, storage='sqlite')
+    assert dropbox.downloads == 0
+    assert len(database.get_hash('abc')) == 1
+    database.close(dropbox, True)
+    assert dropbox.uploads == 1
+
+    # another machine uploaded a new revision
+    remote = SQLiteStorage(str(tmp_path / 'remote.sqlite'))
+    remote.insert('Course 1/Notes.pdf', 'def', 'Heute, 10:00')
+    remote.close()
+    dropbox.upload(DATABASE_FOLDER + SQLiteStorage.FILENAME, (tmp_path / 'remote.sqlite').read_bytes())
+    database = Database(dropbox, True, storage='sqlite')
+    assert dropbox.downloads == 1
+    assert database.get_hash('abc') == []
+    assert len(database.get_hash('def')) == 1
+    database.close(dropbox, True)
+
+
+def test_commit_interval(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, 'COMMIT_INTERVAL', 2)
+    path = str(tmp_path / SQLiteStorage.FILENAME)
+    db = SQLiteStorage(path)
+    for number in range(3):
+        db.insert('Course 0/Slides {}.pdf'.format(number), str(number), 'Heute, 09:00')
+    # another connection sees the committed transactions only
+    assert len(SQLiteStorage(path).get_name_update('Course 0/Slides 1.pdf', 'Heute, 09:00')) == 1
+    assert SQLiteStorage(path).get_hash('2') == []
+    db.close()
+    assert len(SQLiteStorage(path).get_hash('2')) == 1
+
+
+def test_upload_only_records(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dropbox = FakeDropbox()
+    database = Database(dropbox, True, storage='sqlite')
+    database.insert('Course 0/Slides.pdf', 'abc', 'Heute, 09:00')
+    database.close(dropbox, True)
+
+    # an incremental run counting itself and visiting folders adds no records
+    database = Database(dropbox, True, storage='sqlite')
+    assert database.next_run() == 1
+    database.set_folder('https://ilias/folder', {'fingerprint': 'f', 'visited': 1})
+    database.close(dropbox, True)
+    assert dropbox.uploads == 1
+
+    # the cached copy kept them
+    database = Database(dropbox, True, storage='sqlite')
+    assert dropbox.downloads == 0
+    assert database.next_run() == 2
+    database.insert('Course 0/Notes.pdf', 'def', 'Heute, 10:00')
+    database.close(dropbox, True)
+    assert dropbox.uploads == 2
+
+
+def test_remote_saver(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    saver = RemoteSaver()
+    database = Database(saver, True, storage='sqlite')
+    database.insert('Course 0/Slides.pdf', 'abc', 'Heute, 09:00')
+    database.close(saver, True)
+    assert saver.exists(DATABASE_FOLDER + SQLiteStorage.FILENAME)
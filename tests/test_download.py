@@ -0,0 +1,70 @@
+import hashlib
+import tempfile
+
+import pytest
+from requests.exceptions import RequestException
+
+from download import Downloader
+from fake_ilias import CourseTree, FakeIlias
+from request import RequestHandler
+
+SIZE = 400000
+
+
+@pytest.fixture(params=[True, False], ids=['ranges', 'no ranges'])
+def server(request):
+    with FakeIlias(CourseTree(courses=1, depth=0, files=1, size=SIZE), ranges=request.param) as server:
+        yield server
+
+
+def download(downloader, server, etag=None):
+    url = server.url + 'goto.php?target=file_2_download'
+    with tempfile.TemporaryFile() as target:
+        content_hash, headers = downloader.download(url, target, etag, size=SIZE)
+        return content_hash, target.read(), headers
+
+
+def test_segments(server, tmp_path):
+    downloader = Downloader(RequestHandler('student', server.password), str(tmp_path) + '/', 1024)
+    content_hash, content, headers = download(downloader, server)
+    assert content == server.tree.items[2].content()
+    assert content_hash == hashlib.sha1(content).hexdigest()
+    # a response is counted once it is sent
+    server.settle()
+    assert server.requests['GET'] == (4 if server.ranges else 1)
+    assert download(downloader, server, headers['ETag'])[0] is None
+
+
+@pytest.mark.parametrize('segment_size', [1024, SIZE + 1])
+def test_resume(server, tmp_path, segment_size):
+    downloader = Downloader(RequestHandler('student', server.password), str(tmp_path) + '/', segment_size)
+    server.cuts[2] = 80000
+    with pytest.raises(RequestException):
+        download(downloader, server)
+    assert bool(list(tmp_path.iterdir())) == server.ranges
+
+    # the cancelled segments may still be sent
+    server.settle()
+    requests, size = server.stats()
+    content_hash, content, headers = download(downloader, server)
+    assert content == server.tree.items[2].content()
+    assert content_hash == hashlib.sha1(content).hexdigest()
+    assert server.stats()[1] - size + downloader.resumed == SIZE
+    assert bool(downloader.resumed) == server.ranges
+    assert not list(tmp_path.iterdir())
+
+
+def test_resume_changed_file(tmp_path):
+    with FakeIlias(CourseTree(courses=1, depth=0, files=1, size=SIZE)) as server:
+        downloader = Downloader(RequestHandler('student', server.password), str(tmp_path) + '/', SIZE + 1)
+        server.cuts[2] = 80000
+        with pytest.raises(RequestException):
+            download(downloader, server)
+        assert list(tmp_path.iterdir())
+
+        server.tree.touch(1)
+        content_hash, content, headers = download(downloader, server)
+        assert content == server.tree.items[2].content()
+        assert content_hash == hashlib.sha1(content).hexdigest()
+        assert downloader.resumed == 0
+        assert not list(tmp_path.iterdir())
@@ -0,0 +1,78 @@
+import hashlib
+import sqlite3
+import tempfile
+
+import pytest
+
+from bench_crawl import make_secrets
+from crawler import Crawler
+from fake_ilias import CourseTree, FakeIlias
+from hashing import ALGORITHMS, Hasher
+import hashing
+from storage import SQLiteStorage
+
+CONTENT = bytes(range(256)) * 4096
+
+
+@pytest.mark.parametrize('algorithm', sorted(ALGORITHMS))
+def test_hasher(algorithm):
+    hasher = Hasher(algorithm)
+    for start in range(0, len(CONTENT), 65536):
+        hasher.update(CONTENT[start:start + 65536])
+    expected = hashing.new(algorithm)
+    expected.update(CONTENT)
+    assert hasher.hexdigest() == expected.hexdigest()
+
+    with tempfile.TemporaryFile() as source:
+        source.write(CONTENT)
+        assert hashing.file_hash(source, algorithm) == expected.hexdigest()
+
+
+def test_sqlite_algorithm_column(tmp_path):
+    path = str(tmp_path / 'files.sqlite')
+    db = sqlite3.connect(path)
+    db.execute('CREATE TABLE files (path TEXT NOT NULL, hashvalue TEXT NOT NULL, lastupdate TEXT NOT NULL)')
+    db.execute("INSERT INTO files VALUES ('a.pdf', 'aaaa', 'today')")
+    db.commit()
+    db.close()
+
+    storage = SQLiteStorage(path)
+    storage.insert('b.pdf', 'bbbb', 'today', 'blake2b')
+    assert storage.get_name('a.pdf')[0]['algorithm'] == 'sha1'
+    assert (storage.count_algorithm('sha1'), storage.count_algorithm('blake2b')) == (1, 1)
+    storage.rehash('aaaa', 'cccc', 'blake2b')
+    assert storage.get_hash('cccc')[0]['path'] == 'a.pdf'
+    assert storage.count_algorithm('sha1') == 0
+    storage.close()
+
+
+@pytest.mark.parametrize('storage', ['tinydb', 'sqlite'])
+def test_lazy_migration(tmp_path, storage):
+    with FakeIlias(CourseTree(courses=1, depth=1, fanout=1, files=2, size=2048)) as server:
+        def make_crawler(algorithm):
+            return Crawler(False, False, False, 5E7, storage=storage, algorithm=algorithm,
+                           secrets=make_secrets(server, str(tmp_path)))
+
+        crawler = make_crawler('sha1')
+        crawler.run()
+        assert len(crawler.downloads) == 4
+
+        # the files are downloaded again, their contents are known by their sha1 hashes
+        server.tree.relist(4)
+        crawler = make_crawler('blake2b')
+        for item in server.tree.files():
+            crawler.database.remove_http(server.url + 'goto.php?target=file_{}_download&client_id=ILIAS'.format(
+                item.ref_id))
+        assert crawler.legacy_records == 4
+        crawler.run()
+        assert crawler.downloads == []
+        assert (crawler.migrated, crawler.legacy_records) == (4, 0)
+
+        content = server.tree.files()[0].content()
+        server.tree.touch(1)
+        crawler = make_crawler('blake2b')
+        assert crawler.database.get_hash(hashlib.blake2b(content).hexdigest())
+        assert crawler.legacy_records == 0
+        crawler.run()
+        assert crawler.downloads == ['file_update: Course 0/Slides 1 0_UP{}.pdf'.format(
+            hashlib.blake2b(server.tree.files()[0].content()).hexdigest()[:4])]
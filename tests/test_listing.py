@@ -0,0 +1,47 @@
+import json
+import os
+
+import pytest
+
+import listing
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def test_parse_listing_conforms_to_saved_page():
+    expected = [listing.ListingItem(**item) for item in json.loads(fixture('folder.json'))]
+    assert listing.parse_listing(fixture('folder.html')) == expected
+
+
+def test_parse_listing_without_items():
+    assert listing.parse_listing(fixture('empty.html')) is None
+
+
+def test_parse_courses():
+    assert listing.parse_courses(fixture('desktop.html')) == [
+        ('CS560 Large-Scale Data Management', 'ilias.php?ref_id=770001&cmd=view'),
+        ('CS 646 Higher Level Computer Vision', 'ilias.php?ref_id=770002&cmd=view'),
+        ('IE 663 Information Retrieval and Web Search', 'ilias.php?ref_id=770003&cmd=view'),
+    ]
+
+
+@pytest.mark.parametrize('text, size', [
+    ('241,3 KB', 247091),
+    ('1.2 MB', 1258291),
+    ('1.234,5 KB', 1264128),
+    ('1,234 KB', 1263616),
+    ('512 Bytes', 512),
+    ('Version: 2', None),
+])
+def test_parse_size(text, size):
+    assert listing.parse_size(text) == size
+
+
+def test_parse_update():
+    assert listing.parse_update('22. May 2019, 14:15') == '201905221415'
+    assert listing.parse_update('Today, 10:30') == 'Today, 10:30'
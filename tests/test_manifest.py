@@ -0,0 +1,124 @@
+import json
+import os
+import sqlite3
+
+import pytest
+
+import crawler
+from manifest import LOG_SUFFIX, Manifest
+
+
+def saved_files(path):
+    return [name for root, dirs, files in os.walk(path) for name in files
+            if not os.path.relpath(root, path).startswith('.')]
+
+
+def test_manifest(tmp_path):
+    manifest = Manifest(3)
+    manifest.add({'url': 'a', 'size': 10, 'decision': 'downloading'})
+    manifest.add({'url': 'b', 'size': 20, 'decision': 'loaded_once'})
+    manifest.add_folder('Course/', 'c', {'fingerprint': 'f', 'visited': 3})
+    manifest.write(str(tmp_path / 'plan.json'))
+    assert json.loads((tmp_path / 'plan.json').read_text())['total_bytes'] == 10
+
+    manifest = Manifest.load(str(tmp_path / 'plan.json'))
+    assert manifest.run_number == 3
+    assert [entry['url'] for entry in manifest.downloads()] == ['a']
+    assert manifest.folders['Course/']['url'] == 'c'
+    assert manifest.applied() == set()
+    manifest.mark(['a'])
+    # an interrupted write is ignored
+    with open(manifest.path + LOG_SUFFIX, 'a') as f:
+        f.write('"b')
+    assert manifest.applied() == {'a'}
+
+    # writing a new manifest forgets the applied entries
+    manifest.write(manifest.path)
+    assert manifest.applied() == set()
+
+
+@pytest.mark.parametrize('options', [{}, {'fetchers': 3, 'incremental': True}])
+def test_plan_and_apply(server, make_crawler, tmp_path, options):
+    path = str(tmp_path / 'plan.json')
+    crawler = make_crawler(tmp_path / 'files', **options)
+    crawler.plan(path)
+    assert crawler.run_number == (1 if options.get('incremental') else 0)
+    manifest = Manifest.load(path)
+    assert len(manifest.downloads()) == 12
+    assert manifest.total_bytes() == 12 * 2048
+    assert len(manifest.folders) == 6
+    assert saved_files(str(tmp_path / 'files')) == []
+    # only the desktop and the listings were fetched
+    assert server.requests['GET'] == 1 + 6
+
+    # a broken download is left to the next apply
+    server.cuts[2] = 1000
+    crawler = make_crawler(tmp_path / 'files', **options)
+    crawler.apply(path)
+    assert crawler.run_number == manifest.run_number
+    assert len(crawler.downloads) == 11
+    assert len(saved_files(str(tmp_path / 'files'))) == 11
+    assert len(manifest.applied()) == 11
+
+    server.settle()
+    requests = server.requests['GET']
+    crawler = make_crawler(tmp_path / 'files', **options)
+    crawler.apply(path)
+    assert crawler.downloads == ['downloading: Course 0/Slides 1 0.pdf']
+    assert server.requests['GET'] - requests == 1 + 1
+    assert len(manifest.applied()) == 12
+
+    # applied once more, nothing is requested but the desktop
+    requests = server.requests['GET']
+    make_crawler(tmp_path / 'files', **options).apply(path)
+    assert server.requests['GET'] - requests == 1
+
+    # the applied files are known to a crawl run
+    crawler = make_crawler(tmp_path / 'files', **options)
+    crawler.run()
+    assert crawler.downloads == []
+    if options.get('incremental'):
+        # the folders of all applied files were remembered as unchanged
+        assert server.requests['GET'] - requests == 1 + 1 + 2
+        # the applies continued the planning run instead of counting runs of their own
+        assert crawler.run_number == 2
+
+
+def test_interrupted_apply(server, make_crawler, tmp_path, monkeypatch):
+    monkeypatch.setattr(crawler, 'APPLY_FLUSH', 2)
+    path = str(tmp_path / 'plan.json')
+    make_crawler(tmp_path / 'files', storage='sqlite').plan(path)
+    database = str(tmp_path / 'files' / '.db' / 'files.sqlite')
+    mark = Manifest.mark
+
+    def persisted_mark(manifest, urls):
+        # the entries are logged once their records survive a crash
+        records = sqlite3.connect(database).execute('SELECT COUNT(*) FROM files').fetchone()[0]
+        assert records == len(manifest.applied()) + len(urls)
+        mark(manifest, urls)
+    monkeypatch.setattr(Manifest, 'mark', persisted_mark)
+
+    applying = make_crawler(tmp_path / 'files', storage='sqlite')
+    save_file = applying.file_handler.save_file
+    saved = []
+
+    def interrupt(relative_path, *args, **kwargs):
+        if len(saved) == 4:
+            raise KeyboardInterrupt
+        saved.append(relative_path)
+        return save_file(relative_path, *args, **kwargs)
+    applying.file_handler.save_file = interrupt
+    with pytest.raises(KeyboardInterrupt):
+        applying.apply(path)
+    assert len(Manifest.load(path).applied()) == 4
+
+    applying = make_crawler(tmp_path / 'files', storage='sqlite')
+    applying.apply(path)
+    assert len(applying.downloads) == 8
+    assert len(Manifest.load(path).applied()) == 12
+
+    # the files of the interrupted apply are known to a crawl run
+    crawling = make_crawler(tmp_path / 'files', storage='sqlite')
+    crawling.run()
+    assert crawling.downloads == []
+    assert not os.path.exists(str(tmp_path / 'files' / '.overwritten'))
@@ -0,0 +1,48 @@
+import json
+import threading
+
+from metrics import Metrics, NoMetrics, timed
+
+
+class Timed:
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    @timed('work')
+    def work(self, size):
+        self.metrics.add_bytes('work', size)
+        return size
+
+
+def test_phases_by_course():
+    metrics = Metrics()
+    worker = Timed(metrics)
+    assert worker.work(10) == 10
+    metrics.course = 'Course "1"'
+    threads = [threading.Thread(target=worker.work, args=(5,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    metrics.observe('work', 60)
+
+    data = json.loads(metrics.to_json(downloads=3))
+    assert data['downloads'] == 3
+    assert data['phases']['work']['count'] == 6
+    assert data['phases']['work']['bytes'] == 30
+    assert data['courses']['']['work']['count'] == 1
+    assert data['courses']['Course "1"']['work']['buckets'] == dict(
+        {bound: 4 for bound in ['0.005', '0.01', '0.025', '0.05', '0.1', '0.25', '0.5', '1', '2.5', '5', '10', '30']},
+        **{'+Inf': 5})
+
+    text = metrics.to_prometheus(downloads=3)
+    assert 'slider_run_downloads 3\n' in text
+    assert 'slider_phase_seconds_bucket{phase="work",course="Course \\"1\\"",le="+Inf"} 5\n' in text
+    assert 'slider_phase_seconds_count{phase="work",course=""} 1\n' in text
+    assert 'slider_phase_bytes{phase="work",course="Course \\"1\\""} 20\n' in text
+
+
+def test_no_metrics():
+    metrics = NoMetrics()
+    Timed(metrics).work(10)
+    assert metrics.phases == {}
@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+from bench_crawl import make_secrets
+from crawler import Crawler
+from fake_ilias import CourseTree, FakeIlias
+from pipeline import Pipeline
+from request import HOST_LIMIT
+
+
+class Stages:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fetching = 0
+        self.peak = 0
+        self.stored = []
+
+    def probe(self, job):
+        if job == 3:
+            raise ValueError(job)
+        return job * 10
+
+    def plan(self, job, probed):
+        return None if job == 5 else probed
+
+    def fetch(self, job):
+        with self.lock:
+            self.fetching += job * 10
+            self.peak = max(self.peak, self.fetching)
+        # the later a job is fed, the earlier it is fetched
+        time.sleep(0.01 * (10 - job))
+        with self.lock:
+            self.fetching -= job * 10
+        return job
+
+    def store(self, job, fetched):
+        assert fetched in (job, None)
+        self.stored.append((job, fetched))
+
+    def fail(self, job, err):
+        self.stored.append((job, 'failed'))
+
+
+@pytest.mark.parametrize('workers', [0, 3])
+def test_pipeline(workers):
+    stages = Stages()
+    with Pipeline(stages.probe, stages.plan, stages.fetch, stages.store, stages.fail, ValueError,
+                  workers, workers, inflight=150) as pipeline:
+        for job in range(1, 8):
+            pipeline.feed(job)
+            if job == 4:
+                pipeline.note(lambda: stages.stored.append('note'))
+        pipeline.drain()
+    # stored in the order they were fed
+    assert stages.stored == [(1, 1), (2, 2), (3, 'failed'), (4, 4), 'note', (5, None), (6, 6), (7, 7)]
+    assert stages.peak <= 150
+    assert pipeline.bytes == 0
+
+
+def output(capsys):
+    lines = capsys.readouterr().out.splitlines()
+    return [line for line in lines if 'downloaded from ILIAS' not in line and ' within ' not in line]
+
+
+def test_pipeline_keeps_output(tmp_path, capsys):
+    with FakeIlias(CourseTree(courses=2, depth=2, fanout=2, files=3, size=2048)) as server:
+        runs = []
+        for number, options in enumerate([{}, {'probers': 3, 'fetchers': 3, 'inflight': 8192}]):
+            path = str(tmp_path / str(number))
+            crawler = Crawler(False, False, False, 5E7, secrets=make_secrets(server, path), **options)
+            capsys.readouterr()
+            crawler.run()
+            runs.append((output(capsys), crawler.downloads, crawler.changelog))
+    assert runs[0] == runs[1]
+    assert len(runs[0][1]) == 42
+
+
+@pytest.mark.parametrize('segment', [2E7, 1024])
+def test_host_limit(tmp_path, segment):
+    with FakeIlias(CourseTree(courses=2, depth=1, fanout=2, files=3, size=2048)) as server:
+        server.delay = 0.02
+        crawler = Crawler(False, False, False, 5E7, workers=3, probers=4, fetchers=4, segment=segment,
+                          secrets=make_secrets(server, str(tmp_path)))
+        crawler.run()
+        assert len(crawler.downloads) == 18
+        # the probes, downloads and their ranges share the slots of the host
+        assert server.peak <= HOST_LIMIT
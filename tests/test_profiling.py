@@ -0,0 +1,29 @@
+import os
+
+from bench_crawl import make_secrets
+from crawler import Crawler
+from fake_ilias import CourseTree, FakeIlias
+from profiling import OTHER, Profiler
+
+
+def test_profile(tmp_path):
+    with FakeIlias(CourseTree(courses=2, depth=1, fanout=2, files=3, size=4096)) as server:
+        crawler = Crawler(False, False, False, 5E7, probers=2, fetchers=2, inflight=8192,
+                          secrets=make_secrets(server, str(tmp_path)))
+        profiler = Profiler(crawler.profile_stages(), interval=0.001)
+        with profiler:
+            crawler.run()
+        crawler.write_profile(profiler)
+    files = os.listdir(str(tmp_path / '.changelog'))
+    assert {name.rsplit('.', 1)[-1] for name in files if name.startswith('profile_')} == {'prof', 'folded', 'txt'}
+
+    stages = set(crawler.profile_stages()) | {OTHER}
+    folded = profiler.collapsed().splitlines()
+    assert folded
+    for line in folded:
+        stack, count = line.rsplit(' ', 1)
+        assert stack.split(';')[0] in stages
+        assert int(count) > 0
+    report = profiler.report()
+    assert 'by stage' in report
+    assert 'Top 20 allocations at the peak' in report
@@ -0,0 +1,83 @@
+import os
+import stat
+
+import pytest
+
+from bench_crawl import make_secrets
+from crawler import Crawler
+from fake_ilias import CourseTree, FakeIlias
+from request import RequestHandler
+
+
+@pytest.fixture
+def server():
+    with FakeIlias(CourseTree(courses=1, depth=1, fanout=1, files=1, size=1024)) as server:
+        yield server
+
+
+def handler(server, path):
+    return RequestHandler('student', server.password, base_url=server.url, login_url=server.login_url,
+                          session_path=str(path))
+
+
+def test_stored_session_is_reused(server, tmp_path):
+    path = tmp_path / 'session.json'
+    req = handler(server, path)
+    assert not req.authenticated
+    assert 'Course 0' in req.desktop()
+    assert not req.reused and server.logins == 1
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+    # a new run probes the desktop with the stored session instead of logging in
+    req = handler(server, path)
+    assert req.authenticated
+    assert 'Course 0' in req.desktop()
+    assert req.reused and server.logins == 1
+    assert server.requests.get('POST', 0) == 1
+
+
+def test_expired_session_logs_in(server, tmp_path):
+    path = tmp_path / 'session.json'
+    handler(server, path).desktop()
+    server.expire()
+
+    req = handler(server, path)
+    assert 'Course 0' in req.desktop()
+    assert not req.reused and server.logins == 2
+    assert 'Course 0' in handler(server, path).desktop()
+    assert server.logins == 2
+
+
+def test_broken_session_file(server, tmp_path):
+    path = tmp_path / 'session.json'
+    path.write_text('{')
+    req = handler(server, path)
+    assert not req.authenticated
+    assert 'Course 0' in req.desktop()
+    assert server.logins == 1
+
+
+def test_crawler_reports_login(server, tmp_path, capsys):
+    secrets = make_secrets(server, str(tmp_path / 'out'))
+    secrets.SESSION_PATH = str(tmp_path / 'session.json')
+    Crawler(False, False, False, 5E7, secrets=secrets).run()
+    assert 'Logged in within' in capsys.readouterr().out
+    crawler = Crawler(False, False, False, 5E7, secrets=secrets)
+    crawler.run()
+    assert 'Stored session reused within' in capsys.readouterr().out
+    assert server.logins == 1
+    assert crawler.metrics.totals()['session'].count == 1
+
+
+def test_session_without_courses_is_reused(tmp_path):
+    with FakeIlias(CourseTree(courses=0)) as server:
+        path = tmp_path / 'session.json'
+        handler(server, path).desktop()
+        req = handler(server, path)
+        req.desktop()
+        assert req.reused and server.logins == 1
+
+        server.expire()
+        req = handler(server, path)
+        req.desktop()
+        assert not req.reused and server.logins == 2
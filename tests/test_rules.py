@@ -0,0 +1,90 @@
+import pytest
+
+from bench_crawl import make_secrets
+from crawler import Crawler
+from fake_ilias import CourseTree, FakeIlias
+from listing import ListingItem
+from rules import Rules
+
+
+def item(file_ending='pdf', size=None):
+    return ListingItem('Slides', 'goto.php?target=file_1_download', file_ending, size, '')
+
+
+def test_rules():
+    rules = Rules(['Statistik', 'Mathe'], {
+        'exclude_courses': ['Tutorium'],
+        'exclude_folders': ['Mathe/Alt*', '*/Videos/'],
+        'allow_endings': ['pdf', '.ZIP'],
+        'deny_endings': ['zip'],
+        'min_size': 10
+    }, maxsize=1000)
+    assert rules.course('[Vorlesung] Mathe I') == 'Mathe'
+    assert rules.course('Physik') is None
+    assert rules.excludes_course('Mathe I Tutorium')
+    assert not rules.excludes_course('Mathe I')
+
+    assert rules.excludes_folder('Mathe/Altklausuren')
+    assert rules.excludes_folder('Statistik/Woche 1/Videos')
+    assert not rules.excludes_folder('Mathe/Skript/Alt')
+
+    assert rules.excludes_file(item()) is None
+    assert rules.excludes_file(item('PDF', 999)) is None
+    assert rules.excludes_file(item('zip')) == 'excluded'
+    assert rules.excludes_file(item('mp4')) == 'excluded'
+    assert rules.excludes_file(item('pdf', 1100)) == 'file_skiped'
+    assert rules.excludes_file(item('pdf', 9)) == 'file_skiped'
+    # listed sizes close to a limit are decided on the size after a request
+    assert rules.near_limit(1000) and rules.near_limit(960) and not rules.near_limit(900)
+    assert rules.excludes_file(item('pdf', 1000)) is None
+    assert rules.excludes_size(1000) == 'file_skiped'
+    assert rules.excludes_size(999) is None
+    # unlisted properties are checked after a request
+    assert rules.excludes_file(item('', None)) is None
+
+
+def test_unknown_rule():
+    with pytest.raises(AssertionError):
+        Rules([], {'exclude_files': ['*.mp4']})
+
+
+def test_excluded_subtrees_are_not_requested(server, tmp_path):
+    secrets = make_secrets(server, str(tmp_path))
+    secrets.RULES = {'exclude_courses': ['Course 1'], 'exclude_folders': ['*/Folder 1']}
+    crawler = Crawler(False, False, False, 5E7, secrets=secrets)
+    crawler.run()
+    assert len(crawler.downloads) == 4
+    assert (crawler.pruned_folders, crawler.pruned_files) == (2, 0)
+    assert server.requests['HEAD'] == 4
+
+    secrets.RULES = {'min_size': 4096}
+    crawler = Crawler(False, False, False, 5E7, secrets=secrets)
+    crawler.run()
+    assert crawler.pruned_files == 12
+    assert server.requests['HEAD'] == 4
+
+
+def test_listed_size_close_to_maxsize(tmp_path):
+    # 2000 bytes are listed as 2,0 KB, i.e. 2048 bytes
+    with FakeIlias(CourseTree(courses=1, depth=0, files=2, size=2000)) as server:
+        crawler = Crawler(False, False, False, 2040, secrets=make_secrets(server, str(tmp_path / 'close')))
+        crawler.run()
+        assert len(crawler.downloads) == 2
+        assert server.requests['HEAD'] == 2
+
+        crawler = Crawler(False, False, False, 1900, secrets=make_secrets(server, str(tmp_path / 'above')))
+        crawler.run()
+        assert crawler.pruned_files == 2
+        assert server.requests['HEAD'] == 2
+
+
+def test_skipped_files_are_reported_alike(tmp_path):
+    with FakeIlias(CourseTree(courses=1, depth=0, files=1, size=2000)) as server:
+        # decided on the probed size and on the listed size
+        changelogs = []
+        for maxsize in (1990, 1900):
+            crawler = Crawler(False, False, False, maxsize, secrets=make_secrets(server, str(tmp_path / str(maxsize))))
+            crawler.run()
+            changelogs.append(crawler.changelog)
+        assert crawler.pruned_files == 1
+    assert changelogs[0] == changelogs[1] == ['file_skiped: Course 0/Slides 1 0.pdf']
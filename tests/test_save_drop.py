@@ -0,0 +1,216 @@
+from datetime import datetime
+import os
+
+import dropbox
+from dropbox.exceptions import ApiError
+import pytest
+
+import save_drop
+from save_drop import DropboxSaver
+
+files = dropbox.files
+
+
+def file_entry(path, rev='0123456789'):
+    return files.FileMetadata(name=os.path.basename(path), id='id:' + path, rev=rev, size=0,
+                              client_modified=datetime(2020, 1, 1), server_modified=datetime(2020, 1, 1),
+                              path_lower=path.lower(), path_display=path)
+
+
+def folder_entry(path):
+    return files.FolderMetadata(name=os.path.basename(path), id='id:' + path, path_lower=path.lower(),
+                                path_display=path)
+
+
+def api_error(error):
+    return ApiError('request', error, 'message', 'en')
+
+
+class FakeDropbox:
+    def __init__(self):
+        self.calls = []
+        self.sessions = {}
+        # entries below the base path, listed in pages of two, or None if it does not exist
+        self.listing = []
+        # entries by cursor of the changes since a run, expired cursors are missing
+        self.changes = {}
+        self.batch_error = False
+        self.rejected = set()
+
+    def users_get_current_account(self):
+        pass
+
+    def files_list_folder(self, path, recursive=False):
+        self.calls.append(('list', path))
+        if self.listing is None:
+            raise api_error(files.ListFolderError.path(files.LookupError.not_found))
+        return self.page(0)
+
+    def page(self, start):
+        more = start + 2 < len(self.listing)
+        return files.ListFolderResult(entries=self.listing[start:start + 2],
+                                      cursor='page{}'.format(start + 2) if more else 'latest', has_more=more)
+
+    def files_list_folder_continue(self, cursor):
+        self.calls.append(('continue', cursor))
+        if cursor.startswith('page'):
+            return self.page(int(cursor[4:]))
+        if cursor not in self.changes:
+            raise api_error(files.ListFolderContinueError.reset)
+        return files.ListFolderResult(entries=self.changes[cursor], cursor=cursor + '+', has_more=False)
+
+    def files_list_folder_get_latest_cursor(self, path, recursive=False):
+        return files.ListFolderGetLatestCursorResult(cursor='latest')
+
+    def files_upload_session_start(self, chunk, close=False):
+        session_id = 'session{}'.format(len(self.sessions))
+        self.sessions[session_id] = {'content': chunk, 'closed': close}
+        return files.UploadSessionStartResult(session_id=session_id)
+
+    def files_upload_session_append_v2(self, chunk, cursor, close=False):
+        session = self.sessions[cursor.session_id]
+        assert not session['closed'] and cursor.offset == len(session['content'])
+        session['content'] += chunk
+        session['closed'] = close
+
+    def files_upload_session_finish_batch(self, entries):
+        self.calls.append(('finish_batch', [self.sessions[entry.cursor.session_id]['closed'] for entry in entries]))
+        if self.batch_error:
+            raise api_error(files.UploadSessionFinishBatchLaunch.other)
+        self.finished = entries
+        return files.UploadSessionFinishBatchLaunch.async_job_id('batch')
+
+    def files_upload_session_finish_batch_check(self, job_id):
+        if self.calls[-1][0] != 'batch_check':
+            self.calls.append(('batch_check', job_id))
+            return files.UploadSessionFinishBatchJobStatus.in_progress
+        entries = []
+        for entry in self.finished:
+            path = entry.commit.path
+            session = self.sessions[entry.cursor.session_id]
+            if path in self.rejected or entry.cursor.offset != len(session['content']):
+                entries.append(files.UploadSessionFinishBatchResultEntry.failure(files.UploadSessionFinishError.other))
+            else:
+                entries.append(files.UploadSessionFinishBatchResultEntry.success(file_entry(path)))
+        return files.UploadSessionFinishBatchJobStatus.complete(files.UploadSessionFinishBatchResult(entries=entries))
+
+    def files_create_folder_batch(self, paths, autorename=False):
+        self.calls.append(('create_folders', paths))
+        return files.CreateFolderBatchLaunch.async_job_id('folders')
+
+    def files_create_folder_batch_check(self, job_id):
+        return files.CreateFolderBatchJobStatus.other
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    fake = FakeDropbox()
+    monkeypatch.setattr(dropbox, 'Dropbox', lambda token, timeout: fake)
+    monkeypatch.setattr(save_drop, 'CHUNK', 4)
+    monkeypatch.setattr(save_drop, 'POLL_INTERVAL', 0)
+    return fake
+
+
+def stage(saver, relative_path, content):
+    with saver.staging_file(relative_path) as f:
+        f.write(content)
+        assert saver.save_file(relative_path, f)
+    return f.name
+
+
+def test_upload_sessions(fake):
+    saver = DropboxSaver('/Uni', 'token')
+    contents = {'a.pdf': b'0123456789', 'b.pdf': b'012', 'c.pdf': b'01234567'}
+    staged = [stage(saver, path, content) for path, content in contents.items()]
+    assert saver.flush() == []
+
+    # every session is closed before the batch is committed
+    assert ('finish_batch', [True, True, True]) in fake.calls
+    assert [fake.sessions[entry.cursor.session_id]['content'] for entry in fake.finished] == list(contents.values())
+    assert [entry.commit.path for entry in fake.finished] == ['/Uni/a.pdf', '/Uni/b.pdf', '/Uni/c.pdf']
+    assert saver.revision('a.pdf') == '0123456789'
+    assert not any(os.path.exists(name) for name in staged)
+
+
+def test_failed_commits(fake):
+    saver = DropboxSaver('/Uni', 'token')
+    fake.rejected = {'/Uni/b.pdf'}
+    stage(saver, 'a.pdf', b'0123456789')
+    stage(saver, 'b.pdf', b'012')
+    # failed files are returned, such that their records are rolled back
+    assert saver.flush() == ['b.pdf']
+    assert saver.exists('a.pdf') and not saver.exists('b.pdf')
+
+    fake.batch_error = True
+    staged = [stage(saver, 'c.pdf', b'0123'), stage(saver, 'd.pdf', b'')]
+    assert saver.flush() == ['c.pdf', 'd.pdf']
+    assert not saver.exists('c.pdf') and not saver.exists('d.pdf')
+    assert not any(os.path.exists(name) for name in staged)
+
+
+def test_create_folder_batch(fake):
+    saver = DropboxSaver('/Uni', 'token')
+    for folder in ['Course 0', 'Course 0/Folder', 'Course 1']:
+        saver.create_folder(folder)
+    assert saver.exists('Course 1/')
+    stage(saver, 'Course 0/Folder/a.pdf', b'0123')
+    assert saver.flush() == []
+    # folders created by uploads are not created on their own
+    assert [call for call in fake.calls if call[0] == 'create_folders'] == [('create_folders', ['/Uni/Course 1'])]
+
+
+def test_index_delta(fake, tmp_path):
+    index_path = str(tmp_path / 'index.json')
+    fake.listing = [folder_entry('/Uni/Course 0'), file_entry('/Uni/Course 0/a.pdf', 'a00000000'),
+                    folder_entry('/Uni/Course 0/Old'), file_entry('/Uni/Course 0/Old/b.pdf'), file_entry('/Uni/c.pdf')]
+    saver = DropboxSaver('/Uni', 'token', index_path)
+    assert saver.revision('Course 0/a.pdf') == 'a00000000'
+    assert saver.exists('Course 0/Old/b.pdf') and saver.exists('c.pdf')
+    saver.flush()
+
+    # the next run only lists the changes since the cached cursor
+    fake.calls = []
+    fake.changes['latest'] = [files.DeletedMetadata(name='Old', path_lower='/uni/course 0/old'),
+                              file_entry('/Uni/Course 0/a.pdf', 'a11111111'), file_entry('/Uni/Course 1/d.pdf')]
+    saver = DropboxSaver('/Uni', 'token', index_path)
+    assert fake.calls == [('continue', 'latest')]
+    assert saver.revision('Course 0/a.pdf') == 'a11111111'
+    assert not saver.exists('Course 0/Old') and not saver.exists('Course 0/Old/b.pdf')
+    assert saver.exists('Course 1') and saver.exists('Course 1/d.pdf') and saver.exists('c.pdf')
+
+
+def test_index_deletions(fake):
+    fake.listing = [folder_entry('/Uni/A'), file_entry('/Uni/A/x.pdf'), folder_entry('/Uni/B'),
+                    file_entry('/Uni/B/y.pdf'), file_entry('/Uni/B/z.pdf'), file_entry('/Uni/Ab.pdf')]
+    saver = DropboxSaver('/Uni', 'token')
+    # deletions are applied in order with the entries in between
+    saver.update_index([files.DeletedMetadata(name='A', path_lower='/uni/a'),
+                        files.DeletedMetadata(name='y.pdf', path_lower='/uni/b/y.pdf'),
+                        file_entry('/Uni/A', 'a00000000'),
+                        files.DeletedMetadata(name='z.pdf', path_lower='/uni/b/z.pdf')])
+    assert saver.revision('A') == 'a00000000'
+    assert not saver.exists('A/x.pdf')
+    assert not saver.exists('B/y.pdf') and not saver.exists('B/z.pdf')
+    assert saver.exists('B') and saver.exists('Ab.pdf')
+
+
+def test_index_reset(fake, tmp_path):
+    index_path = str(tmp_path / 'index.json')
+    fake.listing = [file_entry('/Uni/a.pdf'), file_entry('/Uni/b.pdf')]
+    DropboxSaver('/Uni', 'token', index_path).flush()
+
+    # the cached cursor expired, all paths are listed again
+    fake.calls = []
+    fake.listing = [file_entry('/Uni/a.pdf')]
+    saver = DropboxSaver('/Uni', 'token', index_path)
+    assert fake.calls == [('continue', 'latest'), ('list', '/Uni')]
+    assert saver.exists('a.pdf') and not saver.exists('b.pdf')
+
+
+def test_missing_base_path(fake, tmp_path):
+    index_path = str(tmp_path / 'index.json')
+    fake.listing = None
+    saver = DropboxSaver('/Uni', 'token', index_path)
+    assert saver.index == {}
+    saver.flush()
+    assert saver.cursor == 'latest'
@@ -0,0 +1,72 @@
+import hashlib
+import os
+
+from save_file import FileSaver
+
+
+def test_path_cache(tmp_path):
+    os.makedirs(str(tmp_path / 'Course' / 'Folder'))
+    (tmp_path / 'Course' / 'Folder' / 'a.pdf').write_bytes(b'a')
+    saver = FileSaver(str(tmp_path))
+
+    assert saver.exists('Course/Folder/a.pdf')
+    assert saver.exists('Course/Folder/')
+    assert not saver.exists('Course/Folder/b.pdf')
+    assert not saver.exists('Other/b.pdf')
+    assert (saver.hits, saver.misses) == (4, 0)
+
+    saver.create_folder('Other/Sub/')
+    assert os.path.isdir(str(tmp_path / 'Other' / 'Sub'))
+    assert saver.save_file('Other/Sub/b.pdf', b'b')
+    assert saver.exists('Other/Sub/b.pdf')
+
+    # an existing file is moved to the overwritten folder
+    assert saver.save_file('Course/Folder/a.pdf', b'new')
+    assert saver.exists('.overwritten/Course/Folder/a.pdf')
+    assert (tmp_path / '.overwritten' / 'Course' / 'Folder' / 'a.pdf').read_bytes() == b'a'
+    assert (tmp_path / 'Course' / 'Folder' / 'a.pdf').read_bytes() == b'new'
+    assert saver.misses == 0
+
+
+def test_path_cache_does_not_follow_links(tmp_path):
+    os.makedirs(str(tmp_path / 'target'))
+    os.makedirs(str(tmp_path / 'Course'))
+    (tmp_path / 'target' / 'a.pdf').write_bytes(b'a')
+    os.symlink(str(tmp_path / 'target'), str(tmp_path / 'Course' / 'Link'))
+    saver = FileSaver(str(tmp_path))
+
+    assert saver.exists('Course/Link')
+    assert saver.exists('Course/Link/a.pdf')
+    assert not saver.exists('Course/Link/b.pdf')
+    assert (saver.hits, saver.misses) == (1, 2)
+
+
+def test_object_store(tmp_path):
+    saver = FileSaver(str(tmp_path), objects=True)
+    digest = hashlib.sha1(b'slides').hexdigest()
+    blob = tmp_path / '.objects' / digest[:2] / digest[2:]
+
+    saver.create_folder('A/')
+    saver.create_folder('B/')
+    assert saver.save_file('A/s.pdf', b'slides', content_hash=digest)
+    with saver.staging_file('B/s.pdf') as staged:
+        staged.write(b'slides')
+        assert saver.save_file('B/s.pdf', staged, content_hash=digest)
+    assert saver.deduplicated == 1
+    assert (tmp_path / 'B' / 's.pdf').read_bytes() == b'slides'
+    assert os.path.samefile(str(blob), str(tmp_path / 'A' / 's.pdf'))
+    assert os.path.samefile(str(blob), str(tmp_path / 'B' / 's.pdf'))
+    assert not [name for name in os.listdir(str(tmp_path / 'B')) if name.startswith('.')]
+
+    # the same content is not moved away, another one is
+    assert saver.save_file('A/s.pdf', b'slides', content_hash=digest)
+    assert not saver.exists('.overwritten/A/s.pdf')
+    assert saver.save_file('A/s.pdf', b'other', content_hash=hashlib.sha1(b'other').hexdigest())
+    assert os.path.samefile(str(blob), str(tmp_path / '.overwritten' / 'A' / 's.pdf'))
+
+    assert saver.collect_garbage() == (0, 0)
+    os.remove(str(tmp_path / 'B' / 's.pdf'))
+    os.remove(str(tmp_path / '.overwritten' / 'A' / 's.pdf'))
+    assert saver.collect_garbage() == (1, 6)
+    assert not os.path.exists(str(blob.parent))
+    assert (tmp_path / 'A' / 's.pdf').read_bytes() == b'other'
@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+import types
+
+import pytest
+
+from bench_crawl import make_secrets
+from crawler import Crawler
+from fake_ilias import CourseTree, FakeIlias
+from save_file import FileSaver
+import savers
+
+SLIDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'slider')
+
+
+class CopySaver(FileSaver):
+    pass
+
+
+def test_registry(monkeypatch):
+    assert savers.load('local') is FileSaver
+    monkeypatch.setattr(savers, 'entry_points', lambda: {'copy': types.SimpleNamespace(load=lambda: CopySaver)})
+    assert savers.exists('copy')
+    assert savers.load('copy') is CopySaver
+    assert not savers.exists('webdav')
+    with pytest.raises(KeyError):
+        savers.load('webdav')
+
+
+def test_plugin_saver(monkeypatch, tmp_path):
+    monkeypatch.setitem(savers.SAVERS, 'copy', __name__ + ':CopySaver')
+    with FakeIlias(CourseTree(courses=1, depth=0, files=2, size=2048)) as server:
+        crawler = Crawler(False, False, False, 5E7, saver='copy', secrets=make_secrets(server, str(tmp_path)))
+        crawler.run()
+    assert isinstance(crawler.file_handler, CopySaver)
+    assert len(crawler.downloads) == 2
+
+
+@pytest.mark.parametrize('storage, unused', [('sqlite', 'tinydb.table'), ('tinydb', '_sqlite3')])
+def test_lazy_imports(tmp_path, storage, unused):
+    # the savers and storages which are not selected are not imported
+    code = '''
+import sys, types
+import crawler
+assert 'requests' not in sys.modules
+secrets = types.SimpleNamespace(USER='student', PASSWORD='secret', COURSES=[], PATH=sys.argv[1], SESSION_PATH=None)
+crawler.Crawler(False, False, False, 5E7, storage=sys.argv[2], secrets=secrets)
+print(' '.join(name for name in ('dropbox', sys.argv[3]) if name in sys.modules))
+'''
+    output = subprocess.run([sys.executable, '-c', code, str(tmp_path), storage, unused], cwd=SLIDER, check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True).stdout
+    assert output.split() == []
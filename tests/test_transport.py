@@ -0,0 +1,63 @@
+import tempfile
+import time
+
+import pytest
+from requests.exceptions import HTTPError, RequestException
+
+from download import Downloader
+from fake_ilias import CourseTree, FakeIlias
+from request import RequestHandler
+from transport import TokenBucket
+
+
+@pytest.fixture
+def server():
+    with FakeIlias(CourseTree(courses=1, depth=0, files=1, size=2048)) as server:
+        yield server
+
+
+def file_url(server):
+    return server.url + 'goto.php?target=file_2_download'
+
+
+def test_token_bucket():
+    bucket = TokenBucket(50)
+    start = time.monotonic()
+    for _ in range(60):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.15
+
+
+def test_retries(server, tmp_path):
+    server.failures[2] = 1
+    req = RequestHandler('student', server.password, base_url=server.url, login_url=server.login_url)
+    assert req.head(file_url(server)).status_code == 200
+    with tempfile.TemporaryFile() as target:
+        server.failures[2] = 1
+        content_hash, headers = Downloader(req, str(tmp_path) + '/', 2E7).download(file_url(server), target)
+        assert target.read() == server.tree.items[2].content()
+    assert server.requests['HEAD'] == 2 and server.requests['GET'] == 2
+
+    # a failure after the retries is raised instead of taken for the file
+    server.failures[2] = 5
+    req = RequestHandler('student', server.password, retries=1)
+    with pytest.raises(HTTPError):
+        req.head(file_url(server))
+    with tempfile.TemporaryFile() as target:
+        with pytest.raises(HTTPError):
+            Downloader(req, str(tmp_path) + '/', 2E7).download(file_url(server), target)
+        assert target.read() == b''
+
+
+def test_timeout(server):
+    server.delay = 0.5
+    req = RequestHandler('student', server.password, timeout=(1, 0.1), retries=0)
+    with pytest.raises(RequestException):
+        req.head(file_url(server))
+
+
+def test_login_through_session(server):
+    req = RequestHandler('student', server.password, base_url=server.url, login_url=server.login_url, rate=100)
+    assert 'Course 0' in req.desktop()
+    assert req.session.cookies.get('JSESSIONID') == 'fakecas'
+    assert req.requests == 2
@@ -0,0 +1,42 @@
+from watch import Watcher
+
+
+def poll_all(watcher):
+    watcher.next_poll = {}
+    return watcher.poll()
+
+
+def test_adaptive_intervals_and_session_reuse(server, make_crawler, tmp_path):
+    watcher = Watcher(make_crawler(tmp_path, storage='sqlite'), 60)
+    assert poll_all(watcher) == ['Course 0', 'Course 1']
+    assert len(watcher.crawler.downloads) == 12
+    assert watcher.intervals == {'Course 0': 60, 'Course 1': 60}
+
+    poll_all(watcher)
+    assert watcher.crawler.downloads == []
+    assert watcher.intervals == {'Course 0': 120, 'Course 1': 120}
+    assert server.logins == 1
+
+    server.tree.touch(1)
+    server.expire()
+    poll_all(watcher)
+    assert len(watcher.crawler.downloads) == 1
+    assert watcher.intervals == {'Course 0': 60, 'Course 1': 240}
+    assert server.logins == 2
+
+    # the database is kept open and in sync between the cycles
+    assert watcher.crawler.database.get_name('Course 0/Slides 1 0.pdf')
+    assert make_crawler(tmp_path, storage='sqlite').database.get_name('Course 0/Slides 1 0.pdf')
+
+
+def test_budget(server, make_crawler, tmp_path):
+    watcher = Watcher(make_crawler(tmp_path, storage='sqlite'), 60)
+    poll_all(watcher)
+    costs = watcher.costs
+    assert costs['Course 0'] > 0 and costs['Course 1'] > 0
+
+    used = watcher.crawler.req.requests_within(3600)
+    watcher.budget = used + 1 + costs['Course 0'] + costs['Course 1'] - 1
+    assert poll_all(watcher) == ['Course 0']
+    assert watcher.postponed == ['Course 1']
+    assert watcher.wait() >= 60